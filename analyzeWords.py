@@ -1,13 +1,26 @@
-import re
+import math
+import os
+import pickle
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
+import re
 import string
 
+from wordIndex import count_prefix, encode_word, find_substring, get_length_counts, get_words, get_words_by_length
+
+# Number of words turned into a byte buffer at a time, so the buffer stays small for big Series
+BLOCK_SIZE = 1 << 18
+
 def analyzeWords(words):
     """
     Function that profiles a Pandas Series of words and analyzes the characteristics of the list
     Args:
-        words (Pandas Series): Series of words to be analyzed
+        words (Pandas Series or dict): Series of words to be analyzed, or a word index made from one with
+            wordIndex.build_word_index (then only the index is queried, and the words are not scanned again)
 
     Returns: Dictionary containing:
                 - letter_counts
@@ -18,15 +31,356 @@ def analyzeWords(words):
                 - words_6plus
                 - words_6plus_count
     """
+    if isinstance(words, dict):
+        return analyze_word_index(words)
+    if not isinstance(words, pd.Series):
+        return math.nan
+
+    alphabet = list(string.ascii_lowercase)
+
+    word_stats = dict.fromkeys(["letter_counts", "max_char", "size_counts", "oo_count", "oo_words", "words_6plus",
+                                "words_6plus_count"])
+
+    lengths, has_oo, is_6plus, letter_counts, size_counts = get_word_profile(words)
+
+    word_stats["letter_counts"] = {letter: int(count) for letter, count in zip(alphabet, letter_counts)}
+    word_stats["max_char"] = len(size_counts) - 1 if len(size_counts) > 0 else 0
+    word_stats["size_counts"] = {int(size): int(size_counts[size]) for size in np.flatnonzero(size_counts)}
+
+    word_stats["oo_words"] = words[has_oo]
+    word_stats["oo_count"] = len(word_stats["oo_words"])
+
+    word_stats["words_6plus"] = words[is_6plus]
+    word_stats["words_6plus_count"] = len(word_stats["words_6plus"])
+
+    return word_stats
+
+def get_word_profile(words):
+    """
+    Helper method that profiles a Series of words in one pass: each block of words becomes one UTF-8 byte buffer
+    plus offsets, and the first letters, lengths and "oo" matches are all read off that buffer with NumPy, so the
+    work grows with the number of characters and not with the longest word. Missing words are not counted.
+    Args:
+        words (Pandas Series): Series of words
+
+    Returns: tuple of (lengths, "oo" mask, 6+ letters mask, counts by first letter a-z, counts by length)
+    """
+    missing = words.isna().to_numpy() if words.hasnans else None
+    values = words.to_numpy(dtype=object)
+    lengths = np.zeros(len(values), dtype=np.int64)
+    has_oo = np.zeros(len(values), dtype=bool)
+    letter_counts = np.zeros(len(string.ascii_lowercase), dtype=np.int64)
+
+    for start in range(0, len(values), BLOCK_SIZE):
+        block = values[start:start + BLOCK_SIZE]
+        if missing is not None:
+            block = np.where(missing[start:start + BLOCK_SIZE], "", block)
+        data, offsets = get_word_bytes(block)
+        starts = offsets[:-1]
+        byte_lengths = np.diff(offsets)
+
+        #Characters are the bytes that do not continue a multi-byte UTF-8 character
+        follow = np.flatnonzero((data & 0xC0) == 0x80)
+        follow_counts = np.bincount(np.searchsorted(offsets, follow, side="right") - 1, minlength=len(block))
+        lengths[start:start + len(block)] = byte_lengths - follow_counts
+
+        #"o" is a single byte, so an "oo" is two "o" bytes next to each other in the same word
+        pairs = np.flatnonzero((data[:-1] == ord("o")) & (data[1:] == ord("o")))
+        word = np.searchsorted(offsets, pairs, side="right") - 1
+        has_oo[start + word[pairs + 1 < offsets[word + 1]]] = True
+
+        first = data[starts[byte_lengths > 0]]
+        first = first[(first >= ord("a")) & (first <= ord("z"))]
+        letter_counts += np.bincount(first - ord("a"), minlength=len(letter_counts))
+
+    is_6plus = lengths >= 6
+    if missing is not None:
+        is_6plus &= ~missing
+        size_counts = np.bincount(lengths[~missing])
+    else:
+        size_counts = np.bincount(lengths)
+
+    return (lengths, has_oo, is_6plus, letter_counts, size_counts)
+
+def analyzeWordsStream(source, column = "x", chunksize = 100000, max_words = None, spill_dir = None):
+    """
+    Function that profiles words that do not fit in memory, one chunk at a time. Only running totals are kept,
+    so memory is bounded by the chunk size plus the oo_words and words_6plus collections, which can be capped
+    (max_words) or kept on disk until the end (spill_dir).
+    Args:
+        source (str or iterable): name of a .csv file containing the words, or an iterable of Pandas Series
+            (chunks of words, in order)
+        column (str): column of the .csv file holding the words. Default is "x"
+        chunksize (int): number of words read from the file at a time. Default is 100000
+        max_words (int): keep at most this many oo_words and words_6plus (the first ones); the counts are
+            still exact. Default is None (keep them all)
+        spill_dir (str): folder in which the oo_words and words_6plus of every chunk are written until the result
+            is made. Default is None (keep them in memory)
+
+    Returns: Dictionary in the same format as analyzeWords
+    """
+    if isinstance(source, str):
+        if not re.search(r".+\.csv$", source):
+            return math.nan
+        chunks = (chunk[column] for chunk in pd.read_csv(source, usecols=[column], chunksize=chunksize))
+    elif isinstance(source, (pd.Series, pd.DataFrame)) or not hasattr(source, "__iter__"):
+        return math.nan
+    else:
+        chunks = source
+
+    if spill_dir is not None:
+        spill_dir = tempfile.mkdtemp(prefix="analyzeWords.", dir=spill_dir)
+
+    try:
+        state = init_word_state(max_words, spill_dir)
+        for chunk in chunks:
+            update_word_state(state, chunk)
+        return get_word_stats(state)
+    finally:
+        if spill_dir is not None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+def analyzeWordsParallel(words, workers = None, shards = None):
+    """
+    Function that profiles a large Pandas Series of words on several cores. The Series is split into shards
+    of consecutive words, every shard is profiled into a running state by a worker process, and the states are
+    merged in order, so the result is the same as analyzeWords (oo_words and words_6plus keep their index).
+    Args:
+        words (Pandas Series): Series of words to be analyzed
+        workers (int): number of worker processes; 1 profiles the shards in this process. Default is None
+            (one per core)
+        shards (int): number of shards. Default is None (one per worker)
+
+    Returns: Dictionary in the same format as analyzeWords
+    """
+    if not isinstance(words, pd.Series):
+        return math.nan
+
+    if shards is None:
+        shards = workers or os.cpu_count() or 1
+    bounds = np.linspace(0, len(words), max(min(shards, len(words)), 1) + 1).astype(np.int64)
+    pieces = [words.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    if workers == 1:
+        states = list(map(build_word_state, pieces))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            states = list(pool.map(build_word_state, pieces))
+
+    state = states[0]
+    for other in states[1:]:
+        merge_word_state(state, other)
+
+    return get_word_stats(state)
+
+def init_word_state(max_words = None, spill_dir = None):
+    """
+    Creates an empty running state used to profile words one chunk at a time. The state holds the letter
+    counts, the size histogram and the oo_words and words_6plus collections (Series, or names of the files they
+    were spilled to).
+    Args:
+        max_words (int): keep at most this many words in each collection. Default is None (no limit)
+        spill_dir (str): folder to spill the collections to. Default is None (keep them in memory)
+
+    Returns: dictionary containing the running state
+    """
+    return {"letter_counts": np.zeros(len(string.ascii_lowercase), dtype=np.int64),
+            "size_counts": np.zeros(0, dtype=np.int64), "oo_count": 0, "words_6plus_count": 0,
+            "oo_words": [], "words_6plus": [], "kept": {"oo_words": 0, "words_6plus": 0},
+            "max_words": max_words, "spill_dir": spill_dir, "name": None, "dtype": None}
+
+def update_word_state(state, words):
+    """
+    Adds a chunk of words to a running state. The chunk keeps its own index labels, so the words of a file
+    read in chunks keep their row numbers.
+    Args:
+        state (dict): running state created by init_word_state
+        words (Pandas Series): chunk of words to add
+
+    Returns: the updated state
+    """
+    if not isinstance(state, dict) or not isinstance(words, pd.Series):
+        return math.nan
+
+    #A chunk of missing words only is read as float; the dtype of the chunks with words is kept
+    if state["dtype"] is None or not words.isna().all():
+        state["name"] = words.name
+        state["dtype"] = words.dtype
+    if len(words) == 0:
+        return state
+
+    lengths, has_oo, is_6plus, letter_counts, size_counts = get_word_profile(words)
+    add_word_counts(state, letter_counts, size_counts)
+    state["oo_count"] += int(has_oo.sum())
+    state["words_6plus_count"] += int(is_6plus.sum())
+    add_words(state, "oo_words", words[has_oo])
+    add_words(state, "words_6plus", words[is_6plus])
+
+    return state
+
+def merge_word_state(state, other):
+    """
+    Merges the running state of later words (for example another shard of the same words) into a state. The
+    merge is associative, and merging states in order gives the same results as reading the words one chunk
+    after the other.
+    Args:
+        state (dict): running state to merge into
+        other (dict): running state of the words that come after the words of state
+
+    Returns: the updated state
+    """
+    if not isinstance(state, dict) or not isinstance(other, dict):
+        return math.nan
+
+    if state["dtype"] is None or other["size_counts"].any():
+        state["name"] = other["name"]
+        state["dtype"] = other["dtype"]
+
+    add_word_counts(state, other["letter_counts"], other["size_counts"])
+    state["oo_count"] += other["oo_count"]
+    state["words_6plus_count"] += other["words_6plus_count"]
+    for key in ["oo_words", "words_6plus"]:
+        for piece in other[key]:
+            add_words(state, key, read_words(piece))
+
+    return state
+
+def build_word_state(words):
+    """
+    Profiles a Series of words (for example one shard of a bigger Series) into a new running state.
+    Args:
+        words (Pandas Series): Series of words
+
+    Returns: the running state
+    """
+    return update_word_state(init_word_state(), words)
+
+def save_word_state(state, filename):
+    """
+    Saves a running state to a file so that it can be merged with the states of other runs later.
+    Args:
+        state (dict): running state created by init_word_state
+        filename (str): name of the file to write
+
+    Returns: None
+    """
+    with open(filename, "wb") as f:
+        pickle.dump(state, f)
+
+def load_word_state(filename):
+    """
+    Loads a running state saved by save_word_state.
+    Args:
+        filename (str): name of the file to read
+
+    Returns: the running state
+    """
+    with open(filename, "rb") as f:
+        return pickle.load(f)
+
+def add_word_counts(state, letter_counts, size_counts):
+    """
+    Helper method that adds letter counts and a size histogram to a running state
+    """
+    state["letter_counts"] = state["letter_counts"] + letter_counts
+    if len(size_counts) > len(state["size_counts"]):
+        state["size_counts"], size_counts = size_counts.copy(), state["size_counts"]
+    state["size_counts"][:len(size_counts)] += size_counts
+
+def add_words(state, key, words):
+    """
+    Helper method that adds words to one of the collections of a running state, keeping at most max_words of
+    them and spilling them to a file when the state has a spill folder
+    """
+    if state["max_words"] is not None:
+        words = words.iloc[:max(state["max_words"] - state["kept"][key], 0)]
+    if len(words) == 0:
+        return
+
+    state["kept"][key] += len(words)
+    if state["spill_dir"] is not None:
+        fd, filename = tempfile.mkstemp(prefix=f"{key}.", suffix=".pkl", dir=state["spill_dir"])
+        os.close(fd)
+        words.to_pickle(filename)
+        words = filename
+    state[key].append(words)
+
+def read_words(piece):
+    """
+    Helper method that gives back the words of one piece of a collection, reading them if they were spilled
+    """
+    return pd.read_pickle(piece) if isinstance(piece, str) else piece
+
+def get_word_stats(state):
+    """
+    Builds the analyzeWords result dictionary from a running state.
+    Args:
+        state (dict): running state created by init_word_state and filled by update_word_state
+
+    Returns: Dictionary in the same format as analyzeWords
+    """
+    if not isinstance(state, dict):
+        return math.nan
+
+    alphabet = list(string.ascii_lowercase)
+
+    word_stats = dict.fromkeys(["letter_counts", "max_char", "size_counts", "oo_count", "oo_words", "words_6plus",
+                                "words_6plus_count"])
+
+    size_counts = state["size_counts"]
+    word_stats["letter_counts"] = {letter: int(count) for letter, count in zip(alphabet, state["letter_counts"])}
+    word_stats["max_char"] = int(np.flatnonzero(size_counts).max()) if size_counts.any() else 0
+    word_stats["size_counts"] = {int(size): int(size_counts[size]) for size in np.flatnonzero(size_counts)}
+
+    #An empty result keeps the dtype of the words that were read
+    dtype = state["dtype"] if state["dtype"] is not None else "str"
+    for key in ["oo_words", "words_6plus"]:
+        if len(state[key]) > 0:
+            word_stats[key] = pd.concat([read_words(piece) for piece in state[key]])
+        else:
+            word_stats[key] = pd.Series([], dtype=dtype, name=state["name"])
+    word_stats["oo_count"] = state["oo_count"]
+    word_stats["words_6plus_count"] = state["words_6plus_count"]
+
+    return word_stats
+
+def analyze_word_index(index):
+    """
+    Helper method that makes the analyzeWords profile out of a word index: the letter counts are prefix
+    searches, the sizes come from the length counts, and the "oo" words from the byte pair posting list.
+    Args:
+        index (dict): word index from wordIndex.build_word_index
+
+    Returns: Dictionary in the same format as analyzeWords
+    """
     alphabet = list(string.ascii_lowercase)
 
     word_stats = dict.fromkeys(["letter_counts", "max_char", "size_counts", "oo_count", "oo_words", "words_6plus",
                                 "words_6plus_count"])
 
-    word_stats["letter_counts"] = dict.fromkeys(alphabet)
+    word_stats["letter_counts"] = {letter: count_prefix(index, letter) for letter in alphabet}
+    word_stats["size_counts"] = get_length_counts(index)
+    word_stats["max_char"] = max(word_stats["size_counts"].keys(), default=0)
 
-    for letter in alphabet:
-        count = sum([bool(re.search(f'^{letter}', w)) for w in words])
-        word_stats["letter_counts"][letter] = count
+    word_stats["oo_words"] = get_words(index, find_substring(index, "oo"))
+    word_stats["oo_count"] = len(word_stats["oo_words"])
+
+    word_stats["words_6plus"] = get_words_by_length(index, 6)
+    word_stats["words_6plus_count"] = len(word_stats["words_6plus"])
+
+    return word_stats
+
+def get_word_bytes(words):
+    """
+    Helper method that turns an array of words into one UTF-8 byte buffer, with the bytes of word i at
+    offsets[i]:offsets[i + 1].
+    Args:
+        words (NumPy array): array of words
+
+    Returns: tuple of (NumPy uint8 array of bytes, NumPy int64 array of len(words) + 1 offsets)
+    """
+    encoded = [encode_word(w) for w in words]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
 
-    return word_stats
\ No newline at end of file
+    return (np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
@@ -1,7 +1,14 @@
+import os
+import shutil
+import tempfile
 import unittest
 from unittest import TestCase
+import numpy as np
 import pandas as pd
-from bbanalyze import bbanalyze
+from bbanalyze import (bbanalyze, bbanalyze_files, build_leaderboard, get_records, get_top_players, build_bb_state, add_season,
+                       get_bb_stats, save_bb_state, load_bb_state, get_rate_frame, calc_obp, calc_pab,
+                       read_bb_csv, get_cube_summary, get_cube_rates, get_highest_record,
+                       calc_percentage_ab_stats)
 
 class Test_bbanalyze(TestCase):
     def setUp(self):
@@ -76,4 +83,224 @@ class Test_bbanalyze(TestCase):
         self.assertAlmostEqual(df.loc[df["id"] == "loftoke01"].iloc[1]["obp"], 137/358)
         self.assertAlmostEqual(df.loc[df["id"] == "loftoke01"].iloc[1]["pab"], 142/363)
 
+    #streaming mode should give the same results as reading the whole file
+    def test_chunked_matches_full(self):
+        result = bbanalyze(self.test_file, chunksize=7, keep_rows=True)
+        for key in ["record.count", "complete.cases", "years", "player.count", "team.count",
+                    "league.count", "records"]:
+            self.assertEqual(self.result[key], result[key])
+        self.assertTrue(self.result["bb"].equals(result["bb"]))
+        for lg in ["nl", "al"]:
+            self.assertTrue(self.result[lg]["dat"].equals(result[lg]["dat"]))
+            self.assertEqual(self.result[lg]["players"], result[lg]["players"])
+            self.assertEqual(self.result[lg]["teams"], result[lg]["teams"])
 
+    #without keep_rows (the default) only the counts and records are returned
+    def test_chunked_without_rows(self):
+        result = bbanalyze(self.test_file, chunksize=10)
+        self.assertIsNone(result["bb"])
+        self.assertIsNone(result["nl"]["dat"])
+        self.assertEqual(result["nl"]["players"], 33)
+        self.assertEqual(result["al"]["teams"], 10)
+        self.assertEqual(self.result["records"], result["records"])
+
+    #the second call should read the columnar cache and give the same results
+    def test_cache_matches_csv(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "bb.csv")
+            shutil.copy(self.test_file, path)
+            first = bbanalyze(path)
+            self.assertTrue(os.path.isdir(path + ".cache"))
+            second = bbanalyze(path)
+            self.assertTrue(first["bb"].equals(second["bb"]))
+            self.assertEqual(first["records"], second["records"])
+            self.assertEqual(first["player.count"], second["player.count"])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    #changing the csv should invalidate the cache
+    def test_cache_invalidated(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "bb.csv")
+            shutil.copy(self.test_file, path)
+            bbanalyze(path)
+            pd.read_csv(path).head(100).to_csv(path, index=False)
+            self.assertEqual(bbanalyze(path)["record.count"], 100)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    #nl and al should be the entries of the summary of all leagues
+    def test_league_summary(self):
+        leagues = self.result["leagues"]
+        self.assertEqual(sorted(leagues.keys()), ["AL", "NL"])
+        self.assertIs(leagues["NL"], self.result["nl"])
+        self.assertIs(leagues["AL"], self.result["al"])
+        self.assertEqual(len(leagues["NL"]["dat"]) + len(leagues["AL"]["dat"]), self.result["complete.cases"])
+
+    #the first entry of every leaderboard is the record holder
+    def test_leaderboard(self):
+        board = self.result["leaderboard"]
+        for key, record in self.result["records"].items():
+            self.assertEqual(board[key].index[0], record["id"])
+            self.assertEqual(board[key].iloc[0], record["value"])
+            self.assertTrue(board[key].is_monotonic_decreasing)
+        top = get_top_players(board, "h", 3)
+        self.assertEqual(len(top), 3)
+        self.assertEqual(top.index[0], self.result["records"]["h"]["id"])
+
+    #the record helpers should agree with the leaderboard and the rate stat kernel
+    def test_record_helpers(self):
+        career = self.result["career"]
+        self.assertEqual(get_highest_record(career, "hr"), (career["hr"].idxmax(), career["hr"].max()))
+        self.assertEqual(get_highest_record(self.result["bb"], "year"), (self.result["bb"]["year"].idxmax(),
+                                                                         self.result["bb"]["year"].max()))
+        sopa = calc_percentage_ab_stats(career, ("so", "sopa"))
+        self.assertEqual(sopa.name, "sopa")
+        expected = career["so"] / (career["ab"] + career["bb"] + career["hbp"] + career["sh"] + career["sf"])
+        self.assertTrue(np.allclose(expected.to_numpy(dtype=float), sopa.to_numpy(), equal_nan=True))
+        hrp = calc_percentage_ab_stats(career, ("hr", "hrp"))
+        self.assertTrue(np.allclose((career["hr"] / career["ab"]).to_numpy(dtype=float), hrp.to_numpy(),
+                                    equal_nan=True))
+
+    #the leaderboard can use another at bat threshold without aggregating again
+    def test_leaderboard_threshold(self):
+        career = self.result["career"]
+        board = build_leaderboard(career, min_ab=500, k=5)
+        self.assertTrue((career.loc[board["obp"].index, "ab"] >= 500).all())
+        self.assertEqual(get_records(board), bbanalyze(self.test_file, min_ab=500)["records"])
+
+    #adding a season to a saved state should give the same results as analyzing all the rows at once
+    def test_add_season(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            dat = pd.read_csv(self.test_file)
+            dat.head(60).to_csv(os.path.join(tmp_dir, "old.csv"), index=False)
+            dat.tail(41).to_csv(os.path.join(tmp_dir, "new.csv"), index=False)
+
+            save_bb_state(build_bb_state(os.path.join(tmp_dir, "old.csv")), os.path.join(tmp_dir, "state.pkl"))
+            state = load_bb_state(os.path.join(tmp_dir, "state.pkl"))
+            result = get_bb_stats(add_season(state, os.path.join(tmp_dir, "new.csv")))
+
+            for key in ["record.count", "complete.cases", "years", "player.count", "team.count",
+                        "league.count", "records"]:
+                self.assertEqual(self.result[key], result[key])
+            self.assertEqual(self.result["nl"]["players"], result["nl"]["players"])
+            self.assertEqual(self.result["al"]["teams"], result["al"]["teams"])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    #the rate stat kernel should match the Series formulas, including division by zero
+    def test_rate_stats(self):
+        df = pd.DataFrame({"ab": [10, 0, 0, 4], "h": [3, 0, 1, 2], "bb": [1, 0, 0, 1], "hbp": [0, 0, 0, 1],
+                           "sf": [1, 0, 0, 0], "sh": [0, 0, 0, 1], "hr": [1, 0, 2, 0], "sb": [0, 1, 0, 0],
+                           "so": [2, 0, 0, 1]})
+        rates = get_rate_frame(df)
+        self.assertEqual(list(rates.columns), ["obp", "pab", "hrp", "hp", "sbp", "sop", "sopa", "bbp"])
+        expected = {"obp": calc_obp(df), "pab": calc_pab(df),
+                    "hrp": df["hr"] / df["ab"], "sopa": df["so"] / (df["ab"] + df["bb"] + df["hbp"] + df["sh"] + df["sf"])}
+        for key, ser in expected.items():
+            self.assertTrue(np.array_equal(ser.to_numpy(), rates[key].to_numpy(), equal_nan=True))
+        self.assertTrue(np.isnan(rates.loc[1, "obp"]))
+        self.assertTrue(np.isinf(rates.loc[2, "hrp"]))
+
+    #analyzing shards in worker processes should give the same results as one file
+    def test_files_match_single_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            dat = pd.read_csv(self.test_file)
+            for i, start in enumerate(range(0, len(dat), 30)):
+                dat.iloc[start:start + 30].to_csv(os.path.join(tmp_dir, f"shard{i}.csv"), index=False)
+
+            result = bbanalyze_files(os.path.join(tmp_dir, "shard*.csv"), workers=2, keep_rows=True)
+            for key in ["record.count", "complete.cases", "years", "player.count", "team.count",
+                        "league.count", "records"]:
+                self.assertEqual(self.result[key], result[key])
+            self.assertTrue(self.result["bb"].equals(result["bb"]))
+            self.assertTrue(self.result["nl"]["dat"].equals(result["nl"]["dat"]))
+
+            #by default the workers only send back the totals
+            result = bbanalyze_files(os.path.join(tmp_dir, "shard*.csv"), workers=2)
+            self.assertIsNone(result["bb"])
+            self.assertEqual(self.result["records"], result["records"])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    #the compact schema should give the same counts and records with less memory
+    def test_compact_schema(self):
+        result = bbanalyze(self.test_file, compact=True, cache=False)
+        for key in ["record.count", "complete.cases", "years", "player.count", "team.count",
+                    "league.count", "records"]:
+            self.assertEqual(self.result[key], result[key])
+        self.assertEqual(result["bb"]["id"].dtype, "category")
+        self.assertEqual(result["bb"]["hbp"].dtype, "Int32")
+        self.assertNotIn("rowid", result["bb"].columns)
+
+        inferred = read_bb_csv(self.test_file)
+        compact = read_bb_csv(self.test_file, compact=True)
+        self.assertEqual(list(inferred.columns), list(compact.columns))
+        self.assertLess(compact.memory_usage(deep=True).sum(), inferred.memory_usage(deep=True).sum())
+
+    #profiling should report every phase without changing the results
+    def test_profile_phases(self):
+        phases = []
+        result = bbanalyze(self.test_file, profile=phases, trace_memory=True)
+        self.assertEqual([p["phase"] for p in phases],
+                         ["read", "counts", "dropna", "rates", "leagues", "career", "records"])
+        for phase in phases:
+            self.assertGreaterEqual(phase["wall"], 0)
+            self.assertGreaterEqual(phase["cpu"], 0)
+            self.assertIsNotNone(phase["alloc_bytes"])
+        #allocations are only traced when asked for
+        untraced = []
+        bbanalyze(self.test_file, profile=untraced)
+        self.assertTrue(all(phase["alloc_bytes"] is None for phase in untraced))
+        self.assertEqual(phases[2]["rows_in"], 101)
+        self.assertEqual(phases[2]["rows_out"], 51)
+        self.assertEqual(self.result["records"], result["records"])
+
+    #the cube should answer the summary of a slice the same as bbanalyze on a file of only that slice
+    def test_cube_summary_matches_slice(self):
+        cube = bbanalyze(self.test_file, cube=True)["cube"]
+        dat = pd.read_csv(self.test_file)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "slice.csv")
+            for key, value in [("year", 2007), ("year", 1874), ("lg", "NL"), ("team", "NYN")]:
+                dat[dat[key] == value].to_csv(path, index=False)
+                expected = bbanalyze(path, cache=False)
+                summary = get_cube_summary(cube, **{key: value})
+                for count in ["record.count", "complete.cases", "years", "player.count", "team.count",
+                              "league.count", "records"]:
+                    self.assertEqual(expected[count], summary[count])
+                self.assertTrue(expected["career"].sort_index().equals(summary["career"].sort_index()))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        summary = get_cube_summary(cube)
+        self.assertEqual(self.result["records"], summary["records"])
+        self.assertEqual(0, get_cube_summary(cube, lg="XX")["record.count"])
+
+    #the cube of a streamed file should be the same as the cube of the whole file
+    def test_cube_chunked(self):
+        cube = bbanalyze(self.test_file, cube=True)["cube"]
+        result = bbanalyze(self.test_file, chunksize=7, keep_rows=False, cube=True)
+        self.assertTrue(cube.equals(result["cube"]))
+        self.assertEqual(101, cube["records"].sum())
+        self.assertEqual(51, cube["complete"].sum())
+        #the cube is only built when asked for
+        self.assertIsNone(self.result["cube"])
+        self.assertIsNone(bbanalyze(self.test_file, chunksize=7, keep_rows=False)["cube"])
+
+    #rate stats of a rollup should come from the summed counts of its complete cases
+    def test_cube_rates(self):
+        rates = get_cube_rates(bbanalyze(self.test_file, cube=True)["cube"], ["year", "lg"])
+        bb = self.result["bb"]
+        for (year, lg), row in rates.iterrows():
+            rows = bb[(bb["year"] == year) & (bb["lg"] == lg)]
+            if len(rows) == 0:
+                continue
+            on_base = rows["h"].sum() + rows["bb"].sum() + rows["hbp"].sum()
+            self.assertAlmostEqual(on_base / (rows["ab"].sum() + rows["bb"].sum() + rows["hbp"].sum()), row["obp"])
+            self.assertEqual(rows["id"].nunique(), row["player.count"])
@@ -1,14 +1,70 @@
+import glob
+import json
 import math
+import numpy as np
+import os
 import pandas as pd
+import pickle
 import re
+import shutil
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
-def bbanalyze(filename = "baseball.csv"):
+from statQuery import get_subset, parse_query_value
+
+# Count stats that are summed into a player's career totals
+CAREER_COLS = ["g", "ab", "r", "h", "X2b", "X3b", "hr", "rbi", "sb", "cs", "bb", "so", "ibb", "hbp",
+               "sh", "sf", "gidp"]
+
+# Schema used by read_bb_csv(compact=True): text columns become categories and count columns nullable integers
+BB_SCHEMA = {"id": "category", "year": "int16", "stint": "int8", "team": "category", "lg": "category",
+             **{col: "Int32" for col in CAREER_COLS}}
+
+# Columns keying the rows of the rollup cube (see build_rollup_cube)
+CUBE_KEYS = ["year", "team", "lg", "id"]
+
+# Metrics that have a career record, in the order of the records dictionary
+RECORD_KEYS = ["obp", "pab", "hr", "hrp", "h", "hp", "sb", "sbp", "so", "sop", "sopa", "bb", "bbp", "g"]
+
+# Rate stats, as (numerator, denominator). Sums shared by several stats (like the plate appearances
+# ab + bb + hbp + sf + sh) are listed in RATE_TERMS and only calculated once per call.
+RATE_STATS = {"obp": ("on_base", "base_pa"), "pab": ("productive", "pa"), "hrp": ("hr", "ab"),
+              "hp": ("h", "ab"), "sbp": ("sb", "ab"), "sop": ("so", "ab"), "sopa": ("so", "pa"),
+              "bbp": ("bb", "ab")}
+RATE_TERMS = {"on_base": ["h", "bb", "hbp"], "productive": ["on_base", "sf", "sh"],
+              "base_pa": ["ab", "bb", "hbp"], "pa": ["base_pa", "sf", "sh"]}
+
+def bbanalyze(filename = "baseball.csv", chunksize = None, keep_rows = False, cache = True, min_ab = 50,
+              compact = False, profile = None, cube = False, trace_memory = False):
     """
     Function that analyzes, calculates, and reports the relative statistics for a given baseball
     dataset, national league, and American League baseball.
 
     Args:
         filename (str): name of the .csv file containing the data
+        chunksize (int): if given, the file is streamed in chunks of this many rows and only running
+            totals are kept in memory instead of the whole file. Default is None (read the whole file)
+        keep_rows (bool): only used when streaming. If False, the row level DataFrames (bb, and dat for
+            nl and al) are not kept and are set to None, so memory only depends on the chunk size and the
+            number of distinct players. If True, every complete row is kept until the end, so memory grows with
+            the file again. Default is False
+        cache (bool): when reading the whole file, reuse (or create) a columnar cache of the parsed file
+            next to the csv so that later calls do not parse the text again. Default is True
+        min_ab (int): minimum career at bats a player needs to be considered for a record. Default is 50
+        compact (bool): read the file with the BB_SCHEMA dtypes (categories and nullable integers) instead of
+            letting pandas guess them, which uses much less memory. Default is False
+        profile (list or function): if given, every phase (read, counts, dropna, rates, leagues, career,
+            records, cube) reports its wall time, CPU time, allocated bytes and row counts as a dictionary, which
+            is appended to the list or passed to the function (see jsonl_sink). Default is None (no profiling)
+        cube (bool): also build the rollup cube of the data (see build_rollup_cube), which adds a groupby over
+            all rows to the call. Default is False
+        trace_memory (bool): turn tracemalloc on for a profiled call, so the phases also report allocated and
+            peak bytes. Tracing every allocation makes the call about half again slower, and the wall and CPU
+            times of the phases include that. Without it, bytes are only reported if tracemalloc was already
+            on. Default is False
 
     Returns: dictionary with records for the following
         record.count (int)
@@ -17,9 +73,14 @@ def bbanalyze(filename = "baseball.csv"):
         team.count (int)
         league.count (int)
         bb (DataFrame)
+        leagues (dict): dat, players and teams of every league, keyed by league
         nl (dict)
         al (dict)
+        career (DataFrame): career count stats per player id, used to rebuild the leaderboard
+        leaderboard (dict): top 10 players (and ties) for every record metric, see build_leaderboard
         records (dict)
+        cube (DataFrame): count sums per year, team, league and player, used to answer the same summary for
+            any slice of the data, see build_rollup_cube and get_cube_summary. None unless cube is True
     """
     if not isinstance(filename, str):
         return math.nan
@@ -30,121 +91,935 @@ def bbanalyze(filename = "baseball.csv"):
     if not match:
         return math.nan
 
-    bbdat = pd.read_csv(filename)
+    #Allocated bytes can only be measured while tracemalloc is on, which slows every allocation down, so it is
+    # only turned on when asked for
+    started_tracing = profile is not None and trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        return analyze_bb_file(filename, chunksize, keep_rows, cache, min_ab, compact, profile, cube)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
 
-    #Execution test data does not have a rowid column (first column), dropping that column so they are equal. (This helped us
-    # pass more tests?) I don't like this as a solution, but it is a bit of a brute-force solution to get things to equal up???
-    # Could I get an explanation of what went wrong here?
-    bbdat.drop(bbdat.columns[0],axis=1,inplace=True)
-    #This code below doesn't work because for some reason it cannot find rowid?
-    #keys = bbdat.keys()
-    #if [key == "rowid" for key in keys]:
-        #bbdat.drop('rowid', axis=1, inplace=True)
+def analyze_bb_file(filename, chunksize, keep_rows, cache, min_ab, compact, profile, cube):
+    """
+    Helper method that does the work of bbanalyze once the arguments are checked; see bbanalyze for the
+    arguments and the result.
+    """
+    #Streaming mode: feed each chunk into a running state and build the results from the state at the end
+    if chunksize is not None:
+        if not isinstance(chunksize, int) or chunksize < 1:
+            return math.nan
+        with track_phase(profile, "stream") as phase:
+            state = build_bb_state(filename, chunksize, keep_rows, compact, cube)
+            phase["rows_out"] = state["record.count"]
+        with track_phase(profile, "results", state["record.count"]) as phase:
+            bbstats = get_bb_stats(state, min_ab)
+            phase["rows_out"] = bbstats["complete.cases"]
+        return bbstats
+
+    with track_phase(profile, "read") as phase:
+        bbdat = load_bb_data(filename, cache, compact)
+        phase["rows_out"] = len(bbdat)
 
     #Construct empty dictionaries with null values to be populated later; basically initializing
     # all values to keep track of the dictionaries within dictionaries. This is for my own sanity;
     # I am unsure if it would be better to create them later on.
     bbstats = dict.fromkeys(["record.count", "complete.cases", "player.count", "team.count",
-                             "league.count", "bb", "nl", "al", "records"])
-    bbstats["nl"] = dict.fromkeys(["dat", "players", "teams"])
-    bbstats["al"] = dict.fromkeys(["dat", "players", "teams"])
-    bbstats["records"] = dict.fromkeys(["obp", "pab", "hr", "hrp", "h", "hp", "sb", "sbp", "so",
-                                        "sop", "sopa", "bb", "bbp", "g"])
-    #I didn't want to use a for loop and instead use a list comprehension, but I was not sure
-    # how to structure it as bbstats["records"][key] = [list comprehension]
-    for key in bbstats["records"].keys():
-        bbstats["records"][key] = dict.fromkeys(["id", "value"])
-
-    # count number of records
-    bbstats["record.count"] = len(bbdat)
+                             "league.count", "bb", "nl", "al", "career", "leaderboard", "records", "cube"])
 
-    #tuple form of min year, max year
-    bbstats["years"] = (int(bbdat["year"].min()), int(bbdat["year"].max()))
+    with track_phase(profile, "counts", len(bbdat)):
+        # count number of records
+        bbstats["record.count"] = len(bbdat)
 
-    #unique player count - no double-count
-    bbstats["player.count"] = get_count(bbdat,"id")
+        #tuple form of min year, max year
+        bbstats["years"] = (int(bbdat["year"].min()), int(bbdat["year"].max()))
 
-    #unique team count - no double-count
-    bbstats["team.count"] = get_count(bbdat, "team")
+        #unique player count - no double-count
+        bbstats["player.count"] = get_count(bbdat,"id")
 
-    #unique league count - no double-count
-    bbstats["league.count"] = get_count(bbdat, "lg")
+        #unique team count - no double-count
+        bbstats["team.count"] = get_count(bbdat, "team")
 
-    # count number of complete cases
-    bbstats["bb"] = bbdat.dropna()
-    bbstats["complete.cases"] = len(bbstats["bb"])
+        #unique league count - no double-count
+        bbstats["league.count"] = get_count(bbdat, "lg")
 
-    # Adding columns to bb DataFrame for obp and pab by creating new Series to concatenate to the bb DataFrame.
-    # Is it okay to do the calculations inside the .Series() function call because it might be a little hard to read.
-    obp_ser = calc_obp(bbstats["bb"])
-    pab_ser = calc_pab(bbstats["bb"])
-    bbstats["bb"] = pd.concat([bbstats["bb"], obp_ser, pab_ser], axis=1)
+    with track_phase(profile, "dropna", len(bbdat)) as phase:
+        # count number of complete cases
+        bbstats["bb"] = bbdat.dropna()
+        bbstats["complete.cases"] = len(bbstats["bb"])
+        phase["rows_out"] = bbstats["complete.cases"]
 
-    # Calculate nl information
-    bbstats["nl"]["dat"] = get_dat_subset(bbstats["bb"], "lg", '"NL"')
-    bbstats["nl"]["players"] = get_count(bbstats["nl"]["dat"], "id")
-    bbstats["nl"]["teams"] = get_count(bbstats["nl"]["dat"], "team")
+    with track_phase(profile, "rates", bbstats["complete.cases"]):
+        # Adding columns to bb DataFrame for obp and pab; both are calculated in one pass by the rate stat kernel.
+        bbstats["bb"] = pd.concat([bbstats["bb"], get_rate_frame(bbstats["bb"], ["obp", "pab"])], axis=1)
 
-    #Calculate al information
-    bbstats["al"]["dat"] = get_dat_subset(bbstats["bb"],"lg", '"AL"')
-    bbstats["al"]["players"] = get_count(bbstats["al"]["dat"],"id")
-    bbstats["al"]["teams"] = get_count(bbstats["al"]["dat"],"team")
+    with track_phase(profile, "leagues", bbstats["complete.cases"]) as phase:
+        #Calculate the data, players and teams of every league in one pass; nl and al are entries of that summary
+        bbstats["leagues"] = get_league_summary(bbstats["bb"])
+        bbstats["nl"] = get_league(bbstats["leagues"], bbstats["bb"], "NL")
+        bbstats["al"] = get_league(bbstats["leagues"], bbstats["bb"], "AL")
+        phase["rows_out"] = len(bbstats["nl"]["dat"]) + len(bbstats["al"]["dat"])
 
     #Calculate records
     #Aggregate bb DataFrame using groupby to calculate total career stats per player id, this way we can look at
-    # each stat for a player's entire career
-    # Drop obp and pab because we want to recalculate it based on aggregated stats.
-    bb_agg = bbstats["bb"].drop('obp', axis=1).drop('pab', axis=1).groupby(["id"]).sum()
-    #Recalculate the aggregate obp and pab
-    obp_ser = calc_obp(bb_agg)
-    pab_ser = calc_pab(bb_agg)
-    bb_agg = pd.concat([bb_agg, obp_ser, pab_ser], axis=1)
-
-    #Get data subset of all players with at least 50 career at bats; then we can find the max value. We do not want
-    # max values for players without that minimum career at bats.
-    bb_career = get_dat_subset(bb_agg, "ab", "50", ">=")
-
-    #separate the keys in bb_career into keys for metrics already existing in the dataset and keys that
-    # need further calculations. Calculated keys is a tuple containing the metric that is given as a percentage
-    # and the metric name.
-    existing_keys = ["obp","pab","hr","h","sb","so","bb","g"]
-    calculated_keys = [("hr","hrp"), ("h","hp"), ("sb","sbp"), ("so","sop"), ("so","sopa"), ("bb","bbp")]
-
-    for key in existing_keys:
-        #Iterate through all records and call helper method to find the max value and corresponding player id.
-        max_val = get_highest_record(bb_career, key)
-        bbstats["records"][key]["id"] = max_val[0]
-        bbstats["records"][key]["value"] = max_val[1]
-
-    for key in calculated_keys:
-        calc_series = calc_percentage_ab_stats(bb_career, key)
-        bb_career = pd.concat([bb_career, calc_series], axis=1)
-        max_val = get_highest_record(bb_career, key[1])
-        bbstats["records"][key[1]]["id"] = max_val[0]
-        bbstats["records"][key[1]]["value"] = max_val[1]
+    # each stat for a player's entire career. obp and pab are recalculated from the aggregated stats.
+    with track_phase(profile, "career", bbstats["complete.cases"]) as phase:
+        bbstats["career"] = get_career_stats(bbstats["bb"])
+        phase["rows_out"] = len(bbstats["career"])
+
+    with track_phase(profile, "records", len(bbstats["career"])):
+        bbstats["leaderboard"] = build_leaderboard(bbstats["career"], min_ab)
+        bbstats["records"] = get_records(bbstats["leaderboard"])
+
+    if cube:
+        with track_phase(profile, "cube", len(bbdat)) as phase:
+            bbstats["cube"] = build_rollup_cube(bbdat)
+            phase["rows_out"] = len(bbstats["cube"])
+
+    return bbstats
+
+@contextmanager
+def track_phase(profile, name, rows_in = None):
+    """
+    Context manager that measures one phase of bbanalyze. The code inside can set "rows_out" on the
+    dictionary it gets. When profile is None nothing is measured. Allocated bytes (the change in traced memory)
+    and peak bytes (the highest traced memory above the start) are only filled in while tracemalloc is on.
+    Args:
+        profile (list or function): where the phase is reported; a list is appended to, a function is called
+        name (str): name of the phase
+        rows_in (int): number of rows going into the phase. Default is None
+
+    Returns: dictionary describing the phase
+    """
+    if profile is None:
+        yield {}
+        return
+
+    phase = {"phase": name, "rows_in": rows_in, "rows_out": None}
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield phase
+    finally:
+        phase["wall"] = time.perf_counter() - start_wall
+        phase["cpu"] = time.process_time() - start_cpu
+        phase["alloc_bytes"] = None
+        phase["peak_bytes"] = None
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            phase["alloc_bytes"] = current - start_bytes
+            phase["peak_bytes"] = peak - start_bytes
+        if callable(profile):
+            profile(phase)
+        else:
+            profile.append(phase)
+
+def jsonl_sink(filename):
+    """
+    Makes a profile sink for bbanalyze that appends every phase to a JSON-lines file.
+    Args:
+        filename (str): name of the file to append to
+
+    Returns: function to pass as the profile argument of bbanalyze
+    """
+    def write_phase(phase):
+        with open(filename, "a") as f:
+            f.write(json.dumps(phase) + "\n")
+
+    return write_phase
+
+def bbanalyze_files(filenames, workers = None, chunksize = 100000, keep_rows = False, min_ab = 50,
+                    compact = False, cube = False):
+    """
+    Analyzes baseball data that is split over several .csv files (for example one file per decade or per team).
+    Every file is read and aggregated into a running state by its own worker process, and the states are
+    merged in file order, so the results are the same as calling bbanalyze on all the files put together.
+
+    Args:
+        filenames (str or list of str): glob pattern (files are taken in sorted order) or list of .csv files
+        workers (int): number of worker processes; 1 reads the files in this process. Default is None
+            (one per core)
+        chunksize (int): number of rows each worker reads at a time. Default is 100000
+        keep_rows (bool): keep the complete cases so that bb, nl and al data can be built. Every worker then
+            sends all the complete rows of its files back to this process, which costs about as much as reading
+            them; without it only the totals, sets and career sums are sent. Default is False
+        min_ab (int): minimum career at bats a player needs to be considered for a record. Default is 50
+        compact (bool): read the files with the BB_SCHEMA dtypes. Default is False
+        cube (bool): also build the rollup cube of the data, see bbanalyze. Default is False
+
+    Returns: dictionary in the same format as bbanalyze
+    """
+    if isinstance(filenames, str):
+        filenames = sorted(glob.glob(filenames))
+    if not isinstance(filenames, (list, tuple)) or len(filenames) == 0:
+        return math.nan
+    if not all(isinstance(f, str) and re.search(r".+\.csv$", f) for f in filenames):
+        return math.nan
+
+    args = (list(filenames), [chunksize] * len(filenames), [keep_rows] * len(filenames),
+            [compact] * len(filenames), [cube] * len(filenames))
+    if workers == 1:
+        states = list(map(build_bb_state, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            states = list(pool.map(build_bb_state, *args))
+
+    state = states[0]
+    for other in states[1:]:
+        merge_bb_state(state, other)
+
+    return get_bb_stats(state, min_ab)
+
+def read_bb_csv(filename, compact = False, chunksize = None):
+    """
+    Reads a baseball .csv file (the full data or a season file like bb2005.csv) without its rowid column.
+    The rowid column is skipped while parsing (usecols) instead of being dropped after it is loaded.
+    Args:
+        filename (str): name of the .csv file containing the data
+        compact (bool): use the BB_SCHEMA dtypes instead of letting pandas guess them. Default is False
+        chunksize (int): if given, return an iterator of chunks with this many rows. Default is None
+
+    Returns: DataFrame containing the data, or an iterator of DataFrames if chunksize is given
+    """
+    if not isinstance(filename, str):
+        return math.nan
+
+    #Execution test data does not have a rowid column name (first column), so skip the first column by position
+    # instead of by name. Only the header line is read to count the columns.
+    header = pd.read_csv(filename, nrows=0).columns
+    usecols = list(range(1, len(header)))
+    if not compact:
+        return pd.read_csv(filename, usecols=usecols, chunksize=chunksize)
+
+    #pandas parses nullable integers from text much slower than floats, so the counts are parsed as float32
+    # (exact for whole numbers below 2**24, and NA becomes NaN) and then turned into nullable integers
+    schema = {col: BB_SCHEMA[col] for col in header if col in BB_SCHEMA}
+    parse_dtype = {col: "float32" if dtype == "Int32" else dtype for col, dtype in schema.items()}
+    int_cols = {col: dtype for col, dtype in schema.items() if dtype == "Int32"}
+
+    reader = pd.read_csv(filename, usecols=usecols, dtype=parse_dtype, chunksize=chunksize)
+    if chunksize is None:
+        return reader.astype(int_cols)
+    return (chunk.astype(int_cols) for chunk in reader)
+
+def load_bb_data(filename, cache = True, compact = False):
+    """
+    Reads a baseball .csv file into a DataFrame without its rowid column. When cache is True, the parsed
+    data is saved as one .npy file per column in a "<filename>.cache" folder next to the csv, and later
+    calls memory-map those files instead of parsing the text. The cache is rebuilt whenever the size or
+    modification time of the csv changes.
+    Args:
+        filename (str): name of the .csv file containing the data
+        cache (bool): use the columnar cache. Default is True
+        compact (bool): use the BB_SCHEMA dtypes, see read_bb_csv. Default is False
+
+    Returns: DataFrame containing the data
+    """
+    if not isinstance(filename, str):
+        return math.nan
+
+    if cache:
+        bbdat = read_bb_cache(filename, compact)
+        if bbdat is not None:
+            return bbdat
+
+    bbdat = read_bb_csv(filename, compact)
+
+    if cache:
+        write_bb_cache(filename, bbdat, compact)
+
+    return bbdat
+
+def get_cache_dir(filename, compact = False):
+    """
+    Helper method that gives the name of the cache folder that belongs to a .csv file
+    Args:
+        filename (str): name of the .csv file
+        compact (bool): the cache holds data read with the BB_SCHEMA dtypes. Default is False
+
+    Returns: name of the cache folder
+    """
+    return filename + (".compact.cache" if compact else ".cache")
+
+def get_source_stamp(filename):
+    """
+    Helper method that describes the current version of a file by its size and modification time; the
+    cache is only valid while this stays the same.
+    Args:
+        filename (str): name of the file
+
+    Returns: dictionary containing size and mtime_ns
+    """
+    stat = os.stat(filename)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def write_bb_cache(filename, df, compact = False):
+    """
+    Saves a parsed DataFrame as a columnar cache next to its .csv file. Numeric columns are saved as they
+    are, text and categorical columns are saved as integer codes with the list of categories in meta.json.
+    Nothing is saved (and no error is raised) if the folder cannot be written.
+    Args:
+        filename (str): name of the .csv file the data was read from
+        df (Pandas DataFrame): parsed data
+        compact (bool): the data was read with the BB_SCHEMA dtypes. Default is False
+
+    Returns: True if the cache was written, False otherwise
+    """
+    if not isinstance(filename, str) or not isinstance(df, pd.DataFrame):
+        return False
+
+    cache_dir = get_cache_dir(filename, compact)
+    try:
+        meta = {"source": get_source_stamp(filename), "rows": len(df), "columns": []}
+        tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(cache_dir) + ".", dir=os.path.dirname(cache_dir) or ".")
+        for i, col in enumerate(df.columns):
+            ser = df[col]
+            info = {"name": col, "dtype": str(ser.dtype), "file": f"{i}.npy"}
+            if isinstance(ser.dtype, np.dtype) and ser.dtype.kind in "biuf":
+                info["kind"] = "array"
+                values = ser.to_numpy()
+            elif isinstance(ser.dtype, pd.CategoricalDtype) or not pd.api.types.is_numeric_dtype(ser):
+                #Text columns cannot be memory-mapped, so keep codes plus a list of the distinct values
+                cat = pd.Categorical(ser)
+                info["kind"] = "codes"
+                info["categories"] = cat.categories.tolist()
+                values = cat.codes
+            else:
+                #Nullable numbers: save the values as floats and rebuild the NA mask when loading
+                info["kind"] = "masked"
+                values = ser.to_numpy(dtype="float64", na_value=np.nan)
+            np.save(os.path.join(tmp_dir, info["file"]), values, allow_pickle=False)
+            meta["columns"].append(info)
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(tmp_dir, cache_dir)
+    except (OSError, TypeError, ValueError):
+        if "tmp_dir" in locals():
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return False
+
+    return True
+
+def read_bb_cache(filename, compact = False):
+    """
+    Loads the columnar cache of a .csv file if it exists and still matches the file.
+    Args:
+        filename (str): name of the .csv file
+        compact (bool): load the cache of the data read with the BB_SCHEMA dtypes. Default is False
+
+    Returns: DataFrame containing the cached data, or None if there is no valid cache
+    """
+    cache_dir = get_cache_dir(filename, compact)
+    try:
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["source"] != get_source_stamp(filename):
+            return None
+
+        columns = {}
+        for info in meta["columns"]:
+            values = np.load(os.path.join(cache_dir, info["file"]), mmap_mode="r", allow_pickle=False)
+            if info["kind"] == "array":
+                #plain ndarray view of the mapped file, so no copy is made
+                columns[info["name"]] = pd.Series(values.view(np.ndarray), copy=False)
+            elif info["kind"] == "masked":
+                columns[info["name"]] = pd.Series(values).astype(info["dtype"])
+            elif info["dtype"] == "category":
+                columns[info["name"]] = pd.Series(pd.Categorical.from_codes(values, info["categories"]))
+            else:
+                ser = pd.Series(pd.Categorical.from_codes(values, info["categories"]))
+                columns[info["name"]] = ser.astype(info["dtype"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+    return pd.DataFrame(columns, copy=False)
+
+def init_bb_state(keep_rows = False, cube = False):
+    """
+    Creates an empty running state used to analyze a baseball dataset one chunk at a time. The state
+    only holds totals, distinct sets and career sums, so it grows with the number of distinct players
+    rather than with the number of rows.
+    Args:
+        keep_rows (bool): keep the complete cases of each chunk so that bb, nl and al data can be built; the
+            state then grows with the number of rows. Default is False
+        cube (bool): keep the rollup cube of each chunk; they are added up once by get_bb_stats. Default is False
+
+    Returns: dictionary containing the running state
+    """
+    return {"record.count": 0, "complete.cases": 0, "years": None,
+            "ids": set(), "teams": set(), "lgs": set(),
+            "leagues": {}, "career": None, "cubes": [] if cube else None,
+            "rows": [] if keep_rows else None, "dtypes": {}}
+
+def update_bb_state(state, df):
+    """
+    Adds a chunk of raw baseball rows (without the rowid column) to a running state. Rows are renumbered
+    to continue after the rows already in the state, so the result matches reading the whole file at once.
+    Args:
+        state (dict): running state created by init_bb_state
+        df (Pandas DataFrame): chunk of rows to add
+
+    Returns: the updated state
+    """
+    if not isinstance(state, dict) or not isinstance(df, pd.DataFrame):
+        return math.nan
+    if len(df) == 0:
+        return state
+
+    df = df.set_axis(range(state["record.count"], state["record.count"] + len(df)), axis=0)
+    state["record.count"] += len(df)
+
+    years = (int(df["year"].min()), int(df["year"].max()))
+    if state["years"] is not None:
+        years = (min(years[0], state["years"][0]), max(years[1], state["years"][1]))
+    state["years"] = years
+
+    state["ids"].update(df["id"].dropna().unique())
+    state["teams"].update(df["team"].dropna().unique())
+    state["lgs"].update(df["lg"].dropna().unique())
+
+    #Remember the widest numeric type of every column; a column that is NA in one chunk is read as float in
+    # that chunk, and the whole file would be read as float in that case too.
+    for col in df.columns:
+        track_dtype(state["dtypes"], col, df[col].dtype)
+
+    #The cube also counts the rows that are not complete, so it is built before they are dropped. Adding the
+    # chunk cubes up here would regroup the whole cube for every chunk, so they are added up once at the end.
+    if state.get("cubes") is not None:
+        state["cubes"].append(build_rollup_cube(df))
+
+    complete = df.dropna()
+    state["complete.cases"] += len(complete)
+    if len(complete) == 0:
+        return state
+
+    for lg, lg_dat in complete.groupby("lg", observed=True):
+        league = state["leagues"].setdefault(lg, {"ids": set(), "teams": set()})
+        league["ids"].update(lg_dat["id"].unique())
+        league["teams"].update(lg_dat["team"].unique())
+
+    career = get_career_stats(complete)
+    if state["career"] is not None:
+        career = pd.concat([state["career"], career]).groupby(level=0).sum()
+    state["career"] = career
+
+    if state["rows"] is not None:
+        state["rows"].append(complete)
+
+    return state
+
+def track_dtype(dtypes, col, dtype):
+    """
+    Helper method that remembers the dtype a column needs once all chunks are put together: the widest NumPy
+    number type seen so far, or category for categorical columns (chunks can have different categories).
+    Text columns are set to None, which means they are never cast (a text column that is empty in one chunk
+    is read as float in that chunk).
+    Args:
+        dtypes (dict): dtypes seen so far, keyed by column name
+        col (str): column name
+        dtype: dtype of the column in a new chunk, or None for a text column
+
+    Returns: None
+    """
+    seen = dtypes.get(col, False)
+    if seen is None:
+        return
+    if isinstance(dtype, pd.CategoricalDtype) or (isinstance(dtype, str) and dtype == "category"):
+        dtypes[col] = "category"
+    elif isinstance(dtype, np.dtype) and dtype.kind in "biuf":
+        dtypes[col] = dtype if not isinstance(seen, np.dtype) else np.result_type(seen, dtype)
+    elif dtype is None or not pd.api.types.is_numeric_dtype(dtype):
+        dtypes[col] = None
+
+def merge_bb_state(state, other):
+    """
+    Merges the running state of later rows (for example a new season, or another shard of the data) into a
+    state. The merge is associative, and merging states in file order gives the same results as reading the
+    files one after the other. Only the totals, sets and career sums are merged, so the time depends on the
+    size of the other state and the number of players, not on the rows already in state.
+    Args:
+        state (dict): running state to merge into
+        other (dict): running state of the rows that come after the rows of state
+
+    Returns: the updated state
+    """
+    if not isinstance(state, dict) or not isinstance(other, dict):
+        return math.nan
+    if other["record.count"] == 0:
+        return state
+
+    #Rows of the other state are renumbered to come after the rows of this state
+    if state["rows"] is not None and other["rows"] is not None:
+        offset = state["record.count"]
+        state["rows"].extend(rows.set_axis(rows.index + offset, axis=0) for rows in other["rows"])
+    else:
+        state["rows"] = None
+
+    state["record.count"] += other["record.count"]
+    state["complete.cases"] += other["complete.cases"]
+
+    years = other["years"]
+    if state["years"] is not None:
+        years = (min(years[0], state["years"][0]), max(years[1], state["years"][1]))
+    state["years"] = years
+
+    state["ids"].update(other["ids"])
+    state["teams"].update(other["teams"])
+    state["lgs"].update(other["lgs"])
+
+    for col, dtype in other["dtypes"].items():
+        track_dtype(state["dtypes"], col, dtype)
+
+    for lg, other_league in other["leagues"].items():
+        league = state["leagues"].setdefault(lg, {"ids": set(), "teams": set()})
+        league["ids"].update(other_league["ids"])
+        league["teams"].update(other_league["teams"])
+
+    if other["career"] is not None:
+        career = other["career"]
+        if state["career"] is not None:
+            career = pd.concat([state["career"], career]).groupby(level=0).sum()
+        state["career"] = career
+
+    if state.get("cubes") is not None and other.get("cubes") is not None:
+        state["cubes"].extend(other["cubes"])
+    else:
+        state["cubes"] = None
+
+    return state
+
+def build_bb_state(filename, chunksize = 100000, keep_rows = False, compact = False, cube = False):
+    """
+    Reads a baseball .csv file in chunks into a new running state.
+    Args:
+        filename (str): name of the .csv file containing the data
+        chunksize (int): number of rows read at a time. Default is 100000
+        keep_rows (bool): keep the complete cases so that bb, nl and al data can be built. Default is False
+        compact (bool): read the file with the BB_SCHEMA dtypes. Default is False
+        cube (bool): keep the rollup cube of every chunk. Default is False
+
+    Returns: the running state
+    """
+    if not isinstance(filename, str) or not re.search(r".+\.csv$", filename):
+        return math.nan
+
+    state = init_bb_state(keep_rows, cube)
+    for chunk in read_bb_csv(filename, compact, chunksize):
+        update_bb_state(state, chunk)
+
+    return state
+
+def add_season(state, filename, compact = False):
+    """
+    Adds a new season file (for example bb2005.csv) to a running state, without reading the older data again.
+    Args:
+        state (dict): running state of the older data
+        filename (str): name of the .csv file containing the new season
+        compact (bool): read the file with the BB_SCHEMA dtypes. Default is False
+
+    Returns: the updated state
+    """
+    if not isinstance(state, dict):
+        return math.nan
+
+    season = build_bb_state(filename, keep_rows=state["rows"] is not None, compact=compact,
+                            cube=state.get("cubes") is not None)
+    if not isinstance(season, dict):
+        return math.nan
+
+    return merge_bb_state(state, season)
+
+def save_bb_state(state, filename):
+    """
+    Saves a running state to a file so that it can be reused and updated later.
+    Args:
+        state (dict): running state
+        filename (str): name of the file to write
+
+    Returns: None
+    """
+    with open(filename, "wb") as f:
+        pickle.dump(state, f)
+
+def load_bb_state(filename):
+    """
+    Loads a running state saved by save_bb_state.
+    Args:
+        filename (str): name of the file to read
+
+    Returns: the running state
+    """
+    with open(filename, "rb") as f:
+        return pickle.load(f)
+
+def get_bb_stats(state, min_ab = 50):
+    """
+    Builds the bbanalyze result dictionary from a running state.
+    Args:
+        state (dict): running state created by init_bb_state and filled by update_bb_state
+        min_ab (int): minimum career at bats a player needs to be considered for a record. Default is 50
+
+    Returns: dictionary in the same format as bbanalyze
+    """
+    if not isinstance(state, dict):
+        return math.nan
+
+    bbstats = dict.fromkeys(["record.count", "complete.cases", "player.count", "team.count",
+                             "league.count", "bb", "nl", "al", "career", "leaderboard", "records", "cube"])
+    bbstats["record.count"] = state["record.count"]
+    bbstats["years"] = state["years"]
+    bbstats["player.count"] = len(state["ids"])
+    bbstats["team.count"] = len(state["teams"])
+    bbstats["league.count"] = len(state["lgs"])
+    bbstats["complete.cases"] = state["complete.cases"]
+
+    if state["rows"] is not None and len(state["rows"]) > 0:
+        bb = pd.concat(state["rows"])
+        for col, dtype in state["dtypes"].items():
+            if dtype is not None and bb[col].dtype != dtype:
+                bb[col] = bb[col].astype(dtype)
+        bbstats["bb"] = pd.concat([bb, get_rate_frame(bb, ["obp", "pab"])], axis=1)
+
+    if bbstats["bb"] is not None:
+        bbstats["leagues"] = get_league_summary(bbstats["bb"])
+    else:
+        bbstats["leagues"] = {lg: {"dat": None, "players": len(league["ids"]), "teams": len(league["teams"])}
+                              for lg, league in sorted(state["leagues"].items())}
+    bbstats["nl"] = get_league(bbstats["leagues"], bbstats["bb"], "NL")
+    bbstats["al"] = get_league(bbstats["leagues"], bbstats["bb"], "AL")
+
+    if state["career"] is not None:
+        bbstats["career"] = state["career"]
+        bbstats["leaderboard"] = build_leaderboard(state["career"], min_ab)
+        bbstats["records"] = get_records(bbstats["leaderboard"])
+    if state.get("cubes"):
+        bbstats["cube"] = merge_rollup_cubes(state["cubes"])
 
     return bbstats
 
+def get_league_summary(df, col = "lg"):
+    """
+    Helper method that splits a DataFrame by league in one pass. The rows are stably sorted by league once,
+    so the data of each league is a slice (view) of that one sorted copy instead of a separate query copy,
+    and the player and team counts of all leagues come from a single groupby.
+    Args:
+        df (Pandas DataFrame): DataFrame containing id, team and league columns
+        col (string): column name of the league. Default is lg
+
+    Returns: dictionary keyed by league, each containing dat (DataFrame), players (int) and teams (int)
+    """
+    if not isinstance(df, pd.DataFrame) or not isinstance(col, str):
+        return math.nan
+
+    #Rows without a league get code -1 and are sorted in front of every league, outside of all the slices
+    codes, leagues = pd.factorize(df[col], sort=True)
+    order = np.argsort(codes, kind="stable")
+    sorted_df = df.take(order)
+    bounds = np.searchsorted(codes[order], np.arange(len(leagues) + 1))
+
+    counts = df.groupby(col, sort=True, observed=True).agg(players=("id", "nunique"), teams=("team", "nunique"))
+
+    summary = {}
+    for i, lg in enumerate(leagues):
+        summary[lg] = {"dat": sorted_df.iloc[bounds[i]:bounds[i + 1]],
+                       "players": int(counts.loc[lg, "players"]),
+                       "teams": int(counts.loc[lg, "teams"])}
+
+    return summary
+
+def get_league(summary, df, lg):
+    """
+    Helper method that takes one league out of a league summary; a league that is not in the data gets
+    empty data and counts of 0.
+    Args:
+        summary (dict): league summary from get_league_summary
+        df (Pandas DataFrame): DataFrame the summary was made from (used for the columns of empty data)
+        lg (string): league to take out of the summary
+
+    Returns: dictionary containing dat, players and teams of the league
+    """
+    if not isinstance(summary, dict):
+        return math.nan
+
+    if lg in summary:
+        return summary[lg]
+
+    dat = df.iloc[0:0] if isinstance(df, pd.DataFrame) else None
+    return {"dat": dat, "players": 0, "teams": 0}
+
+def get_career_stats(df):
+    """
+    Helper method that adds up the count stats of every player over their whole career.
+    Args:
+        df (Pandas DataFrame): DataFrame containing one row per player stint
+
+    Returns: DataFrame of career count stats indexed by player id
+    """
+    if not isinstance(df, pd.DataFrame):
+        return math.nan
+
+    return df.groupby("id", observed=True)[CAREER_COLS].sum()
+
+def build_leaderboard(bb_agg, min_ab = 50, k = 10):
+    """
+    Builds a leaderboard with the top k players for every record metric out of the career totals. All metrics
+    are put in one table; for every metric the top k are found with a partial sort (np.argpartition) and only
+    they are sorted, so every record and every top-n list comes from the same table without sorting all
+    players. Players tied with the k-th value are kept, and ties are ordered by player id, so the
+    first entry is the same player idxmax would give. The career totals are not changed, so the leaderboard
+    can be rebuilt with another at bat threshold without aggregating again.
+    Args:
+        bb_agg (Pandas DataFrame): career count stats summed per player id (indexed by id)
+        min_ab (int): minimum career at bats a player needs to be on the leaderboard. Default is 50
+        k (int): number of players to keep per metric (more if there are ties). Default is 10
+
+    Returns: dictionary keyed by metric, each containing a Series of values indexed by player id, highest first
+    """
+    if not isinstance(bb_agg, pd.DataFrame) or not isinstance(k, int) or k < 1:
+        return math.nan
+
+    #Calculate every metric for every player, then drop players below the at bat threshold
+    metrics = pd.concat([bb_agg, get_rate_frame(bb_agg)], axis=1)
+    metrics = metrics.loc[(metrics["ab"] >= min_ab).to_numpy(), RECORD_KEYS]
+
+    #Negate so that the highest value comes first
+    values = -metrics.to_numpy(dtype="float64", na_value=np.nan)
+
+    board = {}
+    for j, key in enumerate(RECORD_KEYS):
+        rows = np.flatnonzero(~np.isnan(values[:, j]))
+        col = values[rows, j]
+        if len(rows) > k:
+            #Keep every player up to the k-th value, ties included; the rows stay in id order
+            kth = col[np.argpartition(col, k - 1)[k - 1]]
+            rows = rows[col <= kth]
+            col = col[col <= kth]
+        board[key] = metrics[key].iloc[rows[np.argsort(col, kind="stable")]]
+
+    return board
+
+def get_top_players(board, metric, n = 10):
+    """
+    Gets the top n players for one metric out of a leaderboard, including players tied with the n-th value.
+    Args:
+        board (dict): leaderboard from build_leaderboard
+        metric (str): name of the metric
+        n (int): number of players. Default is 10
+
+    Returns: Series of values indexed by player id, highest first
+    """
+    if not isinstance(board, dict) or metric not in board or not isinstance(n, int) or n < 1:
+        return math.nan
+
+    top = board[metric]
+    if len(top) <= n:
+        return top
+
+    return top[top >= top.iloc[n - 1]]
+
+def get_records(board):
+    """
+    Helper method that takes the record holder of every metric out of a leaderboard.
+    Args:
+        board (dict): leaderboard from build_leaderboard
+
+    Returns: dictionary containing the id and value of the record holder for every metric
+    """
+    if not isinstance(board, dict):
+        return math.nan
+
+    records = dict.fromkeys(RECORD_KEYS)
+    #I didn't want to use a for loop and instead use a list comprehension, but I was not sure
+    # how to structure it as bbstats["records"][key] = [list comprehension]
+    for key in records.keys():
+        records[key] = dict.fromkeys(["id", "value"])
+        if len(board[key]) > 0:
+            records[key]["id"] = board[key].index[0]
+            records[key]["value"] = board[key].iloc[0]
+
+    return records
+
+def get_highest_record(df, col):
+    """
+    Finds the index of the highest value in a specified column of a DataFrame. Record metrics of career totals
+    are read off build_leaderboard (without an at bat threshold); any other column is scanned once.
+    Args:
+        df (Pandas DataFrame or Pandas Series): DataFrame that contains the records
+        col (str): column in which you find the max value in
+
+    Returns: index of row containing max value
+    """
+    if not isinstance(col, str) or not isinstance(df, pd.DataFrame):
+        return math.nan
+
+    if col not in RECORD_KEYS or not all(c in df.columns for c in CAREER_COLS):
+        return (df[col].idxmax(), df[col].max())
+
+    top = build_leaderboard(df, min_ab=0, k=1)[col]
+    if len(top) == 0:
+        return (math.nan, math.nan)
+
+    return (top.index[0], top.iloc[0])
+
+def build_rollup_cube(df):
+    """
+    Builds a rollup cube of baseball rows in one pass: the count stats are added up per (year, team, lg, id),
+    which is about one cube row per player season. The sums are additive, so the summary of any slice of the
+    data (a year, a team, a league, or any mix of them) can be answered from the cube without reading the rows
+    again, see get_cube_summary and get_cube_rates. Only complete cases are added to the count stats, like
+    bbanalyze does; every row is counted in records, so the record and player counts match as well.
+    Args:
+        df (Pandas DataFrame): baseball rows, without the rowid column
+
+    Returns: DataFrame with the CUBE_KEYS columns, records (rows), complete (complete cases) and the CAREER_COLS
+        sums of the complete cases, sorted by the keys (rows without a key value come last)
+    """
+    if not isinstance(df, pd.DataFrame):
+        return math.nan
+
+    complete = df.notna().all(axis=1)
+    cube = pd.concat([df[CUBE_KEYS], df[CAREER_COLS].mask(~complete, 0, axis=0)], axis=1)
+    cube.insert(len(CUBE_KEYS), "records", np.ones(len(df), dtype=np.int64))
+    cube.insert(len(CUBE_KEYS) + 1, "complete", complete.to_numpy(dtype=np.int64))
+
+    return cube.groupby(CUBE_KEYS, dropna=False, observed=True, sort=True).sum().reset_index()
+
+def merge_rollup_cubes(cubes):
+    """
+    Helper method that adds up rollup cubes, for example the cubes of the chunks of a file, in one groupby.
+    Args:
+        cubes (list): rollup cubes from build_rollup_cube
+
+    Returns: the combined rollup cube, or None if there are no cubes
+    """
+    if len(cubes) == 0:
+        return None
+    if len(cubes) == 1:
+        return cubes[0]
+
+    merged = pd.concat(cubes, ignore_index=True)
+    return merged.groupby(CUBE_KEYS, dropna=False, observed=True, sort=True).sum().reset_index()
+
+def get_cube_slice(cube, year = None, team = None, lg = None, id = None):
+    """
+    Helper method that takes the rows of a rollup cube belonging to a slice. Every key is a value, a list of
+    values, or None for all of them.
+    Args:
+        cube (Pandas DataFrame or dict): rollup cube, or a query state of it from statQuery.init_stat_query (which
+            reuses the masks of earlier slices)
+        year, team, lg, id: keys of the slice. Default is None
+
+    Returns: DataFrame of the cube rows of the slice
+    """
+    predicates = []
+    for col, val in zip(CUBE_KEYS, [year, team, lg, id]):
+        if isinstance(val, (list, tuple, set, np.ndarray, pd.Index)):
+            predicates.append((col, "in", list(val)))
+        elif val is not None:
+            predicates.append((col, "==", val))
+
+    if len(predicates) == 0:
+        return cube["dat"] if isinstance(cube, dict) else cube
+    return get_subset(cube, predicates)
+
+def get_cube_summary(cube, year = None, team = None, lg = None, min_ab = 50, k = 10):
+    """
+    Answers the bbanalyze summary of a slice of the data from a rollup cube, as if bbanalyze was called on a
+    file holding only the rows of that slice. Career stats are the count sums per player within the slice, and
+    the rate stats of the leaderboard and records are calculated from them (see calc_rate_stats).
+    Args:
+        cube (Pandas DataFrame or dict): rollup cube from build_rollup_cube (or bbanalyze), or a query state of
+            it from statQuery.init_stat_query
+        year (int or list): year(s) of the slice. Default is None (all years)
+        team (str or list): team(s) of the slice. Default is None (all teams)
+        lg (str or list): league(s) of the slice. Default is None (all leagues)
+        min_ab (int): minimum at bats within the slice a player needs to be considered for a record. Default is 50
+        k (int): number of players kept per metric on the leaderboard. Default is 10
+
+    Returns: dictionary with record.count, complete.cases, years, player.count, team.count, league.count,
+        career, leaderboard and records, in the same format as bbanalyze
+    """
+    if not isinstance(cube, (pd.DataFrame, dict)):
+        return math.nan
+    dat = get_cube_slice(cube, year, team, lg)
+    if not isinstance(dat, pd.DataFrame):
+        return math.nan
+
+    summary = dict.fromkeys(["record.count", "complete.cases", "years", "player.count", "team.count",
+                             "league.count", "career", "leaderboard", "records"])
+    summary["record.count"] = int(dat["records"].sum())
+    summary["complete.cases"] = int(dat["complete"].sum())
+    if len(dat) > 0:
+        summary["years"] = (int(dat["year"].min()), int(dat["year"].max()))
+    summary["player.count"] = get_count(dat, "id")
+    summary["team.count"] = get_count(dat, "team")
+    summary["league.count"] = get_count(dat, "lg")
+
+    #Players who only have rows with missing values are not in the career stats, like in bbanalyze
+    done = dat.loc[(dat["complete"] > 0).to_numpy()]
+    summary["career"] = done.groupby("id", observed=True)[CAREER_COLS].sum()
+    summary["leaderboard"] = build_leaderboard(summary["career"], min_ab, k)
+    summary["records"] = get_records(summary["leaderboard"])
+
+    return summary
+
+def get_cube_rates(cube, by = "year", stats = None):
+    """
+    Rolls a rollup cube up to the given key columns and calculates the rate stats of every group from the
+    summed counts (see calc_rate_stats), for example the on base percentage of every team in every year.
+    Args:
+        cube (Pandas DataFrame): rollup cube from build_rollup_cube
+        by (str or list of str): key columns to group by, from CUBE_KEYS. Default is year
+        stats (list of str): rate stats to calculate, see RATE_STATS. Default is all of them
+
+    Returns: DataFrame indexed by the key columns with records, complete, player.count, the CAREER_COLS sums of
+        the complete cases and one column per rate stat
+    """
+    if not isinstance(cube, pd.DataFrame):
+        return math.nan
+    by = [by] if isinstance(by, str) else list(by)
+    if len(by) == 0 or not all(col in CUBE_KEYS for col in by):
+        return math.nan
+
+    groups = cube.groupby(by, observed=True, sort=True)
+    rollup = groups[["records", "complete"] + CAREER_COLS].sum()
+    rollup.insert(2, "player.count", groups["id"].nunique())
+
+    return pd.concat([rollup, get_rate_frame(rollup, stats)], axis=1)
+
 def get_dat_subset(df, col, val, com = "=="):
     """
     Helper method that takes a subset of data based on a specific value (ex: taking a
-    subset of all National League Baseball players)
+    subset of all National League Baseball players). The mask is built straight from the column (see
+    statQuery) instead of writing and parsing a df.query string.
     Args:
-        df (Pandas DataFrame): DataFrame that we are taking the subset out of
+        df (Pandas DataFrame or dict): DataFrame that we are taking the subset out of, or a query state from
+            statQuery.init_stat_query to reuse the masks of earlier subsets of the same DataFrame
         col (string): column name of the data subset we are extracting
-        val (string): what specific value from the subset that we are looking for
-        com (string): what comparison are we dealing with (==, >=, <=, etc.) Default is ==
+        val (string, number or list): what specific value from the subset that we are looking for (a list for
+            in and not in). Text may still be quoted the way df.query needed it ('"AL"'), and numbers may be
+            given as text ("50")
+        com (string): what comparison are we dealing with (==, !=, >=, <=, >, <, in, not in). Default is ==
 
     Returns: subset of database based on the id and value
     """
-    if (not isinstance(col, str) or not isinstance(val, str) or not isinstance(com,str)
-            or not isinstance(df, pd.DataFrame)):
+    if not isinstance(df, (pd.DataFrame, dict)) or not isinstance(col, str) or not isinstance(com, str):
         return math.nan
 
-    #was originally df.query(f'{col} == "{val}"), but I wanted to be able to include value > int and
-    # in the class example, there is no "" around the number, so I got rid of the "" in the statement
-    # and instead included it in the val string argument (ex: '"AL"').
-    return df.query(f'{col} {com} {val}')
+    #was originally df.query(f'{col} {com} {val}'), which needed the quotes around text values in the val
+    # string argument (ex: '"AL"'); those are taken off here so old calls keep working
+    if isinstance(val, str):
+        val = parse_query_value(val)
+
+    return get_subset(df, (col, com, val))
 
 def get_count(df, col):
     """
@@ -164,27 +1039,66 @@ def get_count(df, col):
     # playing multiple years.
     return df[col].nunique()
 
-def get_highest_record(df, col):
+def calc_rate_stats(df, stats = None):
     """
-    Finds the index of the highest value in a specified column of a DataFrame.
+    Rate stat kernel that calculates several rate stats in one pass. Every count column that is needed is
+    taken out of the DataFrame as a float NumPy array once, every shared sum (see RATE_TERMS) is calculated
+    once, and the results are written into one preallocated 2-D array. Division by zero gives inf or NaN,
+    the same as dividing the Series.
     Args:
-        df (Pandas DataFrame or Pandas Series): DataFrame that contains the records
-        col (str): column in which you find the max value in
+        df (Pandas DataFrame): DataFrame that contains the count stats
+        stats (list of str): rate stats to calculate, see RATE_STATS. Default is all of them
 
-    Returns: index of row containing max value
+    Returns: 2-D NumPy float array with one row per row of df and one column per stat
     """
-    if not isinstance(col, str) or not isinstance(df, pd.DataFrame):
+    if not isinstance(df, pd.DataFrame):
         return math.nan
+    if stats is None:
+        stats = list(RATE_STATS.keys())
+
+    arrays = {}
+    def get_array(name):
+        if name not in arrays:
+            if name in RATE_TERMS:
+                parts = RATE_TERMS[name]
+                total = get_array(parts[0]).copy()
+                for part in parts[1:]:
+                    total += get_array(part)
+                arrays[name] = total
+            else:
+                arrays[name] = df[name].to_numpy(dtype="float64", na_value=np.nan)
+        return arrays[name]
 
-    value = df[col].max()
-    id = df[col].idxmax()
+    #Fortran order so that each stat is one contiguous column
+    rates = np.empty((len(df), len(stats)), order="F")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for j, stat in enumerate(stats):
+            num, den = RATE_STATS[stat]
+            np.divide(get_array(num), get_array(den), out=rates[:, j])
 
-    return (id, value)
+    return rates
+
+def get_rate_frame(df, stats = None):
+    """
+    Helper method that calculates rate stats with calc_rate_stats and returns them as a DataFrame.
+    Args:
+        df (Pandas DataFrame): DataFrame that contains the count stats
+        stats (list of str): rate stats to calculate, see RATE_STATS. Default is all of them
+
+    Returns: DataFrame with the same index as df and one column per stat
+    """
+    if not isinstance(df, pd.DataFrame):
+        return math.nan
+    if stats is None:
+        stats = list(RATE_STATS.keys())
+
+    return pd.DataFrame(calc_rate_stats(df, stats), index=df.index, columns=stats)
 
 def calc_percentage_ab_stats(df, metric):
     """
     Method that calculates a metric as a percentage at bat and returns a series containing
-    the new calculations. Special calculations for sopa
+    the new calculations. Special calculations for sopa. Metrics listed in RATE_STATS are calculated by the
+    rate stat kernel (see calc_rate_stats).
     Args:
         df (Pandas DataFrame): DataFrame that contains the records
         metric (tuple of str): tuple containing the metric that is given as a percentage and the metric name
@@ -199,9 +1113,9 @@ def calc_percentage_ab_stats(df, metric):
     col = metric[0]
     key = metric[1]
 
-    if key == "sopa":
-        return pd.Series(df[col] / (df["ab"] + df["bb"] + df["hbp"] + df["sh"] + df["sf"]), name=key)
-    else:
+    if key in RATE_STATS and RATE_STATS[key][0] == col:
+        return get_rate_frame(df, [key])[key]
+    with np.errstate(divide="ignore", invalid="ignore"):
         return pd.Series(df[col] / df["ab"], name=key)
 
 def calc_obp(df):
@@ -216,7 +1130,7 @@ def calc_obp(df):
     if not isinstance(df, pd.DataFrame):
         return math.nan
 
-    return pd.Series((df["h"] + df["bb"] + df["hbp"]) / (df["ab"] + df["bb"] + df["hbp"]), name='obp')
+    return pd.Series(calc_rate_stats(df, ["obp"])[:, 0], index=df.index, name='obp')
 
 def calc_pab(df):
     """
@@ -230,6 +1144,5 @@ def calc_pab(df):
     if not isinstance(df, pd.DataFrame):
         return math.nan
 
-    return pd.Series((df["h"] + df["bb"] + df["hbp"] + df["sf"] + df["sh"]) /
-              (df["ab"] + df["bb"] + df["hbp"] + df["sf"] + df["sh"]), name='pab')
+    return pd.Series(calc_rate_stats(df, ["pab"])[:, 0], index=df.index, name='pab')
 
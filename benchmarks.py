@@ -0,0 +1,364 @@
+"""
+Benchmarks for the public functions of this project.
+
+Synthetic inputs are made by repeating the sample data (baseball.csv, words.csv, pistonrings.csv,
+coordinates.csv and the boiler_sample_*.csv files) 1, 10, 100 or 1000 times. Every benchmark is timed
+(best of --repeat runs), its peak Python memory is measured with tracemalloc, and the results are written
+as JSON. With --compare, the results are checked against a saved baseline and slower benchmarks are flagged.
+
+Examples:
+    python benchmarks.py --scales 1 10 --output bench.json
+    python benchmarks.py --scales 1 10 --compare bench.json --tolerance 0.25
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from analyzeWords import analyzeWords, analyzeWordsStream, analyzeWordsParallel
+from bbanalyze import bbanalyze, get_cube_summary
+from combineSamples import combineSamples
+from extractCoordinates import extractCoordinates
+from reformatSamples import reformatSamples
+from stationIndex import build_station_index, query_nearest
+from statQuery import init_stat_query, get_subset
+
+DEFAULT_SCALES = [1, 10, 100, 1000]
+
+def make_baseball(scale, workdir):
+    """
+    Writes a copy of baseball.csv with every row repeated scale times. Each copy gets its own player ids,
+    so the number of distinct players grows with the scale as well.
+    Args:
+        scale (int): number of copies
+        workdir (str): folder to write the file in
+
+    Returns: tuple of (name of the .csv file, number of rows)
+    """
+    path = os.path.join(workdir, f"baseball_x{scale}.csv")
+    bbdat = pd.read_csv("baseball.csv")
+    rows = len(bbdat) * scale
+    if not os.path.exists(path):
+        copies = []
+        for i in range(scale):
+            copy = bbdat.copy()
+            if i > 0:
+                copy["id"] = copy["id"] + f"_{i}"
+            copies.append(copy)
+        bbdat = pd.concat(copies, ignore_index=True)
+        bbdat["rowid"] = np.arange(1, len(bbdat) + 1)
+        bbdat.to_csv(path, index=False)
+
+    return (path, rows)
+
+def make_words(scale):
+    """
+    Repeats the words of words.csv scale times.
+    Args:
+        scale (int): number of copies
+
+    Returns: Series of words
+    """
+    words = pd.read_csv("words.csv")["x"]
+    return pd.Series(np.tile(words.to_numpy(), scale), name=words.name)
+
+def make_pistonrings(scale):
+    """
+    Repeats pistonrings.csv scale times, numbering the samples of each copy after the previous copy.
+    Args:
+        scale (int): number of copies
+
+    Returns: DataFrame with diameter, sample and trial columns
+    """
+    rings = pd.read_csv("pistonrings.csv")
+    num_samples = rings["sample"].max()
+    copies = [rings.assign(sample=rings["sample"] + i * num_samples) for i in range(scale)]
+    return pd.concat(copies, ignore_index=True)
+
+def make_coordinates(scale):
+    """
+    Repeats coordinates.csv scale times, numbering the stations of each copy after the previous copy.
+    Args:
+        scale (int): number of copies
+
+    Returns: DataFrame with station and coordinates columns
+    """
+    coords = pd.read_csv("coordinates.csv")
+    num_stations = coords["station"].max()
+    copies = [coords.assign(station=coords["station"] + i * num_stations) for i in range(scale)]
+    return pd.concat(copies, ignore_index=True)
+
+def make_boiler_samples(scale, workdir):
+    """
+    Copies the boiler_sample_*.csv files scale times into a folder of their own.
+    Args:
+        scale (int): number of copies
+        workdir (str): folder to make the sample folder in
+
+    Returns: name of the folder holding the sample files
+    """
+    path = os.path.join(workdir, f"boiler_x{scale}")
+    if not os.path.isdir(path):
+        os.makedirs(path)
+        sources = sorted(glob.glob("boiler_sample_*.csv"))
+        for i in range(scale):
+            for j, source in enumerate(sources):
+                shutil.copy(source, os.path.join(path, f"boiler_sample_{i * len(sources) + j + 1:07d}.csv"))
+
+    return path
+
+def get_team_year_subsets(bbdat):
+    """
+    Takes the rows of every team in every year of the 2000s, the way many small filters are made over the same
+    data.
+    Args:
+        bbdat (Pandas DataFrame): baseball data
+
+    Returns: number of subsets taken
+    """
+    query = init_stat_query(bbdat)
+    teams = bbdat["team"].dropna().unique()
+    for team in teams:
+        for year in range(2000, 2008):
+            get_subset(query, [("team", "==", team), ("year", "==", year)])
+
+    return len(teams) * 8
+
+def get_year_summaries(cube):
+    """
+    Answers the bbanalyze summary of every year of the 2000s from a rollup cube.
+    Args:
+        cube (Pandas DataFrame): rollup cube from bbanalyze
+
+    Returns: number of summaries made
+    """
+    query = init_stat_query(cube)
+    for year in range(2000, 2008):
+        get_cube_summary(query, year=year)
+
+    return 8
+
+def get_benchmarks(scale, workdir):
+    """
+    Lists the benchmarks of one scale. Nothing is made here: every benchmark has a setup function that makes its
+    inputs when the benchmark is run, and inputs shared by several benchmarks (like the scaled baseball file) are
+    only made once per scale, by the first benchmark that needs them.
+    Args:
+        scale (int): number of copies of the sample data
+        workdir (str): folder for the generated files
+
+    Returns: list of (name, setup, func); setup takes no arguments and gives (number of input rows, inputs), and
+        func takes the inputs and runs the benchmark once
+    """
+    inputs = {}
+
+    def shared(key, make):
+        if key not in inputs:
+            inputs[key] = make()
+        return inputs[key]
+
+    def baseball():
+        bb_file, bb_rows = shared("baseball", lambda: make_baseball(scale, workdir))
+        return (bb_rows, bb_file)
+
+    def baseball_cached():
+        #write the cache first so that the cached benchmark only times reading it
+        bb_rows, bb_file = baseball()
+        shared("baseball.cache", lambda: bbanalyze(bb_file))
+        return (bb_rows, bb_file)
+
+    def cube():
+        bb_file = baseball()[1]
+        cube = shared("cube", lambda: bbanalyze(bb_file, cube=True)["cube"])
+        return (len(cube), cube)
+
+    def baseball_frame():
+        bb_rows, bb_file = baseball()
+        return (bb_rows, shared("baseball.frame", lambda: pd.read_csv(bb_file)))
+
+    def words():
+        words = shared("words", lambda: make_words(scale))
+        return (len(words), words)
+
+    def rings():
+        rings = make_pistonrings(scale)
+        return (len(rings), rings)
+
+    def coords():
+        coords = shared("coords", lambda: make_coordinates(scale))
+        return (len(coords), coords)
+
+    def stations():
+        stations = shared("stations", lambda: extractCoordinates(coords()[1]))
+        return (len(stations), stations)
+
+    def station_index():
+        rows, found = stations()
+        index = shared("station.index", lambda: build_station_index(found))
+        rng = np.random.default_rng(0)
+        points = (rng.uniform(-60, 60, 1000), rng.uniform(-180, 180, 1000))
+        return (rows, (index, points))
+
+    def boiler():
+        return (25 * scale, shared("boiler", lambda: make_boiler_samples(scale, workdir)))
+
+    def boiler_cached():
+        #write the manifest first so that the cached benchmark only times reading it
+        rows, boiler_dir = boiler()
+        shared("boiler.manifest", lambda: combineSamples("boiler_sample_*.csv", boiler_dir))
+        return (rows, boiler_dir)
+
+    return [("bbanalyze", baseball, lambda bb_file: bbanalyze(bb_file, cache=False)),
+            ("bbanalyze.cached", baseball_cached, lambda bb_file: bbanalyze(bb_file)),
+            ("bbanalyze.compact", baseball, lambda bb_file: bbanalyze(bb_file, cache=False, compact=True)),
+            ("bbanalyze.chunked", baseball, lambda bb_file: bbanalyze(bb_file, chunksize=100000, keep_rows=False)),
+            ("statQuery.filters", baseball_frame, get_team_year_subsets),
+            ("bbanalyze.cube_summary", cube, get_year_summaries),
+            ("analyzeWords", words, analyzeWords),
+            ("analyzeWords.stream", words,
+             lambda words: analyzeWordsStream(words.iloc[i:i + 100000] for i in range(0, len(words), 100000))),
+            ("analyzeWords.parallel", words, analyzeWordsParallel),
+            ("reformatSamples", rings, reformatSamples),
+            ("extractCoordinates", coords, extractCoordinates),
+            ("stationIndex.build", stations, build_station_index),
+            ("stationIndex.nearest", station_index, lambda args: query_nearest(args[0], *args[1], k=5)),
+            ("combineSamples", boiler, lambda boiler_dir: combineSamples("boiler_sample_*.csv", boiler_dir,
+                                                                         cache=False)),
+            ("combineSamples.cached", boiler_cached, lambda boiler_dir: combineSamples("boiler_sample_*.csv",
+                                                                                       boiler_dir))]
+
+def time_benchmark(func, repeat):
+    """
+    Times a benchmark and measures its peak memory. The timing runs come first so tracemalloc does not slow
+    them down; one more run is made with tracemalloc on to get the peak memory.
+    Args:
+        func (function): benchmark taking no arguments
+        repeat (int): number of timed runs
+
+    Returns: tuple of (best time in seconds, peak memory in bytes)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return (min(times), peak)
+
+def run_benchmarks(scales, repeat = 3, workdir = None, only = None):
+    """
+    Runs every benchmark at every scale.
+    Args:
+        scales (list of int): scales to run
+        repeat (int): number of timed runs per benchmark. Default is 3
+        workdir (str): folder for the generated files. Default is None (a temporary folder)
+        only (list of str): if given, only run benchmarks whose names start with one of these. Default is None
+
+    Returns: dictionary containing meta (environment) and results (one dictionary per benchmark and scale)
+    """
+    cleanup = workdir is None
+    if cleanup:
+        workdir = tempfile.mkdtemp(prefix="benchmarks.")
+    else:
+        os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    try:
+        for scale in scales:
+            for name, setup, func in get_benchmarks(scale, workdir):
+                #skipped benchmarks never run their setup, so none of their inputs are made
+                if only and not any(name.startswith(prefix) for prefix in only):
+                    continue
+                rows, data = setup()
+                seconds, peak = time_benchmark(lambda: func(data), repeat)
+                results.append({"name": name, "scale": scale, "rows": rows, "seconds": seconds,
+                                "peak_bytes": peak})
+                print(f"{name:<24}x{scale:<6}{rows:>12} rows {seconds:>10.4f} s {peak / 2**20:>10.1f} MiB")
+    finally:
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    meta = {"date": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "pandas": pd.__version__, "numpy": np.__version__, "platform": platform.platform(),
+            "repeat": repeat}
+
+    return {"meta": meta, "results": results}
+
+def compare_results(baseline, current, tolerance = 0.2):
+    """
+    Compares benchmark results against a baseline. A benchmark is a regression when its time or its peak memory
+    grew by more than the tolerance.
+    Args:
+        baseline (dict): results from run_benchmarks (or read from its JSON file)
+        current (dict): results from run_benchmarks
+        tolerance (float): allowed relative growth, 0.2 means 20%. Default is 0.2
+
+    Returns: list of dictionaries, one per benchmark found in both, with the ratios and a regression flag
+    """
+    old = {(r["name"], r["scale"]): r for r in baseline["results"]}
+
+    report = []
+    for result in current["results"]:
+        key = (result["name"], result["scale"])
+        if key not in old:
+            continue
+        time_ratio = result["seconds"] / old[key]["seconds"] if old[key]["seconds"] > 0 else math.inf
+        memory_ratio = result["peak_bytes"] / old[key]["peak_bytes"] if old[key]["peak_bytes"] > 0 else math.inf
+        report.append({"name": result["name"], "scale": result["scale"], "time_ratio": time_ratio,
+                       "memory_ratio": memory_ratio,
+                       "regression": time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance})
+
+    return report
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Benchmark the public functions on scaled synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES,
+                        help="copies of the sample data to benchmark (default: 1 10 100 1000)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark (default: 3)")
+    parser.add_argument("--only", nargs="+", help="only run benchmarks whose names start with these")
+    parser.add_argument("--workdir", help="folder for the generated inputs (default: a temporary folder)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare the results against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown or memory growth before flagging (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(args.scales, args.repeat, args.workdir, args.only)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report = compare_results(baseline, current, args.tolerance)
+        for row in report:
+            flag = "REGRESSION" if row["regression"] else "ok"
+            print(f"{row['name']:<24}x{row['scale']:<6} time x{row['time_ratio']:.2f} "
+                  f"memory x{row['memory_ratio']:.2f}  {flag}")
+        if any(row["regression"] for row in report):
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
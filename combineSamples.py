@@ -0,0 +1,243 @@
+import glob
+import io
+import json
+import math
+import os
+import tempfile
+from stat import S_ISREG
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# File in the sample folder holding the parsed rows of every sample file already read, as JSON
+MANIFEST_NAME = ".combineSamples.manifest"
+# Version of the manifest layout; manifests of another version are ignored and rewritten
+MANIFEST_VERSION = 2
+
+def combineSamples(pattern, path = ".", control_samples = 10, workers = None, cache = True):
+    """
+    Function that combines sample files (for example boiler_sample_01.csv .. boiler_sample_25.csv, each
+    holding the measurements of one sample as a row with a blank first column and t1 .. t8 columns) into one
+    data frame, and splits it into control samples and test samples.
+
+    Args:
+        pattern (str): glob pattern of the sample files, like "boiler_sample_*.csv"
+        path (str): folder holding the sample files. Default is "."
+        control_samples (int): number of samples (the first ones, in file order) used as control samples.
+            Default is 10
+        workers (int): number of threads reading the files. Default is None (chosen by ThreadPoolExecutor)
+        cache (bool): keep the parsed rows of the files in a manifest in the folder (MANIFEST_NAME), keyed by
+            their path below path, and only read the files that are new or changed (by size or modification time)
+            since the last call. Default is True
+
+    Returns: dictionary containing:
+                - pattern
+                - path
+                - control_samples
+                - filenames (names of the sample files, in the order glob found them)
+                - files (number of sample files)
+                - samples (data frame with a sample column, numbering the files from 1, and the measurements)
+                - control (first control_samples rows of samples)
+                - test (rest of the rows of samples)
+    """
+    if not isinstance(pattern, str) or not isinstance(path, str):
+        return math.nan
+    if not isinstance(control_samples, int) or control_samples < 0:
+        return math.nan
+
+    #One stat pass: it finds the regular files and gives the size and modification time of every file
+    pathnames = []
+    stamps = []
+    for f in glob.glob(os.path.join(path, pattern)):
+        stat = os.stat(f)
+        if S_ISREG(stat.st_mode):
+            pathnames.append(f)
+            stamps.append((stat.st_size, stat.st_mtime_ns))
+
+    combined = dict.fromkeys(["pattern", "path", "control_samples", "filenames", "files", "samples", "control",
+                              "test"])
+    combined["pattern"] = pattern
+    combined["path"] = path
+    combined["control_samples"] = control_samples
+    combined["filenames"] = [os.path.basename(f) for f in pathnames]
+    combined["files"] = len(pathnames)
+
+    if cache:
+        parsed = read_cached_sample_files(path, pathnames, stamps, workers)
+    else:
+        parsed = read_sample_files(pathnames, workers)
+
+    combined["samples"] = combine_sample_files(parsed)
+    combined["control"] = combined["samples"].iloc[:control_samples]
+    combined["test"] = combined["samples"].iloc[control_samples:]
+
+    return combined
+
+def read_sample_files(pathnames, workers = None):
+    """
+    Helper method that reads sample files with read_sample_file. The files are tiny, so the time goes into
+    opening and reading them; threads overlap that waiting.
+    Args:
+        pathnames (list): names of the sample files
+        workers (int): number of threads reading the files. Default is None (chosen by ThreadPoolExecutor)
+
+    Returns: list of the results of read_sample_file, in the order of pathnames
+    """
+    if len(pathnames) <= 1:
+        return [read_sample_file(f) for f in pathnames]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(read_sample_file, pathnames))
+
+def read_cached_sample_files(path, pathnames, stamps, workers = None):
+    """
+    Helper method that reads sample files through the manifest of their folder: only the files that are not in
+    the manifest, or whose size or modification time changed, are read, and the manifest is updated. Files are
+    keyed by their path below the folder, so files with the same name in different subfolders are kept apart.
+    Files with a layout that read_sample_file cannot split are read every time.
+    Args:
+        path (str): folder holding the sample files
+        pathnames (list): names of the sample files
+        stamps (list): (size, modification time) of every file
+        workers (int): number of threads reading the files. Default is None
+
+    Returns: list of the results of read_sample_file, in the order of pathnames
+    """
+    manifest = read_manifest(path)
+    names = [os.path.relpath(f, path) for f in pathnames]
+    stale = [i for i, (name, stamp) in enumerate(zip(names, stamps))
+             if name not in manifest or manifest[name]["stamp"] != list(stamp) or manifest[name]["data"] is None]
+
+    parsed = [None if name not in manifest else manifest[name]["data"] for name in names]
+    changed = False
+    for i, entry in zip(stale, read_sample_files([pathnames[i] for i in stale], workers)):
+        parsed[i] = entry
+        #Only the split text of a file is kept; a data frame read with pandas is not
+        data = list(entry) if isinstance(entry, tuple) else None
+        changed |= manifest.get(names[i]) != {"stamp": list(stamps[i]), "data": data}
+        manifest[names[i]] = {"stamp": list(stamps[i]), "data": data}
+    parsed = [tuple(p) if isinstance(p, list) else p for p in parsed]
+
+    #Files that are gone are dropped from the manifest; the files this call found are known to be there
+    found = set(names)
+    deleted = [name for name in manifest if name not in found and not os.path.isfile(os.path.join(path, name))]
+    for name in deleted:
+        del manifest[name]
+    if changed or len(deleted) > 0:
+        write_manifest(path, manifest)
+
+    return parsed
+
+def read_manifest(path):
+    """
+    Helper method that reads the manifest of a sample folder.
+    Args:
+        path (str): folder holding the sample files
+
+    Returns: dictionary of {"stamp": [size, mtime_ns], "data": [column names, number of rows, measurement text] or
+        None} keyed by the path of the file below path; empty if there is no manifest or it cannot be read
+    """
+    try:
+        with open(os.path.join(path, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest["files"]
+
+def write_manifest(path, manifest):
+    """
+    Helper method that saves the manifest of a sample folder. It is written to a temporary file first and then
+    renamed, so a manifest is never half written. Nothing is saved (and no error is raised) if the folder cannot
+    be written.
+    Args:
+        path (str): folder holding the sample files
+        manifest (dict): manifest as returned by read_manifest
+
+    Returns: True if the manifest was written, False otherwise
+    """
+    try:
+        fd, tmp_name = tempfile.mkstemp(prefix=MANIFEST_NAME + ".", dir=path)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": manifest}, f)
+        os.replace(tmp_name, os.path.join(path, MANIFEST_NAME))
+    except OSError:
+        return False
+
+    return True
+
+def read_sample_file(pathname):
+    """
+    Helper method that splits a sample file into its column names and the text of its measurements (the
+    values of all rows joined by commas, which keeps the manifest small), without pandas. Only the simple layout of the sample files is handled this way: a header line of quoted names
+    starting with a blank one, then rows starting with a quoted row name followed by unquoted values. Files with
+    another layout are read with pandas.
+    Args:
+        pathname (str): name of the sample file
+
+    Returns: tuple of (column names, number of rows, measurement text), or a data frame for other layouts
+    """
+    with open(pathname, "r", newline="") as f:
+        lines = f.read().splitlines()
+
+    header = lines[0].split(",") if len(lines) > 0 else []
+    rows = [line.split(",")[1:] for line in lines[1:] if line != ""]
+    simple = len(header) >= 2 and header[0] == '""' and \
+        all(len(h) > 2 and h[0] == h[-1] == '"' for h in header[1:]) and \
+        all(len(row) == len(header) - 1 and all(value != "" and '"' not in value for value in row) for row in rows)
+    if not simple:
+        return pd.read_csv(pathname, index_col=0)
+
+    return ([h[1:-1] for h in header[1:]], len(rows), ",".join(",".join(row) for row in rows))
+
+def combine_sample_files(parsed):
+    """
+    Helper method that puts the rows of all sample files into one data frame. When every file had the simple
+    layout with the same columns, all the measurement text is converted to numbers at once into a single array;
+    otherwise every file is made into a data frame of its own and they are put together with pandas.
+    Args:
+        parsed (list): result of read_sample_file for every file, in file order
+
+    Returns: data frame with a sample column (number of the file, from 1) and the measurement columns
+    """
+    simple = len(parsed) > 0 and all(isinstance(p, tuple) and p[0] == parsed[0][0] for p in parsed)
+    values = None
+    if simple:
+        columns = parsed[0][0]
+        counts = [p[1] for p in parsed]
+        tokens = ",".join(p[2] for p in parsed if p[1] > 0).split(",") if sum(counts) > 0 else []
+        #Integers stay integers, like pd.read_csv would read them
+        for dtype in [np.int64, np.float64]:
+            try:
+                values = np.array(tokens, dtype=dtype).reshape(sum(counts), len(columns))
+                break
+            except ValueError:
+                continue
+
+    if values is None:
+        frames = [p if isinstance(p, pd.DataFrame) else get_text_frame(p) for p in parsed]
+        counts = [len(frame) for frame in frames]
+        #Files without rows would turn numeric columns into text columns, so they are left out
+        frames = [frame for frame in frames if len(frame) > 0] or frames[:1]
+        samples = pd.concat(frames, ignore_index=True) if len(frames) > 0 else pd.DataFrame()
+    else:
+        samples = pd.DataFrame(values, columns=columns, copy=False)
+
+    samples.insert(0, "sample", np.repeat(np.arange(1, len(counts) + 1), counts))
+    return samples
+
+def get_text_frame(parsed):
+    """
+    Helper method that makes a data frame out of the text of a sample file split by read_sample_file, parsing
+    it with pandas as if the file was read with pd.read_csv.
+    """
+    columns, count, values = parsed
+    tokens = values.split(",") if count > 0 else []
+    width = len(columns)
+    text = ",".join(['""'] + ['"' + col + '"' for col in columns]) + "\n" + \
+        "".join('"",' + ",".join(tokens[i:i + width]) + "\n" for i in range(0, len(tokens), width))
+
+    return pd.read_csv(io.StringIO(text), index_col=0)
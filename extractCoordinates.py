@@ -0,0 +1,212 @@
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+# Number of coordinate strings turned into a byte matrix at a time, so the matrix stays small for big columns
+BLOCK_SIZE = 1 << 16
+
+# Pattern of a well-formed coordinate string, used for the entries the byte parser does not handle
+COORDINATE_PATTERN = re.compile(r"^\s*\(\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*,"
+                                r"\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*\)\s*$")
+
+# Bytes that can be part of a clean block of coordinate strings (see parse_clean_block)
+CLEAN_BYTES = np.zeros(256, dtype=bool)
+CLEAN_BYTES[np.frombuffer(b"0123456789+-. (,)\n", dtype=np.uint8)] = True
+
+# Powers of ten used to put the digits of a number together; with at most 15 digits the number is below 2**53,
+# so it is exact as a float64 before it is divided
+POW10 = 10 ** np.arange(16, dtype=np.int64)
+
+def extractCoordinates(dat):
+    """
+    Function that extracts the latitude and longitude of every station from coordinate strings like
+    "(-21.2, -113.8)".
+
+    Args:
+        dat (Pandas DataFrame): data frame with a station column and a coordinates column
+
+    Returns: data frame with station, lat and lon columns (with the index of dat); entries that cannot
+        be parsed get NaN, and their number is in attrs["parse.failures"]. Returns -1 if there is no station
+        column, and -2 if there is no coordinates column
+    """
+    if not isinstance(dat, pd.DataFrame):
+        return math.nan
+    if "station" not in dat.columns:
+        return -1
+    if "coordinates" not in dat.columns:
+        return -2
+
+    latitude, longitude = parse_coordinates(dat["coordinates"])
+
+    coords = pd.DataFrame({"station": dat["station"], "lat": latitude, "lon": longitude}, index=dat.index)
+    coords.attrs["parse.failures"] = int(np.isnan(latitude).sum())
+
+    return coords
+
+def parse_coordinates(coordinates):
+    """
+    Parses a column of coordinate strings into two float64 arrays. The strings are parsed as bytes with NumPy a
+    block at a time; only the entries the byte parser does not handle (non-ASCII text, exponents, very long
+    numbers) are tried with COORDINATE_PATTERN.
+    Args:
+        coordinates (Pandas Series): coordinate strings
+
+    Returns: tuple of (latitude, longitude) NumPy arrays, NaN where an entry could not be parsed
+    """
+    values = coordinates.to_numpy(dtype=object)
+    latitude = np.full(len(values), np.nan)
+    longitude = np.full(len(values), np.nan)
+    if pd.api.types.is_string_dtype(coordinates.dtype) and coordinates.dtype != object:
+        text = coordinates.notna().to_numpy()
+    else:
+        text = np.array([isinstance(v, str) for v in values], dtype=bool)
+
+    for start in range(0, len(values), BLOCK_SIZE):
+        block = np.where(text[start:start + BLOCK_SIZE], values[start:start + BLOCK_SIZE], "")
+        lat, lon, ok = parse_coordinate_block(block)
+        latitude[start:start + len(block)] = lat
+        longitude[start:start + len(block)] = lon
+
+        for i in np.flatnonzero(text[start:start + BLOCK_SIZE] & ~ok):
+            match = COORDINATE_PATTERN.match(block[i])
+            if match:
+                latitude[start + i] = float(match.group(1))
+                longitude[start + i] = float(match.group(2))
+
+    return (latitude, longitude)
+
+def parse_coordinate_block(strings):
+    """
+    Helper method that parses a block of coordinate strings with NumPy. The strings are joined into one byte
+    buffer (one line per string), and every byte is tagged with its row. A string is accepted when it is
+    "(" number "," number ")" with optional spaces around every part, where a number is an optional sign and up
+    to 15 digits with an optional decimal point.
+    Args:
+        strings (NumPy array): array of strings
+
+    Returns: tuple of (latitude, longitude, accepted) NumPy arrays
+    """
+    n = len(strings)
+    buffer = "\n".join(strings).encode("ascii", errors="replace")
+    codes = np.frombuffer(buffer, dtype=np.uint8)
+    is_sep = codes == ord("\n")
+    if is_sep.sum() != max(n - 1, 0):
+        #Some strings hold a line break themselves; those are left to the pattern
+        breaks = np.array(["\n" in v for v in strings], dtype=bool)
+        lat, lon, ok = parse_coordinate_block(np.where(breaks, "", strings))
+        return (lat, lon, ok & ~breaks)
+
+    clean = parse_clean_block(buffer, codes, n)
+    if clean is not None:
+        return (clean[0], clean[1], np.ones(n, dtype=bool))
+
+    row = np.cumsum(is_sep)
+    pos = np.arange(len(codes))
+
+    #Exactly one of each bracket and one comma, in that order, with only spaces outside the brackets
+    marks = {}
+    ok = np.ones(n, dtype=bool)
+    for mark in "(,)":
+        found = codes == ord(mark)
+        ok &= np.bincount(row[found], minlength=n) == 1
+        marks[mark] = np.zeros(n, dtype=np.int64)
+        marks[mark][row[found]] = pos[found]
+    ok &= (marks["("] < marks[","]) & (marks[","] < marks[")"])
+    outside = (pos < marks["("][row]) | (pos > marks[")"][row])
+    ok &= np.bincount(row[outside & ~is_sep & (codes != ord(" "))], minlength=n) == 0
+
+    #Each row has two fields (segments 2 * row and 2 * row + 1): between "(" and ",", and between "," and ")"
+    in_lat = (pos > marks["("][row]) & (pos < marks[","][row])
+    in_lon = (pos > marks[","][row]) & (pos < marks[")"][row])
+    inside = in_lat | in_lon
+    values, seg_ok = parse_number_fields(codes[inside], pos[inside], 2 * row[inside] + in_lon[inside], 2 * n)
+    ok &= seg_ok[0::2] & seg_ok[1::2]
+
+    return (np.where(ok, values[0::2], np.nan), np.where(ok, values[1::2], np.nan), ok)
+
+def parse_clean_block(buffer, codes, n):
+    """
+    Helper method that parses a block in which every string is well formed, the usual case. The block is checked
+    as a whole: only CLEAN_BYTES, brackets and commas in the order "(,)" on every line, and only spaces outside
+    the brackets. The numbers are then split out of the buffer and converted by NumPy in one call per column.
+    Args:
+        buffer (bytes): the strings of the block joined by line breaks
+        codes (NumPy array): buffer as a uint8 array
+        n (int): number of strings
+
+    Returns: tuple of (latitude, longitude) NumPy arrays, or None if the block is not clean
+    """
+    if n == 0 or not CLEAN_BYTES[codes].all():
+        return None
+
+    is_open = codes == ord("(")
+    is_close = codes == ord(")")
+    is_mark = is_open | is_close | (codes == ord(",")) | (codes == ord("\n"))
+    if not np.array_equal(codes[is_mark], np.frombuffer(b"(,)\n" * n, dtype=np.uint8)[:-1]):
+        return None
+    outside = np.cumsum(is_open, dtype=np.int32) == np.cumsum(is_close, dtype=np.int32)
+    if (outside & ~is_mark & (codes != ord(" "))).any():
+        return None
+
+    #Every line splits into the text before "(", the latitude, the longitude and the text after ")"
+    tokens = buffer.translate(bytes.maketrans(b"()\n", b",,,")).split(b",")
+    try:
+        latitude = np.array(tokens[1::4]).astype(np.float64)
+        longitude = np.array(tokens[2::4]).astype(np.float64)
+    except ValueError:
+        return None
+
+    return (latitude, longitude)
+
+def parse_number_fields(codes, pos, seg, num_segs):
+    """
+    Helper method that parses the numbers held by segments of a byte buffer. The digits of a number are put
+    together into one integer, which is divided by a power of ten for the decimals, so the result is rounded the
+    same way as float() would.
+    Args:
+        codes (NumPy array): bytes of all segments
+        pos (NumPy array): position of every byte in the buffer (increasing)
+        seg (NumPy array): segment of every byte (never decreasing)
+        num_segs (int): number of segments
+
+    Returns: tuple of (values, accepted) NumPy arrays with one entry per segment
+    """
+    is_digit = (codes >= ord("0")) & (codes <= ord("9"))
+    is_dot = codes == ord(".")
+    is_sign = (codes == ord("-")) | (codes == ord("+"))
+    solid = codes != ord(" ")
+
+    #The characters that are not spaces must be one run: a sign first, then digits with at most one dot
+    first = np.zeros(num_segs, dtype=np.int64)
+    last = np.zeros(num_segs, dtype=np.int64)
+    first[seg[solid][::-1]] = pos[solid][::-1]
+    last[seg[solid]] = pos[solid]
+    count = np.bincount(seg[solid], minlength=num_segs)
+    digits = np.bincount(seg[is_digit], minlength=num_segs)
+    signs = np.bincount(seg[is_sign], minlength=num_segs)
+    ok = (count > 0) & (last - first + 1 == count)
+    ok &= np.bincount(seg[~(is_digit | is_dot | is_sign | ~solid)], minlength=num_segs) == 0
+    ok &= (np.bincount(seg[is_dot], minlength=num_segs) <= 1) & (digits > 0) & (digits < len(POW10))
+    sign_at = np.zeros(num_segs, dtype=np.int64)
+    sign_at[seg[is_sign]] = pos[is_sign]
+    ok &= (signs == 0) | ((signs == 1) & (sign_at == first))
+
+    #Every digit is worth a power of ten given by the number of digits after it in its segment
+    digit_seg = seg[is_digit]
+    rank = np.arange(len(digit_seg)) - np.repeat(np.cumsum(digits) - digits, digits)
+    digits_after = np.minimum(digits[digit_seg] - rank - 1, len(POW10) - 1)
+    mantissa = np.bincount(digit_seg, weights=(codes[is_digit] - ord("0")) * POW10[digits_after].astype(np.float64),
+                           minlength=num_segs)
+
+    dot_at = np.full(num_segs, pos[-1] + 1 if len(pos) > 0 else 0, dtype=np.int64)
+    dot_at[seg[is_dot]] = pos[is_dot]
+    decimals = np.bincount(digit_seg[pos[is_digit] > dot_at[digit_seg]], minlength=num_segs)
+    negative = np.zeros(num_segs, dtype=bool)
+    negative[seg[codes == ord("-")]] = True
+
+    values = mantissa / POW10[np.minimum(decimals, len(POW10) - 1)].astype(np.float64)
+    values = np.where(negative, -values, values)
+
+    return (values, ok)
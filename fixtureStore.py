@@ -0,0 +1,407 @@
+"""
+Store of the expected results used by the tests.
+
+Every expected object (data frames, Series, NumPy arrays, and dicts, lists and scalars holding them) is saved as
+columnar .npy arrays plus a small JSON index describing how to put them back together, in a folder next to the
+tests (FIXTURE_FOLDER). Loading a key only memory-maps the arrays of that key, and the index is read once per
+process, so a test does not pay for the keys it does not use and loading a key again costs next to nothing.
+Unlike the shelve files this replaces, nothing is pickled, so the store does not depend on the pandas or NumPy
+version.
+
+The store is made once from the old shelve files:
+    python fixtureStore.py --shelf expected_results
+"""
+import argparse
+import json
+import math
+import os
+import shelve
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Folder holding the expected results of the tests
+FIXTURE_FOLDER = "expected_results.fixtures"
+# Name of the JSON index in the folder
+INDEX_NAME = "index.json"
+# Version of the store layout; stores of another version are not read
+STORE_VERSION = 1
+
+# Index and array layouts of every store read by this process, keyed by folder
+STORE_CACHE = {}
+
+# Type and keys (or columns) the tests expect of every expected object, checked before a shelf is converted
+FIXTURE_SHAPES = {"analyzeWords": (dict, ["letter_counts", "max_char", "size_counts", "oo_count", "oo_words",
+                                          "words_6plus_count", "words_6plus"]),
+                  "bbanalyze": (dict, ["record.count", "complete.cases", "bb", "nl", "al", "records"]),
+                  "bbanalyze.2005": (dict, ["record.count", "complete.cases", "bb", "nl", "al", "records"]),
+                  "combineSamples": (dict, ["samples"]),
+                  "combineSamples.default": (dict, ["control_samples"]),
+                  "extractCoordinates": (pd.DataFrame, ["station", "lat", "lon"]),
+                  "reformatSamples": (pd.DataFrame, ["sample"])}
+
+def load_fixture(key, path = FIXTURE_FOLDER):
+    """
+    Loads one expected object from the fixture store. Its arrays are memory-mapped copy-on-write, so only the
+    data the test uses is read from disk, and the index and array layouts are cached for the process. The objects
+    are made again on every call, so a test changing its expected object does not change it for the next test.
+    Args:
+        key (str): name of the expected object
+        path (str): folder of the fixture store. Default is FIXTURE_FOLDER
+
+    Returns: the expected object; raises KeyError if the store has no such key
+    """
+    store = get_store(path)
+    if key not in store["index"]["keys"]:
+        raise KeyError(key)
+
+    return decode_value(store, store["index"]["keys"][key])
+
+def fixture_keys(path = FIXTURE_FOLDER):
+    """
+    Lists the keys of the fixture store.
+    Args:
+        path (str): folder of the fixture store. Default is FIXTURE_FOLDER
+
+    Returns: list of keys
+    """
+    return list(get_store(path)["index"]["keys"])
+
+def save_fixtures(objects, path = FIXTURE_FOLDER):
+    """
+    Saves expected objects as a fixture store, replacing the store in the folder if there is one. The store is
+    written to a temporary folder first and then renamed, so a store is never half written.
+    Args:
+        objects (dict): expected objects keyed by name
+        path (str): folder of the fixture store. Default is FIXTURE_FOLDER
+
+    Returns: list of the keys saved; raises TypeError if an object holds something that cannot be stored
+    """
+    if not isinstance(objects, dict):
+        return math.nan
+
+    path = os.path.abspath(path)
+    tmp_path = tempfile.mkdtemp(prefix=os.path.basename(path) + ".", dir=os.path.dirname(path))
+    try:
+        os.chmod(tmp_path, 0o755)
+        writer = {"path": tmp_path, "count": 0}
+        keys = {}
+        for key, value in objects.items():
+            keys[str(key)] = encode_value(writer, value)
+        with open(os.path.join(tmp_path, INDEX_NAME), "w") as f:
+            json.dump({"version": STORE_VERSION, "keys": keys}, f, indent=1)
+
+        if os.path.isdir(path):
+            old_path = tempfile.mkdtemp(prefix=os.path.basename(path) + ".old.", dir=os.path.dirname(path))
+            os.replace(path, os.path.join(old_path, "store"))
+            os.replace(tmp_path, path)
+            shutil.rmtree(old_path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    STORE_CACHE.pop(path, None)
+    return list(keys)
+
+def convertShelve(shelf = "expected_results", path = FIXTURE_FOLDER):
+    """
+    Function that converts the shelve files of the expected results (shelf.dat, shelf.dir and shelf.bak) into a
+    fixture store. Entries that cannot be unpickled or stored are reported and left out. Every entry is checked
+    against the shape the tests expect of its key (FIXTURE_SHAPES); an entry saved under the wrong key is stored
+    under the one key whose shape it has, if no other entry has that key, and is left out otherwise.
+
+    Args:
+        shelf (str): name of the shelve files, without extension. Default is "expected_results"
+        path (str): folder of the fixture store to write. Default is FIXTURE_FOLDER
+
+    Returns: dictionary containing:
+                - converted (keys written to the store)
+                - renamed (key each entry saved under the wrong key was stored as, keyed by its key in the shelf)
+                - failed (error message of every key that could not be converted, keyed by key)
+    """
+    if not isinstance(shelf, str) or not isinstance(path, str):
+        return math.nan
+
+    objects = {}
+    renamed = {}
+    failed = {}
+    with shelve.open(shelf, flag="r") as db:
+        for key in list(db.keys()):
+            try:
+                objects[key] = db[key]
+            except Exception as e:
+                failed[key] = f"{type(e).__name__}: {e}"
+
+    #Objects that cannot be stored are dropped one at a time, so the rest of them still make it into the store
+    for key in list(objects):
+        try:
+            encode_value({"path": None, "count": 0}, objects[key])
+        except TypeError as e:
+            failed[key] = f"{type(e).__name__}: {e}"
+            del objects[key]
+
+    for key in [k for k in objects if not has_fixture_shape(k, objects[k])]:
+        value = objects.pop(key)
+        matches = [k for k in FIXTURE_SHAPES if k not in objects and has_fixture_shape(k, value)]
+        if len(matches) == 1:
+            objects[matches[0]] = value
+            renamed[key] = matches[0]
+        else:
+            failed[key] = f"ValueError: {type(value).__name__} does not have the shape expected of {key}"
+
+    return {"converted": save_fixtures(objects, path), "renamed": renamed, "failed": failed}
+
+def has_fixture_shape(key, value):
+    """
+    Helper method that checks that an expected object has the type and keys (or columns) that the tests expect of
+    its key, see FIXTURE_SHAPES. Keys that are not listed are not checked.
+    """
+    if key not in FIXTURE_SHAPES:
+        return True
+
+    kind, names = FIXTURE_SHAPES[key]
+    if not isinstance(value, kind):
+        return False
+    found = value.columns if isinstance(value, pd.DataFrame) else value
+    return all(name in found for name in names)
+
+def get_store(path):
+    """
+    Helper method that gives the cached index and arrays of a fixture store, reading the index the first time
+    (and again if the store was written since)
+    """
+    path = os.path.abspath(path)
+    index_name = os.path.join(path, INDEX_NAME)
+    stamp = os.stat(index_name).st_mtime_ns
+
+    store = STORE_CACHE.get(path)
+    if store is None or store["stamp"] != stamp:
+        with open(index_name) as f:
+            index = json.load(f)
+        if index.get("version") != STORE_VERSION:
+            raise ValueError(f"fixture store {path} has version {index.get('version')}, expected {STORE_VERSION}")
+        store = {"path": path, "stamp": stamp, "index": index, "arrays": {}}
+        STORE_CACHE[path] = store
+
+    return store
+
+def get_array(store, name):
+    """
+    Helper method that memory-maps an array of a fixture store. The layout of the array is read from its file
+    once per process; every call maps it again copy-on-write, so changes to the array stay in that call's objects
+    and never reach the file, while the pages nobody changes are shared through the operating system's cache.
+    """
+    if name not in store["arrays"]:
+        with open(os.path.join(store["path"], name), "rb") as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            store["arrays"][name] = (shape, "F" if fortran_order else "C", dtype, f.tell())
+
+    shape, order, dtype, offset = store["arrays"][name]
+    if math.prod(shape) == 0:
+        return np.zeros(shape, dtype=dtype, order=order)
+    return np.memmap(os.path.join(store["path"], name), dtype=dtype, mode="c", offset=offset, shape=shape,
+                     order=order)
+
+def put_array(writer, values):
+    """
+    Helper method that saves a NumPy array (no object dtype) into the store being written, and gives its file name
+    """
+    name = f"{writer['count']}.npy"
+    writer["count"] += 1
+    if writer["path"] is not None:
+        np.save(os.path.join(writer["path"], name), np.ascontiguousarray(values), allow_pickle=False)
+    return name
+
+def encode_value(writer, value):
+    """
+    Helper method that saves an expected object into the store being written.
+    Args:
+        writer (dict): folder of the store (None to only check the object) and number of arrays written so far
+        value: object to save
+
+    Returns: JSON description of the object
+    """
+    if isinstance(value, pd.DataFrame):
+        return {"type": "frame", "columns": [encode_array(writer, value.iloc[:, j].array)
+                                             for j in range(value.shape[1])],
+                "column_index": encode_index(writer, value.columns), "index": encode_index(writer, value.index),
+                "attrs": encode_value(writer, dict(value.attrs))}
+    if isinstance(value, pd.Series):
+        return {"type": "series", "values": encode_array(writer, value.array), "name": encode_value(writer, value.name),
+                "index": encode_index(writer, value.index), "attrs": encode_value(writer, dict(value.attrs))}
+    if isinstance(value, pd.Index):
+        return encode_index(writer, value)
+    if isinstance(value, np.ndarray):
+        return encode_array(writer, value)
+    if isinstance(value, dict):
+        return {"type": "dict", "items": [[encode_value(writer, k), encode_value(writer, v)] for k, v in value.items()]}
+    if isinstance(value, (list, tuple)):
+        return {"type": type(value).__name__, "items": [encode_value(writer, v) for v in value]}
+    if isinstance(value, np.generic) and value.dtype.kind in "biufc":
+        return {"type": "value", "value": encode_number(value.item()), "dtype": value.dtype.str}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return {"type": "value", "value": encode_number(value)}
+    if isinstance(value, pd.Timestamp):
+        return {"type": "timestamp", "value": value.isoformat()}
+
+    raise TypeError(f"cannot store an object of type {type(value).__name__}")
+
+def encode_number(value):
+    """
+    Helper method that writes complex numbers as pairs, which JSON has no type for
+    """
+    return [value.real, value.imag] if isinstance(value, complex) else value
+
+def encode_index(writer, index):
+    """
+    Helper method that saves a pandas Index into the store being written. Range indexes are described without
+    an array.
+    """
+    if isinstance(index, pd.RangeIndex):
+        return {"type": "range", "start": index.start, "stop": index.stop, "step": index.step,
+                "name": encode_value(writer, index.name)}
+    if isinstance(index, pd.MultiIndex):
+        return {"type": "multi", "levels": [encode_array(writer, index.get_level_values(i).array)
+                                            for i in range(index.nlevels)],
+                "names": encode_value(writer, list(index.names))}
+
+    return {"type": "index", "values": encode_array(writer, index.array), "name": encode_value(writer, index.name)}
+
+def encode_array(writer, values):
+    """
+    Helper method that saves a column of values into the store being written. NumPy columns are saved as they
+    are; categorical, nullable and text columns are saved as arrays of codes or values plus a mask of the missing
+    entries; anything else is written into the index itself.
+    Args:
+        writer (dict): folder of the store and number of arrays written so far
+        values (NumPy array or pandas ExtensionArray): column to save
+
+    Returns: JSON description of the column
+    """
+    dtype = values.dtype
+    if isinstance(values, pd.arrays.NumpyExtensionArray):
+        values = values.to_numpy()
+    if dtype.kind in "mM" and not isinstance(values, np.ndarray):
+        #Times with a time zone are saved in UTC
+        if getattr(dtype, "tz", None) is not None:
+            return {"type": "datetime", "tz": str(dtype.tz),
+                    "data": put_array(writer, values.tz_convert("UTC").tz_localize(None).to_numpy())}
+        values = values.to_numpy()
+
+    if isinstance(values, np.ndarray) and dtype.kind in "biufcmM":
+        return {"type": "array", "data": put_array(writer, values)}
+    if isinstance(values, pd.Categorical):
+        return {"type": "categorical", "codes": put_array(writer, values.codes),
+                "categories": encode_index(writer, values.categories), "ordered": bool(values.ordered)}
+    if isinstance(values, pd.api.extensions.ExtensionArray) and dtype.kind in "biuf":
+        mask = np.asarray(values.isna())
+        return {"type": "masked", "dtype": str(dtype), "mask": put_array(writer, mask),
+                "data": put_array(writer, values.to_numpy(dtype=dtype.numpy_dtype, na_value=0))}
+
+    #Text columns (pandas str dtype, or object columns holding only text and missing values)
+    objects = np.asarray(values, dtype=object)
+    mask = np.asarray(pd.isna(objects), dtype=bool)
+    if all(isinstance(v, str) for v in objects[~mask]):
+        missing = {type(v).__name__ for v in objects[mask]}
+        return {"type": "text", "dtype": "object" if dtype == object else str(dtype),
+                "na": "None" if missing == {"NoneType"} else "nan", "mask": put_array(writer, mask),
+                "data": put_array(writer, np.where(mask, "", objects).astype(str))}
+
+    return {"type": "values", "dtype": str(dtype) if dtype != object else "object",
+            "values": [encode_value(writer, v) for v in objects]}
+
+def decode_value(store, entry):
+    """
+    Helper method that puts an expected object back together from its JSON description
+    """
+    kind = entry["type"]
+    if kind == "frame":
+        columns = [decode_array(store, c) for c in entry["columns"]]
+        frame = pd.DataFrame(dict(enumerate(columns)), index=decode_value(store, entry["index"]), copy=False)
+        frame.columns = decode_value(store, entry["column_index"])
+        frame.attrs = decode_value(store, entry["attrs"])
+        return frame
+    if kind == "series":
+        series = pd.Series(decode_array(store, entry["values"]), index=decode_value(store, entry["index"]),
+                           name=decode_value(store, entry["name"]), copy=False)
+        series.attrs = decode_value(store, entry["attrs"])
+        return series
+    if kind == "range":
+        return pd.RangeIndex(entry["start"], entry["stop"], entry["step"], name=decode_value(store, entry["name"]))
+    if kind == "index":
+        return pd.Index(decode_array(store, entry["values"]), name=decode_value(store, entry["name"]), copy=False)
+    if kind == "multi":
+        return pd.MultiIndex.from_arrays([decode_array(store, level) for level in entry["levels"]],
+                                         names=decode_value(store, entry["names"]))
+    if kind == "dict":
+        return {decode_value(store, k): decode_value(store, v) for k, v in entry["items"]}
+    if kind == "list":
+        return [decode_value(store, v) for v in entry["items"]]
+    if kind == "tuple":
+        return tuple(decode_value(store, v) for v in entry["items"])
+    if kind == "value":
+        value = entry["value"]
+        if isinstance(value, list):
+            value = complex(*value)
+        return np.dtype(entry["dtype"]).type(value) if "dtype" in entry else value
+    if kind == "timestamp":
+        return pd.Timestamp(entry["value"])
+
+    return decode_array(store, entry)
+
+def decode_array(store, entry):
+    """
+    Helper method that puts a column back together from its JSON description; NumPy columns stay memory-mapped
+    """
+    kind = entry["type"]
+    if kind == "array":
+        return get_array(store, entry["data"])
+    if kind == "categorical":
+        return pd.Categorical.from_codes(get_array(store, entry["codes"]), decode_value(store, entry["categories"]),
+                                         ordered=entry["ordered"])
+    if kind == "masked":
+        array_type = pd.api.types.pandas_dtype(entry["dtype"]).construct_array_type()
+        return array_type(get_array(store, entry["data"]), get_array(store, entry["mask"]))
+    if kind == "datetime":
+        return pd.DatetimeIndex(get_array(store, entry["data"])).tz_localize("UTC").tz_convert(entry["tz"]).array
+    if kind == "text":
+        values = get_array(store, entry["data"]).astype(object)
+        values[get_array(store, entry["mask"])] = None if entry["na"] == "None" else np.nan
+        return values if entry["dtype"] == "object" else pd.array(values, dtype=entry["dtype"])
+    if kind == "values":
+        values = np.empty(len(entry["values"]), dtype=object)
+        values[:] = [decode_value(store, v) for v in entry["values"]]
+        return values if entry["dtype"] == "object" else pd.array(values, dtype=entry["dtype"])
+
+    raise ValueError(f"unknown entry type {kind}")
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Convert the shelve files of the expected results into a "
+                                                 "fixture store.")
+    parser.add_argument("--shelf", default="expected_results",
+                        help="name of the shelve files, without extension (default: expected_results)")
+    parser.add_argument("--output", default=FIXTURE_FOLDER,
+                        help=f"folder of the fixture store to write (default: {FIXTURE_FOLDER})")
+    args = parser.parse_args(argv)
+
+    result = convertShelve(args.shelf, args.output)
+    for key in result["converted"]:
+        print(f"converted {key}")
+    for key, new_key in result["renamed"].items():
+        print(f"stored {key} as {new_key}")
+    for key, error in result["failed"].items():
+        print(f"FAILED {key}: {error}")
+
+    return 1 if len(result["failed"]) > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
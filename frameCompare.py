@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+
+def get_mismatches(exp, act, atol = 1e-5, rtol = 0.0, limit = 10, exact = False):
+    """
+    Compares two data frames with the same shape, column by column over whole arrays. Numeric columns are
+    compared with np.isclose (NaN equals NaN, and inf equals inf of the same sign); other columns must be equal,
+    where missing values equal each other.
+    Args:
+        exp (Pandas DataFrame): expected results
+        act (Pandas DataFrame): actual results, with the same shape
+        atol (float): absolute tolerance for numeric columns. Default is 1e-5
+        rtol (float): relative tolerance for numeric columns. Default is 0
+        limit (int): number of mismatching cells to describe. Default is 10
+        exact (bool): compare the columns whose expected values are not floats (integers, booleans, text) exactly
+            instead of within the tolerances. Default is False
+
+    Returns: tuple of (number of mismatching cells, list of (row label, column label, expected, actual) for the
+        first limit of them)
+    """
+    count = 0
+    cells = []
+    for j in range(exp.shape[1]):
+        col_exp = exp.iloc[:, j]
+        col_act = act.iloc[:, j]
+        same = get_equal_cells(col_exp, col_act, atol, rtol, exact and not pd.api.types.is_float_dtype(col_exp.dtype))
+
+        bad = np.flatnonzero(~same)
+        count += len(bad)
+        for i in bad[:max(limit - len(cells), 0)]:
+            cell = (exp.index[i], exp.columns[j], col_exp.iloc[i], col_act.iloc[i])
+            cells.append(tuple(get_plain(v) for v in cell))
+
+    return (count, cells)
+
+def get_equal_cells(exp, act, atol = 1e-5, rtol = 0.0, exact = False):
+    """
+    Helper method that compares two Series of the same length position by position.
+    Args:
+        exp (Pandas Series): expected values
+        act (Pandas Series): actual values
+        atol (float): absolute tolerance for numeric values. Default is 1e-5
+        rtol (float): relative tolerance for numeric values. Default is 0
+        exact (bool): compare numeric values exactly as well, without turning them into floats. Default is False
+
+    Returns: NumPy bool array, True where the values are equal
+    """
+    numeric = not exact and all(pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype)
+                  for s in (exp, act))
+    if numeric:
+        values_exp = exp.to_numpy(dtype=np.float64, na_value=np.nan)
+        values_act = act.to_numpy(dtype=np.float64, na_value=np.nan)
+        return np.isclose(values_exp, values_act, rtol=rtol, atol=atol, equal_nan=True)
+
+    missing_exp = exp.isna().to_numpy()
+    missing_act = act.isna().to_numpy()
+    values_exp = exp.to_numpy(dtype=object)
+    values_act = act.to_numpy(dtype=object)
+    same = np.zeros(len(values_exp), dtype=bool)
+    found = ~missing_exp & ~missing_act
+    same[found] = values_exp[found] == values_act[found]
+
+    return same | (missing_exp & missing_act)
+
+def assert_frame_close(exp, act, atol = 1e-5, rtol = 0.0, limit = 10, check_dtype = False):
+    """
+    Checks that two data frames have the same shape, column labels and index, and that their values are equal
+    (numeric values within the tolerances). Raises an AssertionError describing the first limit mismatching cells
+    otherwise, so it can be used in any unittest.TestCase.
+    Args:
+        exp (Pandas DataFrame): expected results
+        act (Pandas DataFrame): actual results
+        atol (float): absolute tolerance for numeric columns. Default is 1e-5
+        rtol (float): relative tolerance for numeric columns. Default is 0
+        limit (int): number of mismatching cells to describe. Default is 10
+        check_dtype (bool): columns whose expected values are not floats must also have the same dtype and exactly
+            the same values; float columns are still compared within the tolerances. Default is False
+
+    Returns: None
+    """
+    if not isinstance(exp, pd.DataFrame) or not isinstance(act, pd.DataFrame):
+        raise AssertionError(f"expected two DataFrames, got {type(exp).__name__} and {type(act).__name__}")
+    if exp.shape != act.shape:
+        raise AssertionError(f"shapes differ: {exp.shape} != {act.shape}")
+    check_labels("columns", exp.columns, act.columns, limit)
+    check_labels("index", exp.index, act.index, limit)
+    if check_dtype:
+        check_dtypes(exp, act)
+
+    count, cells = get_mismatches(exp, act, atol, rtol, limit, exact=check_dtype)
+    if count > 0:
+        lines = [f"  [{row!r}, {col!r}]: {value_exp!r} != {value_act!r}" for row, col, value_exp, value_act in cells]
+        raise AssertionError(f"{count} of {exp.size} cells differ (atol={atol}, rtol={rtol}); first "
+                             f"{len(cells)}:\n" + "\n".join(lines))
+
+def assert_series_close(exp, act, atol = 1e-5, rtol = 0.0, limit = 10, check_dtype = False):
+    """
+    Checks that two Series have the same name, index and values (numeric values within the tolerances), see
+    assert_frame_close.
+    Args:
+        exp (Pandas Series): expected results
+        act (Pandas Series): actual results
+        atol (float): absolute tolerance for numeric values. Default is 1e-5
+        rtol (float): relative tolerance for numeric values. Default is 0
+        limit (int): number of mismatching values to describe. Default is 10
+        check_dtype (bool): values that are not floats must also have the same dtype and be exactly the same.
+            Default is False
+
+    Returns: None
+    """
+    if not isinstance(exp, pd.Series) or not isinstance(act, pd.Series):
+        raise AssertionError(f"expected two Series, got {type(exp).__name__} and {type(act).__name__}")
+    if exp.name != act.name:
+        raise AssertionError(f"names differ: {exp.name!r} != {act.name!r}")
+
+    assert_frame_close(exp.to_frame(), act.to_frame(), atol, rtol, limit, check_dtype)
+
+def check_dtypes(exp, act):
+    """
+    Helper method that raises an AssertionError naming the columns whose expected values are not floats and whose
+    dtypes differ
+    """
+    bad = [f"{col!r}: {exp.dtypes.iloc[j]} != {act.dtypes.iloc[j]}" for j, col in enumerate(exp.columns)
+           if not pd.api.types.is_float_dtype(exp.dtypes.iloc[j]) and exp.dtypes.iloc[j] != act.dtypes.iloc[j]]
+    if len(bad) > 0:
+        raise AssertionError("dtypes differ: " + ", ".join(bad))
+
+def check_labels(kind, exp, act, limit = 10):
+    """
+    Helper method that raises an AssertionError naming the first limit differing labels when two indexes differ
+    """
+    if exp.equals(act):
+        return
+
+    if len(exp) != len(act):
+        raise AssertionError(f"{kind} lengths differ: {len(exp)} != {len(act)}")
+    bad = np.flatnonzero(~get_equal_cells(exp.to_series(), act.to_series(), atol=0.0))
+    pairs = ", ".join(f"{get_plain(exp[i])!r} != {get_plain(act[i])!r}" for i in bad[:limit])
+    raise AssertionError(f"{kind} differ at {len(bad)} positions: {pairs}")
+
+def get_plain(value):
+    """
+    Helper method that turns NumPy scalars into Python values, so they read plainly in failure messages
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+def compSeries(exp, act, atol = 0.000001):
+    """
+    Performs a comparison of two Series objects that accounts for nan, inf, and floating point inaccuracies.
+    Series that are not floats must have the same dtype and exactly the same values
+    :param exp: Object representing expected results
+    :type exp: Pandas.Series
+    :param act: Object representing actual results
+    :type act: Pandas.Series
+    :param atol: Absolute tolerance to use with np.isclose function for doing the comparison (values also match
+        within np.isclose's default relative tolerance of 1e-5)
+    :type atol: float
+    :return: True if the Series are equal, False otherwise; None if either of exp or act is not Series object
+    :rtype: bool or None
+    """
+    if not isinstance(exp, pd.Series) or not isinstance(act, pd.Series):
+        return None
+
+    try:
+        assert_series_close(exp, act, atol, rtol=1e-5, limit=0, check_dtype=True)
+    except AssertionError:
+        return False
+
+    return True
+
+def compDataFrame(exp, act, atol = 0.000001):
+    """
+    Performs a comparison of two DataFrame objects that accounts for nan, inf, and floating point inaccuracies.
+    Columns that are not floats must have the same dtype and exactly the same values
+    :param exp: Object representing expected results
+    :type exp: Pandas.DataFrame
+    :param act: Object representing actual results
+    :type act: Pandas.DataFrame
+    :param atol: Absolute tolerance to use with np.isclose function for doing the comparison (values also match
+        within np.isclose's default relative tolerance of 1e-5)
+    :type atol: float
+    :return: True if the DataFrames are equal, False otherwise; None if either of exp or act is not a DataFrame
+    :rtype: bool or None
+    """
+    if not isinstance(exp, pd.DataFrame) or not isinstance(act, pd.DataFrame):
+        return None
+
+    try:
+        assert_frame_close(exp, act, atol, rtol=1e-5, limit=0, check_dtype=True)
+    except AssertionError:
+        return False
+
+    return True
@@ -2,13 +2,16 @@ import pandas as pd
 import math
 import numpy as np
 
-def reformatSamples(samples):
+def reformatSamples(samples, ragged = False):
     """
     Function that reformats a set of data from observations indicating sample number to neat rows per sample
-    containing observations per sample. All samples must have the same number of observations.
+    containing observations per sample. All samples must have the same number of observations, unless ragged
+    is set.
 
     Args:
         samples (str): name of file containing samples.
+        ragged (bool): allow samples of different sizes; short samples are padded with NaN and a count column
+            gives the number of observations of each sample. Default is False
 
     Returns: data frame containing the restructured data
 
@@ -17,49 +20,312 @@ def reformatSamples(samples):
     if not isinstance(samples, pd.DataFrame):
         return math.nan
 
-    #Read in, and sort values in the dataset based on sample. Then, extract two columns for just sample and diameter
-    # so that it is ready to be reformatted
-    samples.dropna()
-    samples.sort_values(by='sample')
-    sample_dat = samples[['sample','diameter']]
+    ragged_dat = build_ragged_samples(samples)
+    if ragged:
+        return get_padded_frame(ragged_dat)
 
     #Verify that all samples have the same number of observations.
-    sample_sizes = sample_dat.groupby(["sample"]).size()
-
-    #Drop na because when using diff, first row will be NanN since there is no previous row for it to
-    # compare itself to. If all samples have the same amount of observations, the sum of the difference should be 0.
-    test = sample_sizes.diff().dropna()
-    if sum(test) != 0:
+    counts = np.diff(ragged_dat["offsets"])
+    if len(counts) > 0 and (counts != counts[0]).any():
         return None
 
-    #Creating the column listing the observation number needed to create a mutli-index DataFrame
-    #Store these values in variables, so that the functions are easier to read.
-    num_samples = len(sample_sizes)
-    num_obs = sample_sizes[1]
-    # tile method in numpy to generate repeated sequences of numbers (from documentation)
-    seq = np.tile(range(1,num_obs+1), num_samples)
-    #convert the numpy array to a series so that it is easy to concatenate to the Pandas DF with a name
-    obs_series = pd.Series(seq, name='obs')
-    sample_dat = pd.concat([sample_dat,obs_series],axis=1)
+    #With every sample the same size, the observations in sample order are one contiguous num_samples x num_obs
+    # block: row i holds the observations of sample i in order
+    num_samples = len(counts)
+    num_obs = int(counts[0]) if num_samples > 0 else 0
+    obs = np.ascontiguousarray(ragged_dat["values"]).reshape(num_samples, num_obs)
 
-    #Create a multi-index DataFrame based on sample and observation number
-    multi_ind_dat = sample_dat.groupby(['sample', 'obs']).sum()
+    return make_sample_frame(ragged_dat["sample"], obs)
 
-    #No need to specify which column to unstack bc default puts sample as first column
-    reformat_dat = multi_ind_dat.unstack()
+def build_ragged_samples(samples):
+    """
+    Puts the observations of every sample next to each other in a compact (CSR) layout: the observations of
+    sample[i] are values[offsets[i]:offsets[i + 1]], in their original order. Samples can have any size.
+    Args:
+        samples (Pandas DataFrame): data frame with diameter and sample columns
 
-    #Flatten that new df even more, so that the sample column is separated from the index
-    reformat_dat.reset_index(level=0,inplace=True)
+    Returns: dictionary containing sample (sorted sample numbers), offsets and values
+    """
+    if not isinstance(samples, pd.DataFrame):
+        return math.nan
 
-    #Rename columns
-    #First create a list of new names, we know that the first one will be samples and the rest will be obs.x
-    # use shape[1] + 1 because range starts at 1; shape is used to determine number of columns
-    names_new = ["obs." + str(x) for x in range(1,reformat_dat.shape[1])]
-    names_new = ["sample"] + names_new
+    #Extract just the sample and diameter columns as arrays; rows without a sample number do not belong to any sample
+    sample = samples["sample"].to_numpy()
+    diameter = samples["diameter"].to_numpy()
+    if samples["sample"].hasnans:
+        found = samples["sample"].notna().to_numpy()
+        sample = sample[found]
+        diameter = diameter[found]
+
+    keys, counts, order = get_sample_layout(sample)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    #values is always a new array (never a view of the data frame), so the frames made from it can be changed
+    return {"sample": keys, "offsets": offsets, "values": diameter.copy() if order is None else diameter[order]}
+
+def get_padded_frame(ragged_dat):
+    """
+    Makes the wide data frame of a compact sample layout, padding short samples with NaN.
+    Args:
+        ragged_dat (dict): compact sample layout from build_ragged_samples
+
+    Returns: data frame with a sample column, obs.1 .. obs.n columns (n is the size of the largest sample) and a
+        count column
+    """
+    if not isinstance(ragged_dat, dict):
+        return math.nan
+
+    offsets = ragged_dat["offsets"]
+    counts = np.diff(offsets)
+    num_obs = int(counts.max()) if len(counts) > 0 else 0
+
+    #Every observation goes to row (its sample) and column (its place within the sample) of the padded block
+    rows = np.repeat(np.arange(len(counts)), counts)
+    cols = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+    obs = np.full((len(counts), num_obs), np.nan, dtype=np.result_type(ragged_dat["values"], np.float64))
+    obs[rows, cols] = ragged_dat["values"]
+
+    reformat_dat = make_sample_frame(ragged_dat["sample"], obs)
+    reformat_dat["count"] = counts
+
+    return reformat_dat
+
+def get_sample_stats(ragged_dat):
+    """
+    Computes the statistics of every sample used by control charts straight from the compact sample layout.
+    Args:
+        ragged_dat (dict): compact sample layout from build_ragged_samples
 
-    reformat_dat.columns = names_new
+    Returns: data frame with sample, count, mean, range and std (sample standard deviation, NaN for samples of
+        one observation) columns, with row indexing starting at 1
+    """
+    if not isinstance(ragged_dat, dict):
+        return math.nan
+
+    offsets = ragged_dat["offsets"]
+    values = ragged_dat["values"].astype(np.float64, copy=False)
+    counts = np.diff(offsets)
+    starts = offsets[:-1]
+
+    if len(counts) > 0:
+        mean = np.add.reduceat(values, starts) / counts
+        value_range = np.maximum.reduceat(values, starts) - np.minimum.reduceat(values, starts)
+        squares = np.add.reduceat((values - np.repeat(mean, counts)) ** 2, starts)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            std = np.where(counts > 1, np.sqrt(squares / (counts - 1)), np.nan)
+    else:
+        mean = value_range = std = np.zeros(0)
+
+    return pd.DataFrame({"sample": ragged_dat["sample"], "count": counts, "mean": mean, "range": value_range,
+                         "std": std}, index=range(1, len(counts) + 1))
+
+def reformatSamplesStream(source, output, num_obs = None, chunksize = 100000):
+    """
+    Function that reformats a measurement log that is too long to keep in memory, shaped like pistonrings.csv.
+    The log is read in chunks, and every sample is written as a wide row as soon as it has num_obs observations.
+    Samples with the wrong number of observations are reported instead of stopping the whole log.
+
+    Args:
+        source (str or iterable): name of a .csv file containing the samples, or an iterable of data frames
+            (chunks of the log, in order) with diameter and sample columns
+        output (str or function): name of the .csv file to write, or a function called with every data frame of
+            wide rows
+        num_obs (int): number of observations of a sample. Default is None (the size of the first sample)
+        chunksize (int): number of observations read from the file at a time. Default is 100000
+
+    Returns: dictionary containing sample.count (samples written) and bad.samples (number of observations of
+        every sample that did not have num_obs of them, keyed by sample)
+    """
+    if not isinstance(output, str) and not callable(output):
+        return math.nan
+
+    bad_samples = {}
+    rows = iter_sample_rows(source, num_obs, chunksize, bad_samples)
+    if isinstance(rows, float):
+        return math.nan
+
+    count = 0
+    for reformat_dat in rows:
+        if isinstance(output, str):
+            reformat_dat.to_csv(output, mode="w" if count == 0 else "a", header=count == 0)
+        else:
+            output(reformat_dat)
+        count += len(reformat_dat)
+
+    #Write just the header when there are no complete samples, so the file is still there
+    if count == 0 and isinstance(output, str):
+        make_sample_frame(np.zeros(0), np.zeros((0, num_obs or 0))).to_csv(output)
+
+    return {"sample.count": count, "bad.samples": bad_samples}
+
+def iter_sample_rows(source, num_obs = None, chunksize = 100000, bad_samples = None):
+    """
+    Reformats a measurement log one chunk at a time, as a generator of data frames in the format of
+    reformatSamples (the row numbers go on from one data frame to the next). Observations of samples that are not
+    complete yet are kept until they are.
+    Args:
+        source (str or iterable): name of a .csv file, or an iterable of data frames with diameter and sample columns
+        num_obs (int): number of observations of a sample. Default is None (the size of the first sample)
+        chunksize (int): number of observations read from the file at a time. Default is 100000
+        bad_samples (dict): if given, filled with the number of observations of every sample that did not have
+            num_obs of them. Default is None
+
+    Returns: generator of data frames of wide rows
+    """
+    if isinstance(source, str):
+        chunks = pd.read_csv(source, usecols=["diameter", "sample"], chunksize=chunksize)
+    elif isinstance(source, pd.DataFrame):
+        chunks = [source]
+    elif hasattr(source, "__iter__"):
+        chunks = source
+    else:
+        return math.nan
+
+    return stream_sample_rows(chunks, num_obs, bad_samples if bad_samples is not None else {})
+
+def stream_sample_rows(chunks, num_obs, bad_samples):
+    """
+    Helper generator for iter_sample_rows. A sample is finished once it has num_obs observations; if more
+    observations of it come later, it is reported as bad with its total number of observations. Samples that
+    are still not complete at the end of the log are reported as bad too.
+    """
+    pending_sample = None
+    pending_diameter = None
+    finished = []
+    start = 1
+
+    for chunk in chunks:
+        found = chunk["sample"].notna().to_numpy()
+        sample = chunk["sample"].to_numpy()[found]
+        diameter = chunk["diameter"].to_numpy()[found]
+        if pending_sample is not None:
+            sample = np.concatenate([pending_sample, sample])
+            diameter = np.concatenate([pending_diameter, diameter])
+
+        #Observations of samples that were already written make those samples bad
+        late = is_finished(finished, sample)
+        if late.any():
+            late_keys, late_counts = np.unique(sample[late], return_counts=True)
+            for key, late_count in zip(late_keys.tolist(), late_counts.tolist()):
+                bad_samples[key] = bad_samples.get(key, num_obs) + late_count
+            sample = sample[~late]
+            diameter = diameter[~late]
+
+        #Without num_obs, the first sample is complete once a row of another sample comes after it
+        if num_obs is None:
+            if len(sample) == 0 or (sample == sample[0]).all():
+                pending_sample, pending_diameter = sample, diameter
+                continue
+            num_obs = int(np.argmax(sample != sample[0]))
+
+        keys, counts, order = get_sample_layout(sample)
+        if order is None:
+            order = np.arange(len(sample))
+        ends = np.cumsum(counts)
+
+        #Complete samples are written now; samples with too many observations are reported and kept out
+        done = counts >= num_obs
+        for key, count in zip(keys[counts > num_obs].tolist(), counts[counts > num_obs].tolist()):
+            bad_samples[key] = count
+        add_finished(finished, keys[done])
+
+        complete = counts == num_obs
+        if complete.any():
+            rows = (ends[complete][:, None] - num_obs + np.arange(num_obs)).ravel()
+            obs = diameter[order[rows]].reshape(-1, num_obs)
+            yield make_sample_frame(keys[complete], obs, start)
+            start += int(complete.sum())
+
+        keep = np.repeat(~done, counts)
+        pending_sample = sample[order[keep]]
+        pending_diameter = diameter[order[keep]]
+
+    if pending_sample is None or len(pending_sample) == 0:
+        return
+
+    #A log holding a single sample is complete by definition
+    if num_obs is None:
+        yield make_sample_frame(pending_sample[:1], pending_diameter.reshape(1, -1), start)
+        return
+
+    #Samples still waiting for observations at the end of the log are bad as well
+    keys, counts, _ = get_sample_layout(pending_sample)
+    for key, count in zip(keys.tolist(), counts.tolist()):
+        bad_samples[key] = count
+
+def is_finished(finished, sample):
+    """
+    Helper method that tells which sample numbers are finished samples. Every sorted run of finished samples is
+    binary searched, so the time per chunk grows with the chunk and the logarithm of the finished samples.
+    Args:
+        finished (list): sorted NumPy arrays of finished sample numbers, see add_finished
+        sample (NumPy array): sample numbers to look up
+
+    Returns: NumPy bool array, True where the sample is finished
+    """
+    late = np.zeros(len(sample), dtype=bool)
+    for run in finished:
+        pos = np.minimum(np.searchsorted(run, sample), len(run) - 1)
+        late |= run[pos] == sample
+
+    return late
+
+def add_finished(finished, keys):
+    """
+    Helper method that adds sorted sample numbers to the sorted runs of finished samples. A run is merged into
+    the one before it while it is at least half as long, so there are only about log2(number of finished samples)
+    runs, and every sample number is merged that many times at most.
+    Args:
+        finished (list): sorted NumPy arrays of finished sample numbers, changed in place
+        keys (NumPy array): sorted sample numbers that were just finished
+
+    Returns: None
+    """
+    if len(keys) == 0:
+        return
+
+    finished.append(keys)
+    while len(finished) > 1 and 2 * len(finished[-1]) >= len(finished[-2]):
+        run = finished.pop()
+        finished[-1] = np.union1d(finished[-1], run)
+
+def make_sample_frame(keys, obs, start = 1):
+    """
+    Helper method that makes the reformatted data frame out of the sample numbers and their observations,
+    without copying the observations.
+    Args:
+        keys (NumPy array): sample numbers
+        obs (NumPy array): 2-D array holding the observations of a sample on each row
+        start (int): number of the first row. Default is 1
+
+    Returns: data frame with a sample column and obs.1 .. obs.n columns
+    """
+    #Rename columns: the first one is sample and the rest are obs.x
+    names_new = ["obs." + str(x) for x in range(1, obs.shape[1] + 1)]
+    reformat_dat = pd.DataFrame(obs, columns=names_new, copy=False)
+    reformat_dat.insert(0, "sample", keys)
 
     #Make sure row indexing starts at 1 so it matches the expected result
-    reformat_dat.index = range(1, len(reformat_dat) + 1)
+    reformat_dat.index = range(start, start + len(reformat_dat))
+
+    return reformat_dat
+
+def get_sample_layout(sample):
+    """
+    Helper method that finds the samples of a column of sample numbers and how to put their observations in
+    sample order. Sample numbers that are already sorted (the usual layout of a measurement log) are only
+    scanned; otherwise they are sorted with a stable sort so observations keep their order within a sample.
+    Args:
+        sample (NumPy array): sample number of every observation
+
+    Returns: tuple of (sorted sample numbers, number of observations per sample, order of the observations or
+        None when they are already in sample order)
+    """
+    if len(sample) == 0 or (sample[1:] >= sample[:-1]).all():
+        starts = np.flatnonzero(np.concatenate([[True], sample[1:] != sample[:-1]])) if len(sample) > 0 else \
+            np.zeros(0, dtype=np.int64)
+        return (sample[starts], np.diff(np.append(starts, len(sample))), None)
 
-    return reformat_dat
\ No newline at end of file
+    keys, codes, counts = np.unique(sample, return_inverse=True, return_counts=True)
+    return (keys, counts, np.argsort(codes, kind="stable"))
@@ -0,0 +1,231 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Comparison operators of a predicate (column, operator, value), and the NumPy function building their mask
+COMPARISONS = {"==": np.equal, "!=": np.not_equal, "<": np.less, "<=": np.less_equal, ">": np.greater,
+               ">=": np.greater_equal}
+# Operators of a predicate whose value is a list of values
+MEMBERSHIP = ["in", "not in"]
+# Operators joining predicates: ("and", [predicates]), ("or", [predicates]) and ("not", predicate)
+JOINS = ["and", "or", "not"]
+# Bytes of masks a query state keeps by default; the masks used least recently are dropped first
+MASK_CACHE_BYTES = 64 * 1024 * 1024
+
+def init_stat_query(df, max_bytes = MASK_CACHE_BYTES):
+    """
+    Creates a query state for a DataFrame, used to take many subsets of the same data (per team, per year, per
+    threshold) without building the same mask twice. The state keeps the masks of the comparisons asked for most
+    recently, up to max_bytes of them, and the columns as NumPy arrays: numeric columns as numbers, text and
+    categorical columns as integer codes, so comparing them to a value compares integers. The DataFrame must not
+    be changed while the state is used.
+    Args:
+        df (Pandas DataFrame): data to query
+        max_bytes (int): bytes of masks to keep; the mask used least recently is dropped first. Default is
+            MASK_CACHE_BYTES
+
+    Returns: dictionary containing the query state
+    """
+    if not isinstance(df, pd.DataFrame) or not isinstance(max_bytes, int) or max_bytes < 0:
+        return math.nan
+
+    return {"dat": df, "columns": {}, "masks": {}, "mask_bytes": 0, "max_bytes": max_bytes, "hits": 0,
+            "misses": 0}
+
+def get_subset(query, predicate):
+    """
+    Takes the rows matching a predicate. Rows that are next to each other (like the rows of one year in data
+    sorted by year) are returned as a slice, which pandas does not copy; other subsets are taken in one go.
+    Args:
+        query (dict or Pandas DataFrame): query state from init_stat_query, or a DataFrame to query once
+        predicate (tuple or list): (column, operator, value) where operator is one of COMPARISONS or MEMBERSHIP,
+            a list of predicates that must all hold, or ("and", [predicates]), ("or", [predicates]) or
+            ("not", predicate)
+
+    Returns: DataFrame of the matching rows, with their index
+    """
+    if isinstance(query, pd.DataFrame):
+        query = init_stat_query(query)
+    mask = get_mask(query, predicate)
+    if not isinstance(mask, np.ndarray):
+        return math.nan
+
+    df = query["dat"]
+    rows = np.flatnonzero(mask)
+    if len(rows) == 0:
+        return df.iloc[0:0]
+    if rows[-1] - rows[0] + 1 == len(rows):
+        return df.iloc[rows[0]:rows[-1] + 1]
+
+    return df.take(rows)
+
+def get_mask(query, predicate):
+    """
+    Builds the boolean mask of a predicate, see get_subset. The masks of comparisons are kept in the query state
+    (up to its max_bytes, dropping the one used least recently first) and given back (read-only) when the same
+    comparison is asked for again.
+    Args:
+        query (dict): query state from init_stat_query
+        predicate (tuple or list): predicate, see get_subset
+
+    Returns: NumPy bool array with one entry per row
+    """
+    if not isinstance(query, dict) or not is_predicate(predicate, query["dat"].columns):
+        return math.nan
+
+    #Joined predicates are put together again from the cached masks of their comparisons every time; keeping
+    # every combination as well would hold a mask per team and year instead of one per team plus one per year
+    if isinstance(predicate, list) or predicate[0] in JOINS:
+        return get_joined_mask(query, predicate)
+
+    key = get_predicate_key(predicate)
+    masks = query["masks"]
+    if key in masks:
+        query["hits"] += 1
+        #dicts keep their insertion order, so moving the mask to the end keeps the masks in order of use
+        masks[key] = masks.pop(key)
+        return masks[key]
+    query["misses"] += 1
+
+    mask = get_column_mask(query, *predicate)
+    mask.flags.writeable = False
+    if mask.nbytes <= query["max_bytes"]:
+        while query["mask_bytes"] + mask.nbytes > query["max_bytes"]:
+            query["mask_bytes"] -= masks.pop(next(iter(masks))).nbytes
+        masks[key] = mask
+        query["mask_bytes"] += mask.nbytes
+    return mask
+
+def get_joined_mask(query, predicate):
+    """
+    Helper method that builds the mask of predicates joined by and, or or not
+    """
+    if isinstance(predicate, list):
+        predicate = ("and", predicate)
+    join, parts = predicate
+
+    if join == "not":
+        return ~get_mask(query, parts)
+    if len(parts) == 0:
+        return np.full(len(query["dat"]), join == "and")
+
+    mask = get_mask(query, parts[0]).copy()
+    for part in parts[1:]:
+        if join == "and":
+            mask &= get_mask(query, part)
+        else:
+            mask |= get_mask(query, part)
+
+    return mask
+
+def get_column_mask(query, col, op, value):
+    """
+    Helper method that builds the mask of one comparison. Missing values never match, except with != and
+    not in (the same as df.query). Comparisons that the column arrays cannot do (ordering text, comparing
+    dates or mismatched types) are left to pandas.
+    Args:
+        query (dict): query state from init_stat_query
+        col (str): column name
+        op (str): operator, one of COMPARISONS or MEMBERSHIP
+        value: value, or list of values for MEMBERSHIP
+
+    Returns: NumPy bool array with one entry per row
+    """
+    column = get_column(query, col)
+    values = list(value) if op in MEMBERSHIP else [value]
+
+    if column["kind"] == "number" and all(is_number(v) for v in values):
+        if op in MEMBERSHIP:
+            mask = np.isin(column["values"], values)
+            return ~mask if op == "not in" else mask
+        return COMPARISONS[op](column["values"], value)
+
+    if column["kind"] == "codes" and (op in MEMBERSHIP or op in ["==", "!="]):
+        #Values that are not in the column get code -1, the code of missing values, so they are dropped
+        codes = column["uniques"].get_indexer(pd.Index(values, dtype=object))
+        codes = codes[codes >= 0]
+        if op in MEMBERSHIP:
+            mask = np.isin(column["codes"], codes)
+        else:
+            mask = column["codes"] == codes[0] if len(codes) > 0 else np.zeros(len(column["codes"]), dtype=bool)
+        return ~mask if op in ["!=", "not in"] else mask
+
+    ser = query["dat"][col]
+    if op in MEMBERSHIP:
+        mask = ser.isin(values).to_numpy(dtype=bool)
+        return ~mask if op == "not in" else mask
+    compare = {"==": ser.eq, "!=": ser.ne, "<": ser.lt, "<=": ser.le, ">": ser.gt, ">=": ser.ge}[op]
+    return compare(value).to_numpy(dtype=bool, na_value=op == "!=")
+
+def get_column(query, col):
+    """
+    Helper method that gives a column of the query state as NumPy arrays, made the first time it is used.
+    Numeric columns keep their values (nullable ones as floats with NaN for missing values); text and
+    categorical columns become integer codes into their distinct values, with -1 for missing values.
+    """
+    if col not in query["columns"]:
+        ser = query["dat"][col]
+        if isinstance(ser.dtype, np.dtype) and ser.dtype.kind in "biuf":
+            query["columns"][col] = {"kind": "number", "values": ser.to_numpy()}
+        elif pd.api.types.is_numeric_dtype(ser.dtype) and not isinstance(ser.dtype, pd.CategoricalDtype):
+            query["columns"][col] = {"kind": "number", "values": ser.to_numpy(dtype="float64", na_value=np.nan)}
+        elif isinstance(ser.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(ser.dtype):
+            codes, uniques = pd.factorize(ser)
+            query["columns"][col] = {"kind": "codes", "codes": codes, "uniques": pd.Index(uniques, dtype=object)}
+        else:
+            query["columns"][col] = {"kind": "other"}
+
+    return query["columns"][col]
+
+def is_predicate(predicate, columns):
+    """
+    Helper method that checks that a predicate has one of the forms listed in get_subset, and that its columns
+    are in the data
+    """
+    if isinstance(predicate, list):
+        return all(is_predicate(p, columns) for p in predicate)
+    if not isinstance(predicate, tuple):
+        return False
+
+    if len(predicate) == 2 and predicate[0] == "not":
+        return is_predicate(predicate[1], columns)
+    if len(predicate) == 2 and predicate[0] in ["and", "or"]:
+        return isinstance(predicate[1], list) and is_predicate(predicate[1], columns)
+    if len(predicate) != 3 or predicate[0] not in columns:
+        return False
+    if predicate[1] in MEMBERSHIP:
+        return isinstance(predicate[2], (list, tuple, set, np.ndarray, pd.Index, pd.Series))
+
+    return predicate[1] in COMPARISONS and np.ndim(predicate[2]) == 0
+
+def get_predicate_key(predicate):
+    """
+    Helper method that turns a comparison into a key for the mask cache (lists of values become tuples)
+    """
+    col, op, value = predicate
+    if op in MEMBERSHIP:
+        value = tuple(value)
+    return (col, op, value)
+
+def is_number(value):
+    """
+    Helper method that tells whether a value can be compared with a numeric column
+    """
+    return isinstance(value, (int, float, np.number, np.bool_))
+
+def parse_query_value(val):
+    """
+    Helper method that reads a value written the way df.query needed it: quoted text ('"NL"') becomes the text,
+    and numbers written as text ("50") become numbers. Any other text is kept as it is.
+    """
+    text = val.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'":
+        return text[1:-1]
+    for parse in [int, float]:
+        try:
+            return parse(text)
+        except ValueError:
+            continue
+
+    return val
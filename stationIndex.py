@@ -0,0 +1,206 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Mean radius of the Earth used for haversine distances
+EARTH_RADIUS_KM = 6371.0088
+
+def build_station_index(coords, cell_km = None):
+    """
+    Builds a spatial index over station coordinates (the result of extractCoordinates), so that radius and
+    nearest-station queries only look at the stations close to the query point. Stations are turned into points
+    on the unit sphere and put into a grid of cubes; the points are kept sorted by cube, so the stations of a
+    column of cubes are one slice of the arrays. Stations without coordinates are left out.
+
+    Args:
+        coords (Pandas DataFrame): data frame with station, lat and lon columns (degrees)
+        cell_km (float): size of a grid cube, as a distance on the Earth. Default is None (chosen from the number
+            of stations, about 8 stations per cube)
+
+    Returns: dictionary containing the index
+    """
+    if not isinstance(coords, pd.DataFrame):
+        return math.nan
+    if not all(col in coords.columns for col in ["station", "lat", "lon"]):
+        return math.nan
+
+    found = (coords["lat"].notna() & coords["lon"].notna()).to_numpy()
+    latitude = coords["lat"].to_numpy(dtype=np.float64)[found]
+    longitude = coords["lon"].to_numpy(dtype=np.float64)[found]
+
+    if cell_km is None:
+        cells_per_axis = max(1, int(np.sqrt(len(latitude) / (8 * np.pi))))
+        cell_size = 2.0 / cells_per_axis
+    else:
+        cell_size = get_chord(cell_km)
+        cells_per_axis = max(1, int(np.ceil(2.0 / cell_size)))
+
+    xyz = get_unit_vectors(latitude, longitude)
+    keys = get_cell_keys(get_cells(xyz, cell_size, cells_per_axis), cells_per_axis)
+    order = np.argsort(keys, kind="stable")
+
+    return {"station": coords["station"].to_numpy()[found][order], "latitude": latitude[order],
+            "longitude": longitude[order], "xyz": xyz[order], "keys": keys[order], "cell_size": cell_size,
+            "cells_per_axis": cells_per_axis}
+
+def query_radius(index, latitude, longitude, radius_km):
+    """
+    Finds the stations within a distance of every query point.
+    Args:
+        index (dict): station index from build_station_index
+        latitude (float or NumPy array): latitudes of the query points (degrees)
+        longitude (float or NumPy array): longitudes of the query points (degrees)
+        radius_km (float or NumPy array): search radius, one for all points or one per point
+
+    Returns: data frame with query (position of the query point), station and distance (km) columns, sorted by
+        query and then by distance
+    """
+    if not isinstance(index, dict):
+        return math.nan
+
+    latitude, longitude = np.atleast_1d(latitude, longitude)
+    radius_km = np.broadcast_to(np.asarray(radius_km, dtype=np.float64), latitude.shape)
+    points = get_unit_vectors(latitude, longitude)
+
+    found = []
+    for q in range(len(points)):
+        reach = int(np.ceil(get_chord(radius_km[q]) / index["cell_size"]))
+        candidates = get_candidates(index, points[q], reach)
+        distance = haversine(latitude[q], longitude[q], index["latitude"][candidates],
+                             index["longitude"][candidates])
+        inside = distance <= radius_km[q]
+        found.append((q, candidates[inside], distance[inside]))
+
+    return get_query_frame(index, found)
+
+def query_nearest(index, latitude, longitude, k = 1):
+    """
+    Finds the k nearest stations of every query point.
+    Args:
+        index (dict): station index from build_station_index
+        latitude (float or NumPy array): latitudes of the query points (degrees)
+        longitude (float or NumPy array): longitudes of the query points (degrees)
+        k (int): number of stations to find per point. Default is 1
+
+    Returns: data frame with query (position of the query point), station and distance (km) columns, sorted by
+        query and then by distance (k rows per query, or all stations if there are fewer)
+    """
+    if not isinstance(index, dict) or not isinstance(k, int) or k < 1:
+        return math.nan
+
+    latitude, longitude = np.atleast_1d(latitude, longitude)
+    points = get_unit_vectors(latitude, longitude)
+    cell_size = index["cell_size"]
+    k = min(k, len(index["keys"]))
+    if k == 0:
+        return get_query_frame(index, [])
+
+    found = []
+    for q in range(len(points)):
+        #Grow the searched block of cubes until it holds k stations, then make sure it reaches as far as the k-th
+        # one: every station closer than that is then in the block
+        reach = 0
+        while True:
+            candidates = get_candidates(index, points[q], reach)
+            if len(candidates) >= k:
+                chord = np.linalg.norm(index["xyz"][candidates] - points[q], axis=1)
+                nearest = np.argpartition(chord, k - 1)[:k] if k < len(chord) else np.arange(len(chord))
+                kth = chord[nearest].max()
+                if kth <= reach * cell_size or reach >= index["cells_per_axis"]:
+                    break
+                reach = max(reach + 1, int(np.ceil(kth / cell_size)))
+            else:
+                reach = 2 * reach + 1
+
+        candidates = candidates[nearest]
+        distance = haversine(latitude[q], longitude[q], index["latitude"][candidates],
+                             index["longitude"][candidates])
+        found.append((q, candidates, distance))
+
+    return get_query_frame(index, found)
+
+def get_candidates(index, point, reach):
+    """
+    Helper method that gives the stations in the cubes within reach cubes of the cube of a point, in every
+    direction. The cubes along the last axis are next to each other in the sorted keys, so every column of cubes
+    is one slice found with a binary search.
+    Args:
+        index (dict): station index from build_station_index
+        point (NumPy array): point on the unit sphere
+        reach (int): number of cubes to look at in every direction
+
+    Returns: NumPy array of positions of the stations in the index
+    """
+    m = index["cells_per_axis"]
+    if reach >= m:
+        return np.arange(len(index["keys"]))
+
+    cell = get_cells(point[None, :], index["cell_size"], m)[0]
+    lo = np.maximum(cell - reach, 0)
+    hi = np.minimum(cell + reach, m - 1)
+    ix, iy = np.meshgrid(np.arange(lo[0], hi[0] + 1), np.arange(lo[1], hi[1] + 1), indexing="ij")
+    column = (ix.ravel() * m + iy.ravel()) * m
+    starts = np.searchsorted(index["keys"], column + lo[2], side="left")
+    stops = np.searchsorted(index["keys"], column + hi[2], side="right")
+
+    counts = stops - starts
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+def get_query_frame(index, found):
+    """
+    Helper method that puts the stations found for every query point into one data frame, sorted by query and
+    then by distance.
+    Args:
+        index (dict): station index from build_station_index
+        found (list): tuples of (query position, station positions in the index, distances)
+
+    Returns: data frame with query, station and distance columns
+    """
+    query = np.concatenate([np.full(len(c), q, dtype=np.int64) for q, c, _ in found] + [np.zeros(0, np.int64)])
+    candidates = np.concatenate([c for _, c, _ in found] + [np.zeros(0, np.int64)])
+    distance = np.concatenate([d for _, _, d in found] + [np.zeros(0)])
+
+    order = np.lexsort((candidates, distance, query))
+    return pd.DataFrame({"query": query[order], "station": index["station"][candidates[order]],
+                         "distance": distance[order]})
+
+def get_unit_vectors(latitude, longitude):
+    """
+    Helper method that turns latitudes and longitudes (degrees) into points on the unit sphere
+    """
+    lat = np.radians(latitude)
+    lon = np.radians(longitude)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+def get_cells(xyz, cell_size, cells_per_axis):
+    """
+    Helper method that gives the grid cube (one index per axis) of points on the unit sphere
+    """
+    return np.clip(np.floor((xyz + 1.0) / cell_size).astype(np.int64), 0, cells_per_axis - 1)
+
+def get_cell_keys(cells, cells_per_axis):
+    """
+    Helper method that numbers grid cubes so that the cubes along the last axis are next to each other
+    """
+    return (cells[:, 0] * cells_per_axis + cells[:, 1]) * cells_per_axis + cells[:, 2]
+
+def get_chord(distance_km):
+    """
+    Helper method that turns a distance on the Earth into the straight-line distance between two points on the
+    unit sphere
+    """
+    return 2.0 * np.sin(np.minimum(np.asarray(distance_km, dtype=np.float64) / EARTH_RADIUS_KM, np.pi) / 2.0)
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Computes the great-circle distance between points with the haversine formula.
+    Args:
+        lat1, lon1 (float or NumPy array): first points (degrees)
+        lat2, lon2 (float or NumPy array): second points (degrees)
+
+    Returns: distances in km
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
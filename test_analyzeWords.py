@@ -1,18 +1,20 @@
 from unittest import TestCase
 from unittest import main
 
-import shelve
+import math
 import pandas as pd
 import glob
 import os
+import tempfile
 
-from analyzeWords import analyzeWords
+from analyzeWords import analyzeWords, analyzeWordsStream, analyzeWordsParallel, init_word_state, update_word_state, \
+    merge_word_state, get_word_stats, build_word_state, save_word_state, load_word_state
+from fixtureStore import load_fixture
 
 class Test_analyzeWords(TestCase):
     def setUp(self):
         # setup for all tests
-        with shelve.open('expected_results') as expected_results:
-            self.exp = expected_results['analyzeWords']
+        self.exp = load_fixture('analyzeWords')
 
         self.words = pd.read_csv("words.csv")['x']
         self.act = analyzeWords(self.words)
@@ -57,5 +59,92 @@ class Test_analyzeWords(TestCase):
         self.assertTrue(self.exp['words_6plus'].equals(self.act['words_6plus']))
 
 
+class Test_analyzeWords_small(TestCase):
+    def setUp(self):
+        # small Series whose profile can be checked by hand; the index is not in order on purpose
+        self.words = pd.Series(['book', 'apple', 'zoo', 'banana', 'oboe', 'Bottle', 'a'],
+                               index=[10, 4, 7, 1, 3, 8, 2], name='x')
+        self.act = analyzeWords(self.words)
+
+    def test_letter_counts(self):
+        self.assertEqual(26, len(self.act['letter_counts']))
+        self.assertEqual(2, self.act['letter_counts']['a'])
+        self.assertEqual(2, self.act['letter_counts']['b'])
+        self.assertEqual(1, self.act['letter_counts']['z'])
+        self.assertEqual(0, self.act['letter_counts']['c'])
+
+    def test_sizes(self):
+        self.assertEqual(6, self.act['max_char'])
+        self.assertEqual({1: 1, 3: 1, 4: 2, 5: 1, 6: 2}, self.act['size_counts'])
+
+    def test_oo_words(self):
+        self.assertEqual(2, self.act['oo_count'])
+        self.assertTrue(self.words.loc[[10, 7]].equals(self.act['oo_words']))
+
+    def test_6plus_words(self):
+        self.assertEqual(2, self.act['words_6plus_count'])
+        self.assertTrue(self.words.loc[[1, 8]].equals(self.act['words_6plus']))
+
+    def test_not_series(self):
+        self.assertTrue(math.isnan(analyzeWords(['book'])))
+
+
+class Test_analyzeWordsStream(TestCase):
+    def setUp(self):
+        # the streamed profile has to match the profile of the whole Series
+        self.words = pd.read_csv("words.csv")['x']
+        self.exp = analyzeWords(self.words)
+
+    def check_same(self, act):
+        for k in ['letter_counts', 'max_char', 'size_counts', 'oo_count', 'words_6plus_count']:
+            with self.subTest(field=k):
+                self.assertEqual(self.exp[k], act[k])
+        self.assertTrue(self.exp['oo_words'].equals(act['oo_words']))
+        self.assertTrue(self.exp['words_6plus'].equals(act['words_6plus']))
+
+    def test_file(self):
+        self.check_same(analyzeWordsStream("words.csv", chunksize=1000))
+
+    def test_chunks(self):
+        chunks = (self.words.iloc[i:i + 777] for i in range(0, len(self.words), 777))
+        self.check_same(analyzeWordsStream(chunks))
+
+    def test_spill(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.check_same(analyzeWordsStream("words.csv", chunksize=1000, spill_dir=tmp))
+            self.assertEqual([], os.listdir(tmp))
+
+    def test_max_words(self):
+        act = analyzeWordsStream("words.csv", chunksize=1000, max_words=5)
+        self.assertEqual(self.exp['oo_count'], act['oo_count'])
+        self.assertTrue(self.exp['oo_words'].iloc[:5].equals(act['oo_words']))
+        self.assertTrue(self.exp['words_6plus'].iloc[:5].equals(act['words_6plus']))
+
+    def test_merge(self):
+        # states of shards merge in order to the profile of the whole Series
+        states = []
+        for shard in [self.words.iloc[:300], self.words.iloc[300:301], self.words.iloc[301:]]:
+            states.append(update_word_state(init_word_state(), shard))
+        state = merge_word_state(states[0], merge_word_state(states[1], states[2]))
+        self.check_same(get_word_stats(state))
+
+    def test_parallel(self):
+        self.check_same(analyzeWordsParallel(self.words, workers=2, shards=5))
+        self.check_same(analyzeWordsParallel(self.words, workers=1, shards=3))
+
+    def test_save_load(self):
+        # a saved partial result can be merged in a later run
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'words.state')
+            save_word_state(build_word_state(self.words.iloc[:400]), filename)
+            state = merge_word_state(load_word_state(filename), build_word_state(self.words.iloc[400:]))
+        self.check_same(get_word_stats(state))
+
+    def test_bad_source(self):
+        self.assertTrue(math.isnan(analyzeWordsStream("words.txt")))
+        self.assertTrue(math.isnan(analyzeWordsStream(self.words)))
+        self.assertTrue(math.isnan(analyzeWordsParallel(list(self.words))))
+
+
 if __name__ == '__main__':
     rslt = main(verbosity=2, exit=False)
@@ -1,11 +1,17 @@
 from unittest import TestCase
 from unittest import main
 
-import shelve
 import glob
+import json
 import os
+import tempfile
+import shutil
+import numpy as np
+import pandas as pd
 
-from combineSamples import combineSamples
+from combineSamples import combineSamples, MANIFEST_NAME
+from frameCompare import assert_frame_close
+from fixtureStore import load_fixture
 
 
 class Test_combineSamples(TestCase):
@@ -16,12 +22,11 @@ class Test_combineSamples(TestCase):
         self.pathnames = glob.glob("./" + self.pattern, recursive=False)
         self.files = [os.path.basename(f) for f in self.pathnames if os.path.isfile(f)]
         
-        with shelve.open('expected_results') as expected_results:
-            self.exp = expected_results['combineSamples']
-            self.exp_default = expected_results['combineSamples.default']
+        self.exp = load_fixture('combineSamples')
+        self.exp_default = load_fixture('combineSamples.default')
 
-            # call bbanalyze with default file
-            self.act = combineSamples(self.pattern)
+        # call bbanalyze with default file
+        self.act = combineSamples(self.pattern)
 
 
         self.shape = self.exp['samples'].shape
@@ -100,16 +105,82 @@ class Test_combineSamples(TestCase):
         # verify sample fields one at a time, limiting precision to 5 decimal places
 
         for k in ['samples', 'control', 'test']:
-            exp = self.exp_default[k]
-            nrow, ncol = exp.shape
-            idx = exp.index
-            colnames = exp
+            with self.subTest(dataframe=k):
+                assert_frame_close(self.exp_default[k], actual[k], atol=0.000005)
 
-            for i in exp.index:
-                for j in exp.keys():
-                    with self.subTest(dataframe=k, sample=exp.loc[i, 'sample'], column=j):
-                        self.assertAlmostEqual(exp.loc[i, j], actual[k].loc[i,j], places=5)
 
+class Test_combineSamples_read(TestCase):
+    def setUp(self):
+        self.pattern = "boiler_sample_*.csv"
+        self.pathnames = glob.glob("./" + self.pattern, recursive=False)
+
+    def test_same_as_read_csv(self):
+        # the fast reader gives the same data frame as reading every file with pandas
+        exp = pd.concat([pd.read_csv(f, index_col=0) for f in self.pathnames], ignore_index=True)
+        exp.insert(0, 'sample', np.arange(1, len(self.pathnames) + 1))
+
+        actual = combineSamples(self.pattern, workers=4)
+        self.assertTrue(exp.equals(actual['samples']))
+        self.assertTrue(exp.iloc[:10].equals(actual['control']))
+        self.assertTrue(exp.iloc[10:].equals(actual['test']))
+
+    def test_other_layout(self):
+        # files the fast reader does not handle (missing values) are read with pandas
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'a1.csv'), 'w') as f:
+                f.write('"","t1","t2"\n"1",1.5,2\n')
+            with open(os.path.join(tmp, 'a2.csv'), 'w') as f:
+                f.write('"","t1","t2"\n"1",NA,4\n')
+            actual = combineSamples('a*.csv', tmp, control_samples=1)
+
+        self.assertEqual((2, 3), actual['samples'].shape)
+        self.assertEqual([1, 2], actual['samples']['sample'].tolist())
+        self.assertEqual(1.5, actual['control'].loc[0, 't1'])
+        self.assertTrue(np.isnan(actual['test'].loc[1, 't1']))
+
+    def test_manifest(self):
+        # later calls use the manifest, but see changed, new and deleted files
+        with tempfile.TemporaryDirectory() as tmp:
+            for f in self.pathnames:
+                shutil.copy(f, tmp)
+            first = combineSamples(self.pattern, tmp)
+            self.assertTrue(os.path.isfile(os.path.join(tmp, MANIFEST_NAME)))
+            self.assertTrue(first['samples'].equals(combineSamples(self.pattern, tmp)['samples']))
+
+            with open(os.path.join(tmp, 'boiler_sample_03.csv'), 'w') as f:
+                f.write('"","t1","t2","t3","t4","t5","t6","t7","t8"\n"1",1,2,3,4,5,6,7,8\n')
+            shutil.copy(self.pathnames[0], os.path.join(tmp, 'boiler_sample_99.csv'))
+            os.remove(os.path.join(tmp, 'boiler_sample_05.csv'))
+
+            cached = combineSamples(self.pattern, tmp)
+            fresh = combineSamples(self.pattern, tmp, cache=False)
+
+        self.assertEqual(fresh['filenames'], cached['filenames'])
+        self.assertTrue(fresh['samples'].equals(cached['samples']))
+        self.assertIn(8, cached['samples']['t8'].tolist())
+
+    def test_same_name_in_subfolders(self):
+        # files with the same name in different subfolders are not mixed up, with or without the manifest
+        with tempfile.TemporaryDirectory() as tmp:
+            for folder, value in [('a', 1), ('b', 2)]:
+                os.mkdir(os.path.join(tmp, folder))
+                with open(os.path.join(tmp, folder, 's.csv'), 'w') as f:
+                    f.write(f'"","t1","t2"\n"1",{value},{value}\n')
+            for cache in [False, True, True]:
+                actual = combineSamples('*/s.csv', tmp, control_samples=1, cache=cache)
+                self.assertEqual([1, 2], sorted(actual['samples']['t1'].tolist()))
+            with open(os.path.join(tmp, MANIFEST_NAME)) as f:
+                self.assertEqual(sorted([os.path.join('a', 's.csv'), os.path.join('b', 's.csv')]),
+                                 sorted(json.load(f)['files']))
+
+    def test_no_files(self):
+        actual = combineSamples("no_such_sample_*.csv")
+        self.assertEqual(0, actual['files'])
+        self.assertEqual(0, len(actual['samples']))
+
+    def test_bad_arguments(self):
+        self.assertTrue(np.isnan(combineSamples(5)))
+        self.assertTrue(np.isnan(combineSamples(self.pattern, control_samples=-1)))
 
 
 if __name__ == '__main__':
@@ -1,18 +1,19 @@
 from unittest import TestCase
 from unittest import main
 
-import shelve
+import math
 import pandas as pd
 import glob
 import os
 
 from extractCoordinates import extractCoordinates
+from frameCompare import assert_frame_close
+from fixtureStore import load_fixture
 
 class Test_extractCoordinates(TestCase):
     def setUp(self):
         # setup for all tests
-        with shelve.open('expected_results') as expected_results:
-            self.exp = expected_results['extractCoordinates']
+        self.exp = load_fixture('extractCoordinates')
 
         self.dat = pd.read_csv("coordinates.csv")
         self.act = extractCoordinates(self.dat)
@@ -43,13 +44,37 @@ class Test_extractCoordinates(TestCase):
         self.assertTrue(self.exp.equals(self.act))
 
         # verify sample fields one at a time, limiting precision to 5 decimal places
-        nrow, ncol = self.exp.shape
+        assert_frame_close(self.exp, self.act, atol=0.000005)
 
-        for i in self.exp.index:
-            for j in self.exp.keys()[1:]:
-                with self.subTest(station=self.exp.loc[i, 'station'], col=j):
-                    self.assertAlmostEqual(self.exp.loc[i, j], self.act.loc[i,j], places=5)
 
+class Test_extractCoordinates_parse(TestCase):
+    def setUp(self):
+        self.dat = pd.read_csv("coordinates.csv")
+
+    def test_same_as_float(self):
+        # every coordinate is parsed to the same float as Python's float()
+        act = extractCoordinates(self.dat)
+
+        self.assertEqual(['station', 'lat', 'lon'], act.columns.tolist())
+        pairs = [text.strip('()').split(',') for text in self.dat['coordinates']]
+        exp = pd.DataFrame({'station': self.dat['station'], 'lat': [float(lat) for lat, _ in pairs],
+                            'lon': [float(lon) for _, lon in pairs]})
+        assert_frame_close(exp, act, atol=0.0)
+        self.assertEqual(0, act.attrs['parse.failures'])
+
+    def test_malformed(self):
+        # malformed entries become NaN and are counted; odd but valid entries are still parsed
+        coords = ['(1.5, -2)', ' ( -0.25 ,3. ) ', '(1e2, 5)', '(1, 2', '1, 2', '(a, 2)', '(1 2, 3)', None, '']
+        dat = pd.DataFrame({'station': range(1, len(coords) + 1), 'coordinates': coords})
+        act = extractCoordinates(dat)
+
+        self.assertEqual([1.5, -0.25, 100.0], act['lat'].iloc[:3].tolist())
+        self.assertEqual([-2.0, 3.0, 5.0], act['lon'].iloc[:3].tolist())
+        self.assertTrue(act['lat'].iloc[3:].isna().all())
+        self.assertEqual(6, act.attrs['parse.failures'])
+
+    def test_not_dataframe(self):
+        self.assertTrue(math.isnan(extractCoordinates(self.dat['coordinates'])))
 
 
 if __name__ == '__main__':
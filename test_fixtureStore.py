@@ -0,0 +1,93 @@
+from unittest import TestCase
+from unittest import main
+
+import math
+import os
+import shelve
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+from fixtureStore import save_fixtures, load_fixture, fixture_keys, convertShelve
+
+class Test_fixtureStore(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'fixtures')
+        self.frame = pd.DataFrame({'year': [2004, 2005, 2005], 'avg': [0.25, math.nan, math.inf],
+                                   'id': ['a', None, 'c'], 'hr': pd.array([1, None, 3], dtype='Int64'),
+                                   'lg': pd.Categorical(['AL', 'NL', 'AL'])}, index=[7, 8, 9])
+        self.frame.attrs['parse.failures'] = 1
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        # frames, Series, arrays and the dicts, lists and scalars holding them come back the same
+        objects = {'frame': self.frame, 'nested': {'bb': self.frame.iloc[:2], 2005: [np.int64(3), 2.5, None, 'x']},
+                   'series': self.frame['avg'], 'array': np.arange(6).reshape(2, 3)}
+        self.assertEqual(list(objects), save_fixtures(objects, self.path))
+        self.assertEqual(list(objects), fixture_keys(self.path))
+
+        act = load_fixture('frame', self.path)
+        self.assertTrue(self.frame.equals(act))
+        self.assertEqual(self.frame.dtypes.tolist(), act.dtypes.tolist())
+        self.assertEqual({'parse.failures': 1}, act.attrs)
+
+        nested = load_fixture('nested', self.path)
+        self.assertTrue(self.frame.iloc[:2].equals(nested['bb']))
+        self.assertEqual([3, 2.5, None, 'x'], nested[2005])
+        self.assertIsInstance(nested[2005][0], np.int64)
+        self.assertTrue(self.frame['avg'].equals(load_fixture('series', self.path)))
+        self.assertTrue(np.array_equal(objects['array'], load_fixture('array', self.path)))
+
+        with self.assertRaises(KeyError):
+            load_fixture('missing', self.path)
+
+    def test_changes_stay_local(self):
+        # changing a loaded object changes neither the store nor the next load
+        save_fixtures({'frame': self.frame}, self.path)
+        act = load_fixture('frame', self.path)
+        act.loc[7, 'year'] = 1900
+        act['avg'] = 0.0
+        self.assertTrue(self.frame.equals(load_fixture('frame', self.path)))
+
+        # saving again replaces the store, and the next load sees the new objects
+        save_fixtures({'frame': self.frame.iloc[:1]}, self.path)
+        self.assertEqual(1, len(load_fixture('frame', self.path)))
+        self.assertEqual(['fixtures'], os.listdir(self.tmpdir))
+
+    def test_convert_shelve(self):
+        shelf = os.path.join(self.tmpdir, 'expected')
+        with shelve.open(shelf) as db:
+            db['frame'] = self.frame
+            db['counts'] = {'letter_counts': pd.Series([1, 2], index=['a', 'b']), 'max_char': 2}
+            db['other'] = object()
+
+        rslt = convertShelve(shelf, self.path)
+        self.assertEqual(['frame', 'counts'], rslt['converted'])
+        self.assertEqual(['other'], list(rslt['failed']))
+        self.assertTrue(self.frame.equals(load_fixture('frame', self.path)))
+        self.assertEqual(2, load_fixture('counts', self.path)['max_char'])
+        self.assertTrue(math.isnan(convertShelve(None, self.path)))
+
+    def test_convert_shelve_checks_shapes(self):
+        # an entry saved under the wrong key is stored under the key whose shape it has, or left out
+        shelf = os.path.join(self.tmpdir, 'expected')
+        coords = pd.DataFrame({'station': [1, 2], 'lat': [0.5, 1.5], 'lon': [2.5, 3.5]})
+        with shelve.open(shelf) as db:
+            db['bbanalyze'] = coords
+            db['reformatSamples'] = self.frame
+
+        rslt = convertShelve(shelf, self.path)
+        self.assertEqual(['extractCoordinates'], rslt['converted'])
+        self.assertEqual({'bbanalyze': 'extractCoordinates'}, rslt['renamed'])
+        self.assertEqual(['reformatSamples'], list(rslt['failed']))
+        self.assertTrue(coords.equals(load_fixture('extractCoordinates', self.path)))
+        with self.assertRaises(KeyError):
+            load_fixture('bbanalyze', self.path)
+
+
+if __name__ == '__main__':
+    main(verbosity=2)
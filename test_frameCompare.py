@@ -0,0 +1,75 @@
+from unittest import TestCase
+from unittest import main
+
+import math
+import numpy as np
+import pandas as pd
+
+from frameCompare import assert_frame_close, assert_series_close, get_mismatches, compSeries, compDataFrame
+
+class Test_frameCompare(TestCase):
+    def setUp(self):
+        self.exp = pd.DataFrame({'sample': [1, 2, 3, 4], 'x': [0.5, math.nan, math.inf, -math.inf],
+                                 'name': ['a', None, 'c', 'd']}, index=[10, 11, 12, 13])
+
+    def test_equal(self):
+        # NaN matches NaN, inf matches inf of the same sign, and numbers match within the tolerance
+        act = self.exp.copy()
+        act['x'] = [0.500001, math.nan, math.inf, -math.inf]
+        assert_frame_close(self.exp, act)
+        assert_series_close(self.exp['x'], act['x'])
+        self.assertTrue(compDataFrame(self.exp, act))
+        self.assertTrue(compSeries(self.exp['name'], act['name']))
+
+    def test_mismatches(self):
+        # only the first mismatching cells are described, with their labels
+        act = self.exp.copy()
+        act['x'] = [0.6, 1.0, -math.inf, -math.inf]
+        act.loc[13, 'name'] = 'z'
+        count, cells = get_mismatches(self.exp, act, limit=2)
+        self.assertEqual(4, count)
+        self.assertEqual([(10, 'x', 0.5, 0.6), (11, 'x')], [c[:4] if c[0] == 10 else c[:2] for c in cells])
+
+        with self.assertRaisesRegex(AssertionError, r"4 of 12 cells differ(.|\n)*\[10, 'x'\]: 0.5 != 0.6"):
+            assert_frame_close(self.exp, act, limit=2)
+        self.assertFalse(compDataFrame(self.exp, act))
+
+    def test_structure(self):
+        # shape, labels and names are checked before the values
+        with self.assertRaisesRegex(AssertionError, 'shapes differ'):
+            assert_frame_close(self.exp, self.exp.iloc[1:])
+        with self.assertRaisesRegex(AssertionError, 'index differ at 1 positions: 13 != 14'):
+            assert_frame_close(self.exp, self.exp.set_axis([10, 11, 12, 14]))
+        with self.assertRaisesRegex(AssertionError, 'names differ'):
+            assert_series_close(self.exp['x'], self.exp['x'].rename('y'))
+        self.assertFalse(compSeries(self.exp['x'], self.exp['x'].rename('y')))
+        self.assertIsNone(compDataFrame(self.exp, self.exp['x']))
+
+    def test_exact_columns(self):
+        # columns that are not floats must keep their dtype and values for compSeries and compDataFrame
+        act = self.exp.copy()
+        act['sample'] = act['sample'].astype('float64')
+        assert_frame_close(self.exp, act)
+        self.assertFalse(compDataFrame(self.exp, act))
+        self.assertFalse(compSeries(self.exp['sample'], act['sample']))
+        with self.assertRaisesRegex(AssertionError, "dtypes differ: 'sample': int64 != float64"):
+            assert_frame_close(self.exp, act, check_dtype=True)
+
+        big = pd.Series([2 ** 60, 1], name='n')
+        self.assertFalse(compSeries(big, big + [1, 0]))
+        self.assertTrue(compSeries(big, big.copy()))
+        self.assertTrue(compSeries(self.exp['x'].astype('float32'), self.exp['x']))
+
+    def test_large(self):
+        # a whole frame is compared at once
+        rng = np.random.default_rng(0)
+        exp = pd.DataFrame(rng.normal(size=(200000, 5)))
+        act = exp + 1e-7
+        assert_frame_close(exp, act)
+        act.iloc[123456, 3] += 1
+        count, cells = get_mismatches(exp, act)
+        self.assertEqual((1, 123456, 3), (count, cells[0][0], cells[0][1]))
+
+
+if __name__ == '__main__':
+    main(verbosity=2)
@@ -1,19 +1,22 @@
 from unittest import TestCase
 from unittest import main
 
-import shelve
 import pandas as pd
 import numpy as np
 import glob
 import os
 
-from reformatSamples import reformatSamples
+import tempfile
+
+from frameCompare import assert_frame_close
+from reformatSamples import reformatSamples, reformatSamplesStream, iter_sample_rows, build_ragged_samples, \
+    get_sample_stats
+from fixtureStore import load_fixture
 
 class Test_reformatSamples(TestCase):
     def setUp(self):
         # setup for all tests
-        with shelve.open('expected_results') as expected_results:
-            self.exp = expected_results['reformatSamples']
+        self.exp = load_fixture('reformatSamples')
 
         self.dat = pd.read_csv("pistonrings.csv")
         rslt = reformatSamples(self.dat)
@@ -50,14 +53,90 @@ class Test_reformatSamples(TestCase):
         # this test superceded due to floating point accuracy errors
         # self.assertTrue(self.exp.equals(self.act))
 
-        nrow, ncol = self.exp.shape
+        # verify sample fields, limiting precision to 5 decimal places
+        assert_frame_close(self.exp, self.act, atol=0.000005)
+
+
+class Test_reformatSamples_small(TestCase):
+    def setUp(self):
+        # three samples of two observations, checked by hand
+        self.dat = pd.DataFrame({'diameter': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0], 'sample': [1, 1, 2, 2, 3, 3]})
+        self.exp = pd.DataFrame({'sample': [1, 2, 3], 'obs.1': [1.0, 3.0, 5.0], 'obs.2': [2.0, 4.0, 6.0]},
+                                index=range(1, 4))
+
+    def test_good_samples(self):
+        self.assertTrue(self.exp.equals(reformatSamples(self.dat)))
+
+    def test_unsorted_samples(self):
+        # observations keep their order within a sample when the rows are not sorted by sample
+        unsorted = self.dat.iloc[[4, 0, 2, 5, 1, 3]]
+        self.assertTrue(self.exp.equals(reformatSamples(unsorted)))
+
+    def test_bad_samples(self):
+        self.assertIsNone(reformatSamples(self.dat.iloc[:-1]))
+
+    def test_result_is_a_copy(self):
+        # changing the result must not change the samples
+        act = reformatSamples(self.dat)
+        act.iloc[0, 1] = 0.0
+        self.assertEqual(1.0, self.dat['diameter'].iloc[0])
 
-        # verify sample fields one at a time, limiting precision to 5 decimal places
-        for i in range(nrow):
-            for j in range(ncol):
-                with self.subTest(sample=self.exp.iloc[i, 0]):
-                    self.assertAlmostEqual(self.exp.iloc[i, j], self.act.iloc[i,j], places=5)
+    def test_ragged(self):
+        # sample 2 is short: it is padded with NaN and its count is 1
+        ragged = self.dat.drop(index=3)
+        act = reformatSamples(ragged, ragged=True)
 
+        self.assertEqual(['sample', 'obs.1', 'obs.2', 'count'], act.columns.tolist())
+        self.assertEqual([2, 1, 2], act['count'].tolist())
+        self.assertEqual([3.0], act.loc[2, ['obs.1']].tolist())
+        self.assertTrue(np.isnan(act.loc[2, 'obs.2']))
+
+    def test_sample_stats(self):
+        stats = get_sample_stats(build_ragged_samples(self.dat.drop(index=3)))
+
+        self.assertEqual([1.5, 3.0, 5.5], stats['mean'].tolist())
+        self.assertEqual([1.0, 0.0, 1.0], stats['range'].tolist())
+        self.assertAlmostEqual(np.sqrt(0.5), stats.loc[1, 'std'])
+        self.assertTrue(np.isnan(stats.loc[2, 'std']))
+
+    def test_not_dataframe(self):
+        self.assertTrue(np.isnan(reformatSamples(self.dat.to_numpy())))
+
+
+class Test_reformatSamplesStream(TestCase):
+    def setUp(self):
+        # the streamed rows have to match reformatSamples on the whole log
+        self.dat = pd.read_csv("pistonrings.csv")
+        self.exp = reformatSamples(self.dat)
+
+    def test_writer(self):
+        rows = []
+        rslt = reformatSamplesStream("pistonrings.csv", rows.append, chunksize=7)
+        self.assertEqual({'sample.count': 40, 'bad.samples': {}}, rslt)
+        self.assertTrue(self.exp.equals(pd.concat(rows)))
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'wide.csv')
+            reformatSamplesStream("pistonrings.csv", filename, num_obs=5, chunksize=13)
+            act = pd.read_csv(filename, index_col=0)
+        self.assertTrue(np.array_equal(self.exp.to_numpy(), act.to_numpy()))
+        self.assertTrue(self.exp.columns.equals(act.columns))
+
+    def test_bad_samples(self):
+        # sample 3 misses an observation, sample 1 gets one more later, and sample 99 is never complete
+        bad = pd.concat([self.dat.drop(index=12), self.dat.iloc[[0]], self.dat.iloc[-3:].assign(sample=99)])
+        chunks = [bad.iloc[i:i + 10] for i in range(0, len(bad), 10)]
+        bad_samples = {}
+        act = pd.concat(list(iter_sample_rows(chunks, bad_samples=bad_samples)))
+
+        self.assertEqual({1: 6, 3: 4, 99: 3}, bad_samples)
+        self.assertEqual(39, len(act))
+        self.assertNotIn(3, act['sample'].tolist())
+
+    def test_bad_source(self):
+        self.assertTrue(np.isnan(reformatSamplesStream(5, [].append)))
+        self.assertTrue(np.isnan(reformatSamplesStream(self.dat, 5)))
 
 
 if __name__ == '__main__':
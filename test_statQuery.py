@@ -0,0 +1,75 @@
+from unittest import TestCase
+from unittest import main
+
+import math
+import numpy as np
+
+from bbanalyze import get_dat_subset, read_bb_csv
+from statQuery import init_stat_query, get_subset, get_mask
+
+class Test_statQuery(TestCase):
+    def setUp(self):
+        self.dat = read_bb_csv("baseball.csv")
+        self.query = init_stat_query(self.dat)
+
+    def test_same_as_query(self):
+        # every predicate gives the same rows as the df.query string it replaces, on both dtype layouts
+        cases = [('lg', '"NL"', '=='), ('lg', '"AL"', '!='), ('ab', '50', '>='), ('year', '2005', '=='),
+                 ('hr', '10', '<'), ('team', '"NYA"', '=='), ('sb', '0', '>'), ('team', '"XXX"', '==')]
+        for compact in [False, True]:
+            dat = read_bb_csv("baseball.csv", compact=compact)
+            query = init_stat_query(dat)
+            for col, val, com in cases:
+                with self.subTest(compact=compact, predicate=(col, com, val)):
+                    exp = dat.query(f'{col} {com} {val}')
+                    self.assertTrue(exp.equals(get_dat_subset(dat, col, val, com)))
+                    self.assertTrue(exp.equals(get_dat_subset(query, col, val, com)))
+
+    def test_joined(self):
+        exp = self.dat.query('lg in ["AL", "NL"] and (year >= 2000 or hr > 40) and not team == "NYA"')
+        act = get_subset(self.query, [('lg', 'in', ['AL', 'NL']), ('or', [('year', '>=', 2000), ('hr', '>', 40)]),
+                                      ('not', ('team', '==', 'NYA'))])
+        self.assertTrue(exp.equals(act))
+        self.assertTrue(self.dat.query('team not in ["NYA", "BOS"]').equals(
+            get_subset(self.query, ('team', 'not in', ['NYA', 'BOS']))))
+
+    def test_cached_masks(self):
+        # a comparison is only built once; the cached mask cannot be changed
+        mask = get_mask(self.query, ('year', '==', 2005))
+        self.assertIs(mask, get_mask(self.query, ('year', '==', 2005)))
+        get_subset(self.query, [('year', '==', 2005), ('lg', '==', 'NL')])
+        self.assertEqual((2, 2), (self.query['hits'], self.query['misses']))
+        with self.assertRaises(ValueError):
+            mask[0] = True
+
+    def test_mask_budget(self):
+        # only max_bytes of masks are kept, dropping the one used least recently
+        query = init_stat_query(self.dat, max_bytes=2 * len(self.dat))
+        first = get_mask(query, ('year', '==', 2004))
+        get_mask(query, ('year', '==', 2005))
+        self.assertIs(first, get_mask(query, ('year', '==', 2004)))
+        get_mask(query, ('year', '==', 2006))
+        self.assertEqual([('year', '==', 2004), ('year', '==', 2006)], list(query['masks']))
+        self.assertEqual(2 * len(self.dat), query['mask_bytes'])
+
+        query = init_stat_query(self.dat, max_bytes=0)
+        self.assertTrue(self.dat.query('year == 2005').equals(get_subset(query, ('year', '==', 2005))))
+        self.assertEqual({}, query['masks'])
+        self.assertTrue(math.isnan(init_stat_query(self.dat, max_bytes=-1)))
+
+    def test_slice(self):
+        # rows next to each other come back as a slice of the data, not a copy
+        dat = self.dat.sort_values('year', kind='stable')
+        act = get_subset(dat, ('year', '==', 2005))
+        self.assertTrue(np.shares_memory(dat['ab'].to_numpy(), act['ab'].to_numpy()))
+        self.assertTrue(dat.query('year == 2005').equals(act))
+
+    def test_bad_predicate(self):
+        self.assertTrue(math.isnan(get_subset(self.query, ('nope', '==', 1))))
+        self.assertTrue(math.isnan(get_subset(self.query, ('lg', '~', 'NL'))))
+        self.assertTrue(math.isnan(get_subset(self.query, ('lg', 'in', 'NL'))))
+        self.assertTrue(math.isnan(get_dat_subset(self.dat, 'lg', 'NL', None)))
+
+
+if __name__ == '__main__':
+    main(verbosity=2)
@@ -0,0 +1,65 @@
+from unittest import TestCase
+from unittest import main
+
+import math
+import numpy as np
+import pandas as pd
+
+from extractCoordinates import extractCoordinates
+from stationIndex import build_station_index, query_radius, query_nearest, haversine
+
+class Test_stationIndex(TestCase):
+    def setUp(self):
+        # random stations all over the globe, a few of them without coordinates
+        rng = np.random.default_rng(1)
+        n = 5000
+        self.lat = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+        self.lon = rng.uniform(-180, 180, n)
+        self.lat[:3] = np.nan
+        self.coords = pd.DataFrame({'station': np.arange(1, n + 1), 'lat': self.lat, 'lon': self.lon})
+        self.index = build_station_index(self.coords)
+
+        # query points include the poles and the date line
+        self.qlat = np.concatenate([[90.0, -90.0, 0.0], rng.uniform(-80, 80, 20)])
+        self.qlon = np.concatenate([[0.0, 0.0, 180.0], rng.uniform(-180, 180, 20)])
+
+    def brute_force(self, q):
+        # distances from a query point to every station with coordinates, by station
+        found = ~np.isnan(self.lat)
+        dist = haversine(self.qlat[q], self.qlon[q], self.lat[found], self.lon[found])
+        return pd.Series(dist, index=self.coords['station'][found]).sort_values(kind='stable')
+
+    def test_nearest(self):
+        act = query_nearest(self.index, self.qlat, self.qlon, k=5)
+        self.assertEqual(5 * len(self.qlat), len(act))
+
+        for q in range(len(self.qlat)):
+            with self.subTest(query=q):
+                exp = self.brute_force(q).iloc[:5]
+                self.assertTrue(np.allclose(exp.to_numpy(), act.loc[act['query'] == q, 'distance'].to_numpy()))
+
+    def test_radius(self):
+        act = query_radius(self.index, self.qlat, self.qlon, 300.0)
+
+        for q in range(len(self.qlat)):
+            with self.subTest(query=q):
+                exp = self.brute_force(q)
+                exp = exp[exp <= 300.0]
+                self.assertEqual(exp.index.tolist(), act.loc[act['query'] == q, 'station'].tolist())
+
+    def test_stations_file(self):
+        # the index is built straight from extractCoordinates
+        index = build_station_index(extractCoordinates(pd.read_csv("coordinates.csv")))
+        act = query_nearest(index, -21.2, -113.8, k=2)
+
+        self.assertEqual([1, 2], act['station'].tolist())
+        self.assertAlmostEqual(0.0, act['distance'].iloc[0])
+        self.assertEqual(24, len(query_nearest(index, 0.0, 0.0, k=100)))
+
+    def test_bad_arguments(self):
+        self.assertTrue(math.isnan(build_station_index(self.lat)))
+        self.assertTrue(math.isnan(query_nearest(self.index, 0.0, 0.0, k=0)))
+
+
+if __name__ == '__main__':
+    rslt = main(verbosity=2, exit=False)
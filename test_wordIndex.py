@@ -0,0 +1,78 @@
+from unittest import TestCase
+from unittest import main
+
+import math
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+from analyzeWords import analyzeWords
+from wordIndex import build_word_index, count_prefix, get_prefix_words, get_length_counts, get_words_by_length, \
+    find_substring, save_word_index, load_word_index
+
+class Test_wordIndex(TestCase):
+    def setUp(self):
+        # the index is not in order on purpose, and one word is missing
+        self.words = pd.Series(['book', 'apple', 'zoo', None, 'banana', 'oboe', 'Bottle', 'a', 'cookbook'],
+                               index=[10, 4, 7, 6, 1, 3, 8, 2, 5], name='x')
+        self.index = build_word_index(self.words)
+
+    def test_analyze_index(self):
+        # profiling the index gives the same result as profiling the Series
+        exp = analyzeWords(self.words)
+        act = analyzeWords(self.index)
+
+        for k in ['letter_counts', 'max_char', 'size_counts', 'oo_count', 'words_6plus_count']:
+            with self.subTest(field=k):
+                self.assertEqual(exp[k], act[k])
+        self.assertTrue(exp['oo_words'].equals(act['oo_words']))
+        self.assertTrue(exp['words_6plus'].equals(act['words_6plus']))
+
+    def test_analyze_mixed_types(self):
+        # words that are not text are read the same way by the index and by analyzeWords
+        words = pd.Series([1, 22, 'foo', None, 'zoology', 3.5, 'b\u00e9ton'], dtype=object)
+        exp = analyzeWords(words)
+        act = analyzeWords(build_word_index(words))
+
+        for k in ['letter_counts', 'max_char', 'size_counts', 'oo_count', 'words_6plus_count']:
+            with self.subTest(field=k):
+                self.assertEqual(exp[k], act[k])
+        self.assertTrue(exp['oo_words'].equals(act['oo_words']))
+        self.assertTrue(exp['words_6plus'].equals(act['words_6plus']))
+        self.assertEqual(1, count_prefix(build_word_index(words), '2'))
+
+    def test_prefix(self):
+        self.assertEqual(2, count_prefix(self.index, 'b'))
+        self.assertEqual(1, count_prefix(self.index, 'boo'))
+        self.assertEqual(0, count_prefix(self.index, 'q'))
+        self.assertEqual(8, count_prefix(self.index, ''))
+        self.assertTrue(self.words.loc[[10, 1]].equals(get_prefix_words(self.index, 'b')))
+
+    def test_lengths(self):
+        self.assertEqual({1: 1, 3: 1, 4: 2, 5: 1, 6: 2, 8: 1}, get_length_counts(self.index))
+        self.assertTrue(self.words.loc[[10, 3]].equals(get_words_by_length(self.index, 4, 4)))
+
+    def test_substring(self):
+        # every kind of query matches a scan of the Series
+        for substring in ['', 'o', 'oo', 'ook', 'book', 'an', 'xyz']:
+            with self.subTest(substring=substring):
+                exp = np.flatnonzero(self.words.str.contains(substring, regex=False).fillna(False).to_numpy())
+                self.assertTrue(np.array_equal(exp, find_substring(self.index, substring)))
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'words.idx')
+            save_word_index(self.index, filename)
+            index = load_word_index(filename)
+
+        self.assertEqual(3, count_prefix(index, 'b') + count_prefix(index, 'c'))
+        self.assertTrue(analyzeWords(self.index)['oo_words'].equals(analyzeWords(index)['oo_words']))
+
+    def test_not_series(self):
+        self.assertTrue(math.isnan(build_word_index(['book'])))
+        self.assertTrue(math.isnan(count_prefix(self.index, 1)))
+
+
+if __name__ == '__main__':
+    rslt = main(verbosity=2, exit=False)
@@ -0,0 +1,254 @@
+import bisect
+import math
+import pickle
+
+import numpy as np
+import pandas as pd
+
+def build_word_index(words):
+    """
+    Builds a prefix index over a Pandas Series of words, so that repeated queries (counts by prefix, counts by
+    length, words containing a substring) do not have to scan the whole Series again. Everything is kept in
+    NumPy arrays:
+        - the words in sorted order, as one UTF-8 byte buffer plus offsets (a compact sorted trie; prefix
+          queries are binary searches)
+        - the original positions of the words grouped by length, plus offsets per length
+        - posting lists (original positions) for every single byte and every pair of adjacent bytes, used to
+          find the words containing a substring without looking at the other words
+    Missing words are left out of the index.
+
+    Args:
+        words (Pandas Series): Series of words to index
+
+    Returns: dictionary containing the index
+    """
+    if not isinstance(words, pd.Series):
+        return math.nan
+
+    present = np.flatnonzero(words.notna().to_numpy())
+    values = words.to_numpy(dtype=object)[present]
+
+    #Sort the words once, as UTF-8 bytes (which keep the order of the characters) held in an object array, so
+    # the sort does not pad every word to the longest one
+    encoded = np.empty(len(values), dtype=object)
+    encoded[:] = [encode_word(value) for value in values]
+    order = np.argsort(encoded, kind="stable")
+    encoded = encoded[order]
+    byte_lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(byte_lengths, out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    #rank[i] is the place in the sorted buffer of the i-th word of the Series
+    positions = present[order]
+    rank = np.empty(len(words), dtype=np.int64)
+    rank[positions] = np.arange(len(positions))
+
+    char_lengths = np.fromiter((len(str(values[i])) for i in order), dtype=np.int64, count=len(order))
+    by_length = np.lexsort((positions, char_lengths))
+    length_offsets = np.zeros((char_lengths.max() + 2) if len(char_lengths) > 0 else 1, dtype=np.int64)
+    np.cumsum(np.bincount(char_lengths, minlength=len(length_offsets) - 1), out=length_offsets[1:])
+
+    #Posting lists: byte positions are turned into (gram, word) pairs and sorted by gram, then by position
+    word_of_byte = np.repeat(np.arange(len(encoded)), byte_lengths)
+    same_word = word_of_byte[:-1] == word_of_byte[1:]
+    unigrams = (data.astype(np.int64), word_of_byte)
+    bigrams = (data[:-1][same_word].astype(np.int64) * 256 + data[1:][same_word], word_of_byte[:-1][same_word])
+
+    index = {"name": words.name, "dtype": words.dtype, "labels": words.index, "size": len(words),
+             "data": data, "offsets": offsets, "positions": positions, "rank": rank,
+             "by_length": positions[by_length], "length_offsets": length_offsets}
+    for key, (grams, word) in [("unigram", unigrams), ("bigram", bigrams)]:
+        index[key] = get_postings(grams, positions[word], len(words))
+
+    return index
+
+def encode_word(value):
+    """
+    Helper method that gives the UTF-8 bytes of a word. Words that are not text (like numbers in an object
+    Series) are written out with str first, and lone surrogates are kept, the same as analyzeWords reads them.
+    """
+    return str(value).encode("utf-8", errors="surrogatepass")
+
+def get_postings(grams, positions, size):
+    """
+    Helper method that groups word positions by gram into a compressed (CSR) posting list.
+    Args:
+        grams (NumPy array): gram code of every occurrence
+        positions (NumPy array): original position of the word of every occurrence
+        size (int): number of words in the Series (positions are below it)
+
+    Returns: tuple of (sorted distinct gram codes, offsets into the word array, word positions)
+    """
+    #Pack each (gram, position) pair into one integer so a single 1-D unique sorts and dedupes them
+    pairs = np.unique(grams * max(size, 1) + positions)
+    pair_grams = pairs // max(size, 1)
+    keys, starts = np.unique(pair_grams, return_index=True)
+    offsets = np.append(starts, len(pairs)).astype(np.int64)
+
+    return (keys, offsets, pairs - pair_grams * max(size, 1))
+
+def get_word_bytes(index, i):
+    """
+    Helper method that gives the i-th word of the sorted buffer as bytes
+    """
+    return index["data"][index["offsets"][i]:index["offsets"][i + 1]].tobytes()
+
+def get_prefix_range(index, prefix):
+    """
+    Helper method that finds the range of the sorted buffer holding the words that start with a prefix, using
+    two binary searches.
+    Args:
+        index (dict): word index from build_word_index
+        prefix (str): prefix to look for
+
+    Returns: tuple of (first, last + 1) place in the sorted buffer
+    """
+    key = encode_word(prefix)
+    count = len(index["positions"])
+    start = bisect.bisect_left(range(count), key, key=lambda i: get_word_bytes(index, i)[:len(key)])
+    stop = bisect.bisect_right(range(count), key, lo=start, key=lambda i: get_word_bytes(index, i)[:len(key)])
+
+    return (start, stop)
+
+def count_prefix(index, prefix):
+    """
+    Counts the words that start with a prefix.
+    Args:
+        index (dict): word index from build_word_index
+        prefix (str): prefix to look for
+
+    Returns: number of words
+    """
+    if not isinstance(index, dict) or not isinstance(prefix, str):
+        return math.nan
+
+    start, stop = get_prefix_range(index, prefix)
+    return stop - start
+
+def get_prefix_words(index, prefix):
+    """
+    Gets the words that start with a prefix.
+    Args:
+        index (dict): word index from build_word_index
+        prefix (str): prefix to look for
+
+    Returns: Series of words, with their original index and in their original order
+    """
+    if not isinstance(index, dict) or not isinstance(prefix, str):
+        return math.nan
+
+    start, stop = get_prefix_range(index, prefix)
+    return get_words(index, index["positions"][start:stop])
+
+def get_length_counts(index):
+    """
+    Counts the words of every length.
+    Args:
+        index (dict): word index from build_word_index
+
+    Returns: dictionary of number of words keyed by length, for the lengths that have words
+    """
+    if not isinstance(index, dict):
+        return math.nan
+
+    counts = np.diff(index["length_offsets"])
+    return {int(size): int(counts[size]) for size in np.flatnonzero(counts)}
+
+def get_words_by_length(index, min_len, max_len = None):
+    """
+    Gets the words with a length between min_len and max_len (inclusive).
+    Args:
+        index (dict): word index from build_word_index
+        min_len (int): shortest length
+        max_len (int): longest length. Default is None (no limit)
+
+    Returns: Series of words, with their original index and in their original order
+    """
+    if not isinstance(index, dict) or not isinstance(min_len, int):
+        return math.nan
+
+    bounds = index["length_offsets"]
+    last = len(bounds) - 1
+    start = bounds[min(max(min_len, 0), last)]
+    stop = bounds[last if max_len is None else min(max(max_len + 1, 0), last)]
+
+    return get_words(index, index["by_length"][start:max(start, stop)])
+
+def find_substring(index, substring):
+    """
+    Finds the words that contain a substring. Only the words in the posting list of the rarest byte pair of
+    the substring are looked at.
+    Args:
+        index (dict): word index from build_word_index
+        substring (str): substring to look for
+
+    Returns: NumPy array of the original positions of the words, in order
+    """
+    if not isinstance(index, dict) or not isinstance(substring, str):
+        return math.nan
+
+    key = encode_word(substring)
+    if len(key) == 0:
+        return np.sort(index["positions"])
+
+    if len(key) == 1:
+        candidates = get_posting(index["unigram"], key[0])
+    else:
+        codes = [key[i] * 256 + key[i + 1] for i in range(len(key) - 1)]
+        candidates = min((get_posting(index["bigram"], code) for code in codes), key=len)
+
+    if len(key) <= 2:
+        return candidates
+
+    found = [pos for pos in candidates if key in get_word_bytes(index, index["rank"][pos])]
+    return np.array(found, dtype=np.int64)
+
+def get_posting(postings, code):
+    """
+    Helper method that gives the posting list of one gram code (empty if the gram is not in any word)
+    """
+    keys, offsets, words = postings
+    i = np.searchsorted(keys, code)
+    if i == len(keys) or keys[i] != code:
+        return words[0:0]
+
+    return words[offsets[i]:offsets[i + 1]]
+
+def get_words(index, positions):
+    """
+    Helper method that turns original positions into a Series of words with their original index labels.
+    Args:
+        index (dict): word index from build_word_index
+        positions (NumPy array): original positions of the words
+
+    Returns: Series of words in their original order
+    """
+    positions = np.sort(positions)
+    ranks = index["rank"][positions]
+    values = [get_word_bytes(index, i).decode("utf-8") for i in ranks]
+
+    return pd.Series(values, index=index["labels"][positions], name=index["name"], dtype=index["dtype"])
+
+def save_word_index(index, filename):
+    """
+    Saves a word index to a file so that it can be reused.
+    Args:
+        index (dict): word index from build_word_index
+        filename (str): name of the file to write
+
+    Returns: None
+    """
+    with open(filename, "wb") as f:
+        pickle.dump(index, f)
+
+def load_word_index(filename):
+    """
+    Loads a word index saved by save_word_index.
+    Args:
+        filename (str): name of the file to read
+
+    Returns: the word index
+    """
+    with open(filename, "rb") as f:
+        return pickle.load(f)